@@ -65,6 +65,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'users.context_processors.inbox',
             ],
         },
     },
@@ -80,6 +81,11 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # File-backed test database: threaded tests (concurrent bookings)
+        # need real per-connection locking, not shared-cache memory.
+        'TEST': {
+            'NAME': BASE_DIR / 'test_db.sqlite3',
+        },
     }
 }
 
@@ -134,3 +140,36 @@ STATIC_ROOT=os.path.join(BASE_DIR,'assets')
 MEDIA_URL='/media/'
 MEDIA_ROOT=os.path.join(BASE_DIR,'media')
 
+
+# Response caches and their version counters (users/cache_versions.py) must
+# be shared by every worker process, or a change seen by one process never
+# invalidates what the others cached. Set REDIS_URL wherever more than one
+# process serves requests; the per-process LocMemCache is only correct for
+# runserver and the tests.
+REDIS_URL = os.environ.get('REDIS_URL')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+
+# Number of days ahead (including today) kept in the precomputed slot inventory
+SLOT_INVENTORY_DAYS = 30
+
+# How long a slot picked on the booking form stays reserved for the patient
+SLOT_HOLD_SECONDS = 300
+
+# Rendered medical history PDFs (users/medical_pdf.py); keep out of MEDIA_ROOT
+MEDICAL_PDF_CACHE_DIR = os.path.join(BASE_DIR, 'pdf_cache')
+
+# Medical history PDF backend: 'xhtml2pdf' (the HTML template) or 'reportlab'
+MEDICAL_PDF_RENDERER = 'xhtml2pdf'
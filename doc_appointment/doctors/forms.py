@@ -2,6 +2,24 @@ from django import forms
 from django.contrib.auth.forms import UserCreationForm
 from users.models import User, DoctorProfile
 
+class SlotSettingsForm(forms.ModelForm):
+    """
+    Appointment length and break of a doctor, within the model's bounds.
+    An empty break means none.
+    """
+
+    class Meta:
+        model = DoctorProfile
+        fields = ['slot_minutes', 'buffer_minutes']
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['buffer_minutes'].required = False
+
+    def clean_buffer_minutes(self):
+        return self.cleaned_data['buffer_minutes'] or 0
+
+
 class DoctorRegistrationForm(UserCreationForm):
     first_name = forms.CharField(max_length=50, required=True)
     email = forms.EmailField(required=True)
@@ -1,3 +1,248 @@
-from django.test import TestCase
+import os
+import tempfile
+from datetime import date, time, timedelta
+from io import BytesIO, StringIO
 
-# Create your tests here.
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+
+from users.availability import merge_intervals
+from users import doctor_photos
+from users.cache_versions import get_version
+from users.doctor_photos import VARIANT_WIDTHS
+from users.models import Appointment, DoctorProfile, PatientProfile, TimeSlot, User
+
+
+class MergeIntervalsTests(TestCase):
+
+    def test_overlapping_and_touching_windows_merge(self):
+        self.assertEqual(
+            merge_intervals([
+                (time(11), time(13)),
+                (time(9), time(12)),
+                (time(13), time(14)),
+                (time(16), time(17)),
+            ]),
+            [(time(9), time(14)), (time(16), time(17))]
+        )
+
+    def test_contained_window_is_absorbed(self):
+        self.assertEqual(
+            merge_intervals([(time(9), time(17)), (time(10), time(11))]),
+            [(time(9), time(17))]
+        )
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class DoctorAvailabilityTests(TestCase):
+
+    def setUp(self):
+        user = User.objects.create_user('doc', password='pass', role='doctor')
+        self.doctor = DoctorProfile.objects.create(user=user, is_approved=True)
+        self.client.login(username='doc', password='pass')
+
+    def add(self, days, start_time, end_time):
+        return self.client.post(reverse('doctor_availability'), {
+            'days_of_week': days,
+            'start_time': start_time,
+            'end_time': end_time,
+        })
+
+    def windows(self, day):
+        return list(
+            TimeSlot.objects.filter(doctor=self.doctor, day_of_week=day)
+            .order_by('start_time')
+            .values_list('start_time', 'end_time')
+        )
+
+    def test_overlapping_window_is_merged(self):
+        self.add(['mon', 'tue'], '09:00', '12:00')
+        self.add(['mon'], '11:00', '13:00')
+
+        self.assertEqual(self.windows('mon'), [(time(9), time(13))])
+        self.assertEqual(self.windows('tue'), [(time(9), time(12))])
+
+    def test_covered_window_changes_nothing(self):
+        self.add(['wed'], '09:00', '12:00')
+        self.add(['wed'], '10:00', '11:00')
+
+        self.assertEqual(self.windows('wed'), [(time(9), time(12))])
+
+    def test_existing_duplicates_collapse(self):
+        for _ in range(2):
+            TimeSlot.objects.create(
+                doctor=self.doctor, day_of_week='fri', start_time=time(9), end_time=time(10)
+            )
+
+        self.add(['fri'], '14:00', '15:00')
+
+        self.assertEqual(
+            self.windows('fri'),
+            [(time(9), time(10)), (time(14), time(15))]
+        )
+
+
+class DoctorAppointmentsTests(TestCase):
+
+    def setUp(self):
+        user = User.objects.create_user('doc', role='doctor')
+        self.doctor = DoctorProfile.objects.create(user=user, is_approved=True)
+        self.patient = PatientProfile.objects.create(
+            user=User.objects.create_user('pat', role='patient', first_name='Pat'),
+            date_of_birth=date(1990, 1, 1),
+            gender='other'
+        )
+        self.client.force_login(user)
+
+        today = date.today()
+        for offset in (-3, -1, 2, 5):
+            Appointment.objects.create(
+                doctor=self.doctor,
+                patient=self.patient,
+                appointment_date=today + timedelta(days=offset),
+                appointment_time=time(10, 0),
+                status='completed' if offset < 0 else 'pending'
+            )
+
+    def test_page_lists_upcoming_soonest_first_and_defers_past(self):
+        response = self.client.get(reverse('doctor_appointments'))
+
+        upcoming = [a.appointment_date for a in response.context['upcoming_appointments']]
+        self.assertEqual(upcoming, sorted(upcoming))
+        self.assertEqual(len(upcoming), 2)
+        self.assertIsNone(response.context['past_appointments'])
+
+    def test_past_page_without_javascript(self):
+        response = self.client.get(reverse('doctor_appointments'), {'past': 1})
+
+        past = [a.appointment_date for a in response.context['past_appointments']]
+        self.assertEqual(past, sorted(past, reverse=True))
+        self.assertEqual(len(past), 2)
+
+    def test_past_json_endpoint_applies_filters(self):
+        url = reverse('doctor_past_appointments')
+
+        data = self.client.get(url).json()
+        self.assertEqual(len(data['appointments']), 2)
+        self.assertIsNone(data['next_cursor'])
+        self.assertEqual(data['appointments'][0]['patient'], 'Pat')
+
+        filtered = self.client.get(url, {'status': 'pending'}).json()
+        self.assertEqual(filtered['appointments'], [])
+
+
+class EditDoctorProfileTests(TestCase):
+
+    def setUp(self):
+        user = User.objects.create_user('doc', role='doctor')
+        self.doctor = DoctorProfile.objects.create(user=user, is_approved=True)
+        self.client.force_login(user)
+
+    def post(self, **slot_settings):
+        return self.client.post(reverse('edit_doctor_profile'), {
+            'specialization': 'ent',
+            'qualification': 'MBBS',
+            'bio': '',
+            **slot_settings,
+        })
+
+    def test_slot_settings_are_saved(self):
+        self.assertRedirects(self.post(slot_minutes=45, buffer_minutes=''), reverse('doctor_profile'))
+
+        self.doctor.refresh_from_db()
+        self.assertEqual((self.doctor.slot_minutes, self.doctor.buffer_minutes), (45, 0))
+
+    def test_invalid_slot_settings_are_reported(self):
+        response = self.post(slot_minutes=300, buffer_minutes='ten')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'is-invalid', count=2)
+        self.doctor.refresh_from_db()
+        self.assertEqual(
+            (self.doctor.specialization, self.doctor.slot_minutes, self.doctor.buffer_minutes),
+            ('general', 30, 0)
+        )
+
+
+class DoctorPhotoTests(TestCase):
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        self.media = media.name
+
+        user = User.objects.create_user('doc', role='doctor')
+        self.doctor = DoctorProfile.objects.create(user=user, is_approved=True)
+        self.client.force_login(user)
+
+    def upload(self, name='ada.png'):
+        out = BytesIO()
+        Image.new('RGBA', (1200, 900), (10, 108, 93, 128)).save(out, 'PNG')
+        return SimpleUploadedFile(name, out.getvalue(), content_type='image/png')
+
+    def variant_files(self):
+        return sorted(os.listdir(os.path.join(self.media, 'doctor_pics')))
+
+    def post_picture(self, name='ada.png'):
+        return self.client.post(reverse('edit_doctor_profile'), {
+            'specialization': 'general',
+            'qualification': 'MBBS',
+            'bio': '',
+            'slot_minutes': 30,
+            'profile_picture': self.upload(name),
+        })
+
+    def test_upload_makes_variants_and_srcset(self):
+        self.post_picture()
+
+        self.assertEqual(len(self.variant_files()), 1 + 2 * len(VARIANT_WIDTHS))
+        with Image.open(os.path.join(self.media, 'doctor_pics', 'ada.320w.webp')) as variant:
+            self.assertEqual(variant.size, (320, 240))
+
+        page = self.client.get(reverse('doctor_profile'))
+        self.assertContains(page, 'doctor_pics/ada.640w.webp 640w')
+        self.assertContains(page, 'src="/media/doctor_pics/ada.320w.jpg"')
+
+    def test_replacing_picture_deletes_old_variants(self):
+        self.post_picture('ada.png')
+        self.post_picture('bob.png')
+
+        files = self.variant_files()
+        self.assertEqual(len(files), 2 + 2 * len(VARIANT_WIDTHS))
+        self.assertIn('ada.png', files)
+        self.assertFalse([name for name in files if name.startswith('ada.') and name != 'ada.png'])
+
+    def test_listing_version_is_bumped_after_variants_exist(self):
+        seen = []
+        make_variants = doctor_photos.make_variants
+
+        def recording_make_variants(field_file, force=False):
+            written = make_variants(field_file, force)
+            seen.append(get_version('specialization', 'general'))
+            return written
+
+        doctor_photos.make_variants = recording_make_variants
+        try:
+            self.post_picture('ada.png')
+        finally:
+            doctor_photos.make_variants = make_variants
+
+        self.assertEqual(len(seen), 1)
+        self.assertGreater(get_version('specialization', 'general'), seen[0])
+
+    def test_backfill_command(self):
+        self.doctor.profile_picture = self.upload('old.png')
+        self.doctor.save()
+        self.assertNotContains(self.client.get(reverse('doctor_profile')), 'srcset')
+
+        out = StringIO()
+        call_command('make_doctor_photo_variants', workers=2, stdout=out)
+        call_command('make_doctor_photo_variants', stdout=out)
+
+        self.assertIn('Generated variants for 1 of 1 picture(s) (6 file(s))', out.getvalue())
+        self.assertIn('Generated variants for 0 of 1 picture(s)', out.getvalue())
+        self.assertContains(self.client.get(reverse('doctor_profile')), 'srcset')
@@ -9,6 +9,7 @@ urlpatterns = [
     
 
     path('doctor_appointments/',views.doctor_appointments,name="doctor_appointments"),
+    path('doctor_appointments/past/',views.doctor_past_appointments,name="doctor_past_appointments"),
 
     path('medical_history/<int:patient_id>/', views.view_medical_history, name='view_medical_history'),
     path('doctors/add_medical_history/<int:patient_id>/<int:appointment_id>/', views.add_medical_history,name='add_medical_history'),
@@ -29,6 +30,8 @@ urlpatterns = [
     path('availability/delete-multiple/',views.bulk_delete_time_slots,name='bulk_delete_time_slots'),
     
     path('messages/', views.doctor_messages, name='doctor_messages'),
+    path('messages/<int:thread_id>/', views.doctor_message_thread, name='doctor_message_thread'),
+    path('events/', views.doctor_events, name='doctor_events'),
     path('messages/reply/<int:message_id>/', views.doctor_reply_admin, name='doctor_reply_admin'),
     path('contact_admin/', views.contact_admin, name='contact_admin'),
 
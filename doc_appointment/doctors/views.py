@@ -1,13 +1,17 @@
 from django.shortcuts import render, redirect, get_object_or_404
+from django.http import Http404, JsonResponse
+from django.urls import reverse
 from django.core.mail import send_mail
 from django.conf import settings
 from users.models import User, DoctorProfile, DoctorMessage, TimeSlot, MedicalHistory, PatientProfile
-from .forms import DoctorRegistrationForm, MedicalHistoryForm
+from .forms import DoctorRegistrationForm, MedicalHistoryForm, SlotSettingsForm
 import datetime
 from users.models import Appointment, TimeSlot
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.db.models import Case, When, IntegerField
+from users.availability import apply_weekly_template
+from users.pagination import APPOINTMENT_ORDERING, THREAD_ORDERING, UPCOMING_ORDERING, paginate_keyset
 
 
 
@@ -16,26 +20,20 @@ from django.db.models import Case, When, IntegerField
 
 @login_required
 def doctor_today(request):
-    doctor_profile = get_object_or_404(DoctorProfile, user=request.user)
+    doctor_profile = get_object_or_404(DoctorProfile.objects.select_related('user'), user=request.user)
     today = datetime.date.today()
 
      # Today's appointments excluding cancelled
     appointments = Appointment.objects.filter(
         doctor=doctor_profile,
         appointment_date=today
-    ).exclude(status='cancelled').order_by('appointment_time')
-
-    # Count of unread messages from admin
-    unread_messages_count = DoctorMessage.objects.filter(
-        doctor=doctor_profile,
-        sender__isnull=True,  # messages coming from admin
-        is_read=False
-    ).count()
+    ).exclude(status='cancelled').select_related('patient__user').order_by('appointment_time')
 
+    # Unread messages come from the `inbox` context processor
     context = {
         'doctor': doctor_profile,
         'appointments': appointments,
-        'unread_messages_count': unread_messages_count,
+        'today': today,
         'page': 'today'
     }
     return render(request, 'doctors/doctor_today.html', context)
@@ -43,19 +41,18 @@ def doctor_today(request):
 
 
 
-@login_required
-def doctor_appointments(request):
-    doctor_profile = get_object_or_404(DoctorProfile, user=request.user)
-    today = datetime.date.today()
-
+def _filtered_appointments(doctor_profile, params):
+    """
+    The doctor's appointments narrowed by the listing filters in `params`.
+    """
     appointments = Appointment.objects.filter(
         doctor=doctor_profile
-    ).order_by('-appointment_date', '-appointment_time')
+    ).select_related('patient__user')
 
     # ---- Filters ----
-    status = request.GET.get('status')
-    from_date = request.GET.get('from_date')
-    to_date = request.GET.get('to_date')
+    status = params.get('status')
+    from_date = params.get('from_date')
+    to_date = params.get('to_date')
 
     if status:
         appointments = appointments.filter(status=status)
@@ -66,15 +63,74 @@ def doctor_appointments(request):
     if to_date:
         appointments = appointments.filter(appointment_date__lte=to_date)
 
+    return appointments
+
+
+@login_required
+def doctor_appointments(request):
+    doctor_profile = get_object_or_404(DoctorProfile, user=request.user)
+    today = datetime.date.today()
+    appointments = _filtered_appointments(doctor_profile, request.GET)
+
+    # Upcoming and past are separate pages with their own cursors; past is
+    # only queried on request (the template loads it lazily otherwise)
+    upcoming_appointments = paginate_keyset(
+        appointments.filter(appointment_date__gte=today),
+        UPCOMING_ORDERING,
+        request.GET,
+        param='upcoming_after'
+    )
+
+    past_appointments = None
+    if request.GET.get('past') or request.GET.get('past_after'):
+        past_appointments = paginate_keyset(
+            appointments.filter(appointment_date__lt=today),
+            APPOINTMENT_ORDERING,
+            request.GET,
+            param='past_after'
+        )
+
     context = {
         'doctor': doctor_profile,
-        'appointments': appointments,
+        'upcoming_appointments': upcoming_appointments,
+        'past_appointments': past_appointments,
         'today': today,
         'page': 'all'
     }
     return render(request, 'doctors/doctor_appointments.html', context)
 
 
+# AJAX view for the past appointments tab, one page per request
+@login_required
+def doctor_past_appointments(request):
+    doctor_profile = get_object_or_404(DoctorProfile, user=request.user)
+
+    past_appointments = paginate_keyset(
+        _filtered_appointments(doctor_profile, request.GET).filter(
+            appointment_date__lt=datetime.date.today()
+        ),
+        APPOINTMENT_ORDERING,
+        request.GET
+    )
+
+    appointments_list = [
+        {
+            'id': appointment.id,
+            'date': appointment.appointment_date.isoformat(),
+            'time': appointment.appointment_time.strftime("%H:%M"),
+            'patient': appointment.patient.user.get_full_name(),
+            'status': appointment.status,
+            'status_display': appointment.status.title(),
+            'history_url': reverse('appointment_history', args=[appointment.id]),
+        }
+        for appointment in past_appointments
+    ]
+    return JsonResponse({
+        'appointments': appointments_list,
+        'next_cursor': past_appointments.next_cursor,
+    })
+
+
 @login_required
 def appointment_history(request, appointment_id):
     doctor = get_object_or_404(DoctorProfile, user=request.user)
@@ -151,6 +207,7 @@ def doctor_availability(request):
     # Handle form submission for adding new slots
     if request.method == 'POST':
         days = request.POST.getlist('days_of_week')  # Multiple days
+        days = [day for day in weekday_order if day in days]
         start_time = request.POST.get('start_time')
         end_time = request.POST.get('end_time')
 
@@ -158,37 +215,27 @@ def doctor_availability(request):
             messages.error(request, "All fields are required.")
             return redirect('doctor_availability')
 
-        created_count = 0
-        skipped_count = 0
-
-        for day in days:
-            # Check if this exact slot already exists
-            exists = TimeSlot.objects.filter(
-                doctor=doctor_profile,
-                day_of_week=day,
-                start_time=start_time,
-                end_time=end_time
-            ).exists()
-
-            if exists:
-                skipped_count += 1
-                continue
-
-            # Create the time slot
-            TimeSlot.objects.create(
-                doctor=doctor_profile,
-                day_of_week=day,
-                start_time=start_time,
-                end_time=end_time,
-                is_active=True
-            )
-            created_count += 1
+        try:
+            start_time = datetime.datetime.strptime(start_time, "%H:%M").time()
+            end_time = datetime.datetime.strptime(end_time, "%H:%M").time()
+        except ValueError:
+            messages.error(request, "Invalid start or end time.")
+            return redirect('doctor_availability')
+
+        if start_time >= end_time:
+            messages.error(request, "End time must be after start time.")
+            return redirect('doctor_availability')
+
+        # Merge with the existing windows of each day instead of stacking
+        # overlapping slots; one bulk write for all selected days
+        changed_days = apply_weekly_template(doctor_profile, days, start_time, end_time)
+        skipped_count = len(days) - len(changed_days)
 
         # Feedback messages
-        if created_count:
-            messages.success(request, f"{created_count} time slot(s) added successfully.")
+        if changed_days:
+            messages.success(request, f"Availability updated for {len(changed_days)} day(s).")
         if skipped_count:
-            messages.warning(request, f"{skipped_count} slot(s) already existed and were skipped.")
+            messages.warning(request, f"{skipped_count} day(s) already covered this time and were skipped.")
 
         return redirect('doctor_availability')
 
@@ -217,7 +264,8 @@ def delete_time_slot(request, slot_id):
     return redirect('doctor_availability')
 
 
-from users.models import DoctorProfile, DoctorMessage
+from users.models import DoctorProfile, DoctorMessage, MessageThread
+from users import doctor_photos, events, inbox_counters, message_threads
 from .forms import DoctorReplyForm
 
 @login_required
@@ -228,41 +276,67 @@ def doctor_messages(request):
         messages.error(request, "Doctor profile not found.")
         return redirect('doctor_dashboard')
 
-    # Inbox: messages sent by admin to this doctor
-    inbox_messages = DoctorMessage.objects.filter(
-        doctor=doctor_profile
-    ).exclude(sender=request.user).order_by('-created_at')
-
-    # Sent: messages sent by this doctor
-    sent_messages = DoctorMessage.objects.filter(
-        sender=request.user
-    ).order_by('-created_at')
+    # Conversations with the admins, most recent activity first
+    threads = paginate_keyset(
+        MessageThread.objects.filter(
+            doctor=doctor_profile
+        ).select_related('last_message__sender'),
+        THREAD_ORDERING,
+        request.GET
+    )
 
     context = {
-        'inbox_messages': inbox_messages,
-        'sent_messages': sent_messages,
+        'threads': threads,
     }
     return render(request, 'doctors/doctor_messages.html', context)
 
 
+@login_required
+def doctor_message_thread(request, thread_id):
+    thread = get_object_or_404(MessageThread, id=thread_id, doctor__user=request.user)
+    inbox_counters.mark_thread_read(thread, request.user)
+
+    return render(request, 'doctors/message_thread.html', {
+        'thread': thread,
+        'thread_messages': message_threads.thread_messages(thread),
+        'form': DoctorReplyForm(initial={'subject': f"Re: {thread.subject}"}),
+    })
+
+
+
+@login_required
+async def doctor_events(request):
+    """
+    Server-Sent Events stream of the doctor's new or changed appointments
+    and messages (see users/events.py).
+    """
+    user = await request.auser()
+    doctor_id = await DoctorProfile.objects.filter(user=user).values_list('id', flat=True).afirst()
+    if doctor_id is None:
+        raise Http404("Doctor profile not found.")
+    return events.event_stream_response(request, events.doctor_channel(doctor_id))
+
+
 
 @login_required
 def doctor_reply_admin(request, message_id):
     doctor_profile = get_object_or_404(DoctorProfile, user=request.user)
-    original_msg = get_object_or_404(DoctorMessage, id=message_id)
+    original_msg = get_object_or_404(
+        DoctorMessage.objects.select_related('thread'), id=message_id, doctor=doctor_profile
+    )
 
     if request.method == 'POST':
         form = DoctorReplyForm(request.POST)
         if form.is_valid():
-            DoctorMessage.objects.create(
-                doctor=None,  # admin is recipient
-                sender=request.user,  # doctor sending
-                subject=form.cleaned_data['subject'],
-                message=form.cleaned_data['message'],
-                is_read=False
+            # Doctor sending, admin is recipient, in the same thread
+            reply = message_threads.reply(
+                original_msg,
+                request.user,
+                form.cleaned_data['subject'],
+                form.cleaned_data['message']
             )
             messages.success(request, "Reply sent to admin successfully!")
-            return redirect('doctor_messages')
+            return redirect('doctor_message_thread', thread_id=reply.thread_id)
     else:
         form = DoctorReplyForm(initial={'subject': f"Re: {original_msg.subject}"})
 
@@ -288,14 +362,8 @@ def contact_admin(request):
             messages.error(request, "Both subject and message are required.")
             return redirect('contact_admin')
 
-        # Save message: doctor is sender, admin is recipient
-        DoctorMessage.objects.create(
-            doctor=doctor_profile,  # recipient is the doctor (to link for replies)
-            sender=request.user,     # doctor is sender
-            subject=subject,
-            message=message,
-            is_read=False
-        )
+        # Save message: doctor is sender, admin is recipient, in a new thread
+        message_threads.start_thread(doctor_profile, request.user, subject, message)
 
         messages.success(request, "Message sent to admin successfully!")
         return redirect('doctor_messages')
@@ -318,12 +386,14 @@ def doctor_register(request):
             user.save()
 
             # Create doctor profile with minimal info
-            DoctorProfile.objects.create(
+            profile = DoctorProfile.objects.create(
                 user=user,
                 specialization=form.cleaned_data['specialization'],
                 profile_picture=form.cleaned_data.get('profile_picture'),
                 is_approved=False
             )
+            if form.cleaned_data.get('profile_picture'):
+                doctor_photos.make_variants(profile.profile_picture)
 
             # Optionally show a success page
             return render(request, 'doctors/doctor_register_success.html', {'user': user})
@@ -347,6 +417,7 @@ def edit_doctor_profile(request):
         return redirect('index')
 
     profile = DoctorProfile.objects.get(user=request.user)
+    slot_form = SlotSettingsForm(instance=profile)
 
     if request.method == 'POST':
         profile.specialization = request.POST.get('specialization')
@@ -355,14 +426,28 @@ def edit_doctor_profile(request):
         profile.consultation_fee = request.POST.get('consultation_fee') or None
         profile.bio = request.POST.get('bio')
 
-        if request.FILES.get('profile_picture'):
-            profile.profile_picture = request.FILES.get('profile_picture')
-
-        profile.save()
-        return redirect('doctor_profile')
+        # Slot settings drive slot generation; the form sets them on the
+        # profile and rejects values outside the model bounds
+        slot_form = SlotSettingsForm(request.POST, instance=profile)
+        if slot_form.is_valid():
+            old_picture = profile.profile_picture
+            new_picture = request.FILES.get('profile_picture')
+            if new_picture:
+                # Stored and resized before the profile is saved: the save
+                # bumps the cached listings, which must find the variants
+                profile.profile_picture = new_picture
+                profile.profile_picture.save(new_picture.name, new_picture, save=False)
+                doctor_photos.make_variants(profile.profile_picture)
+
+            profile.save()
+            if new_picture and not DoctorProfile.objects.filter(profile_picture=old_picture.name).exists():
+                # The default picture is shared, so only drop unused variants
+                doctor_photos.delete_variants(old_picture)
+            return redirect('doctor_profile')
 
     return render(request, 'doctors/edit_profile.html', {
         'profile': profile,
+        'slot_form': slot_form,
         'specializations': DoctorProfile.SPECIALIZATION_CHOICES
     })
 
@@ -391,7 +476,7 @@ def mark_appointment_completed(request, appointment_id):
     appointment.status = 'completed'
     appointment.save()
     messages.success(request, f"Appointment with {appointment.patient.user.get_full_name()} marked as completed.")
-    return redirect('doctor_today')
+    return redirect('doctor_dashboard')
 
 
 @login_required
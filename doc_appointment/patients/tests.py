@@ -1,3 +1,692 @@
-from django.test import TestCase
+import os
+import tempfile
+import threading
+import zipfile
+from concurrent.futures import Future
+from datetime import date, time, timedelta
+from io import BytesIO, StringIO
+from time import sleep
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from pypdf import PdfReader
+
+from patients.views import BOOTSTRAP_DAYS, booking_bootstrap
+from users import medical_pdf
+from users.management.commands import export_medical_history_pdfs
+from users.availability import (
+    MAX_RANGE_DAYS, WEEKDAY_CODES, earliest_open_slots, encode_day_bitmap, sweep_expired_holds
+)
+from users.models import (
+    Appointment, DoctorProfile, MedicalHistory, PatientProfile, SlotHold, TimeSlot, User
+)
+
+
+# Password hashing dominates runtime otherwise
+fast_passwords = override_settings(
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher']
+)
+
+
+def make_doctor(username='doctor'):
+    user = User.objects.create_user(username, password='pass', role='doctor', first_name='Doc')
+    return DoctorProfile.objects.create(user=user, is_approved=True)
+
+
+def make_patient(username):
+    user = User.objects.create_user(username, password='pass', role='patient', first_name=username)
+    PatientProfile.objects.create(user=user, date_of_birth=date(1990, 1, 1), gender='other')
+    return user
+
+
+@fast_passwords
+class BookAppointmentTests(TestCase):
+
+    def setUp(self):
+        self.doctor = make_doctor()
+        make_patient('alice')
+        make_patient('bob')
+        self.day = date.today() + timedelta(days=1)
+
+    def book(self, username, appointment_time='10:00'):
+        client = Client()
+        client.login(username=username, password='pass')
+        return client.post(reverse('book_appointments'), {
+            'doctor': self.doctor.id,
+            'appointment_date': self.day.isoformat(),
+            'appointment_time': appointment_time,
+        }, follow=True)
+
+    def test_slot_collision_is_rejected(self):
+        self.book('alice')
+        response = self.book('bob')
+
+        self.assertContains(response, "This time slot is already booked.")
+        self.assertEqual(Appointment.objects.count(), 1)
+
+    def test_second_booking_same_day_is_rejected(self):
+        self.book('alice', '10:00')
+        response = self.book('alice', '11:00')
+
+        self.assertContains(response, "You already have an appointment with this doctor")
+        self.assertEqual(Appointment.objects.count(), 1)
+
+    def test_overlapping_booking_is_rejected(self):
+        self.book('alice', '10:00')
+        self.doctor.slot_minutes = 60
+        self.doctor.save()
+
+        response = self.book('bob', '09:30')
+
+        self.assertContains(response, "This time slot is already booked.")
+        self.assertEqual(Appointment.objects.get().duration_minutes, 30)
+        # Booked before the change, alice's appointment still ends at 10:30
+        self.book('bob', '10:30')
+        self.assertEqual(Appointment.objects.count(), 2)
+
+    def test_cancelled_slot_can_be_rebooked(self):
+        self.book('alice')
+        Appointment.objects.update(status='cancelled')
+
+        self.book('bob')
+
+        self.assertEqual(
+            Appointment.objects.filter(status__in=Appointment.ACTIVE_STATUSES).count(), 1
+        )
+
+
+@fast_passwords
+class ConcurrentBookingTests(TransactionTestCase):
+    """
+    Fire parallel bookings at the same slot: the unique constraint must let
+    exactly one of them through.
+    """
+    PATIENTS = 8
+
+    def setUp(self):
+        self.doctor = make_doctor()
+        self.usernames = [f'patient{i}' for i in range(self.PATIENTS)]
+        for username in self.usernames:
+            make_patient(username)
+        self.day = date.today() + timedelta(days=1)
+
+    def test_parallel_bookings_for_one_slot(self):
+        clients = []
+        for username in self.usernames:
+            client = Client()
+            client.login(username=username, password='pass')
+            clients.append(client)
+
+        barrier = threading.Barrier(self.PATIENTS, timeout=10)
+        errors = []
+
+        def book(client):
+            try:
+                barrier.wait()
+                client.post(reverse('book_appointments'), {
+                    'doctor': self.doctor.id,
+                    'appointment_date': self.day.isoformat(),
+                    'appointment_time': '10:00',
+                })
+            except Exception as exc:  # surfaced in the main thread below
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=book, args=(c,)) for c in clients]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(
+            Appointment.objects.filter(
+                doctor=self.doctor,
+                appointment_date=self.day,
+                appointment_time=time(10, 0),
+            ).count(),
+            1
+        )
+
+
+@fast_passwords
+class SlotHoldTests(TestCase):
+
+    def setUp(self):
+        self.doctor = make_doctor()
+        make_patient('alice')
+        make_patient('bob')
+        self.day = date.today() + timedelta(days=1)
+        TimeSlot.objects.create(
+            doctor=self.doctor,
+            day_of_week=WEEKDAY_CODES[self.day.weekday()],
+            start_time=time(10, 0),
+            end_time=time(11, 0)
+        )
+
+    def client_for(self, username):
+        client = Client()
+        client.login(username=username, password='pass')
+        return client
+
+    def slots(self, client):
+        return client.get(reverse('get_available_slots'), {
+            'doctor_id': self.doctor.id,
+            'date': self.day.isoformat(),
+        }).json()['slots']
+
+    def hold(self, client, appointment_time='10:00'):
+        return client.post(reverse('hold_appointment_slot'), {
+            'doctor_id': self.doctor.id,
+            'date': self.day.isoformat(),
+            'time': appointment_time,
+        })
+
+    def test_held_slot_is_hidden_from_others(self):
+        alice, bob = self.client_for('alice'), self.client_for('bob')
+
+        self.assertEqual(self.hold(alice).status_code, 200)
+
+        self.assertEqual(self.slots(alice), ['10:00', '10:30'])
+        self.assertEqual(self.slots(bob), ['10:30'])
+        self.assertEqual(self.hold(bob).status_code, 409)
+
+    def test_expired_hold_is_released(self):
+        alice, bob = self.client_for('alice'), self.client_for('bob')
+        self.hold(alice)
+        SlotHold.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+
+        self.assertEqual(self.hold(bob).status_code, 200)
+        self.assertEqual(SlotHold.objects.get().user.username, 'bob')
+
+    def test_booking_converts_hold(self):
+        alice = self.client_for('alice')
+        self.hold(alice)
+
+        alice.post(reverse('book_appointments'), {
+            'doctor': self.doctor.id,
+            'appointment_date': self.day.isoformat(),
+            'appointment_time': '10:00',
+        })
+
+        self.assertEqual(Appointment.objects.count(), 1)
+        self.assertFalse(SlotHold.objects.exists())
+
+    def test_sweep_removes_only_expired_holds(self):
+        self.hold(self.client_for('alice'))
+        self.hold(self.client_for('bob'), '10:30')
+        SlotHold.objects.filter(hold_time=time(10, 0)).update(
+            expires_at=timezone.now() - timedelta(seconds=1)
+        )
+
+        self.assertEqual(sweep_expired_holds(), 1)
+        self.assertEqual(SlotHold.objects.count(), 1)
+
+
+@fast_passwords
+class AvailabilityRangeTests(TestCase):
+
+    def setUp(self):
+        self.doctor = make_doctor()
+        make_patient('alice')
+        make_patient('bob')
+        self.day = date.today() + timedelta(days=1)
+        TimeSlot.objects.create(
+            doctor=self.doctor,
+            day_of_week=WEEKDAY_CODES[self.day.weekday()],
+            start_time=time(10, 0),
+            end_time=time(11, 0)
+        )
+        self.client.login(username='alice', password='pass')
+
+    def days(self, start, end):
+        return self.client.get(reverse('get_available_slots_range'), {
+            'doctor_id': self.doctor.id,
+            'from': start.isoformat(),
+            'to': end.isoformat(),
+        }).json()
+
+    def test_bitmap_sets_one_bit_per_free_cell(self):
+        # 48 half-hour cells in 12 hex digits, 09:00 is cell 18
+        self.assertEqual(encode_day_bitmap([9 * 60], 30), '000020000000')
+        self.assertEqual(encode_day_bitmap([], 30), '0' * 12)
+
+    def test_week_of_bitmaps_in_one_request(self):
+        payload = self.days(self.day, self.day + timedelta(days=6))
+
+        self.assertEqual(payload['cell_minutes'], 30)
+        self.assertEqual(len(payload['days']), 7)
+        # 10:00 and 10:30 are cells 20 and 21
+        self.assertEqual(payload['days'][self.day.isoformat()], '00000c000000')
+        self.assertEqual(payload['days'][(self.day + timedelta(days=1)).isoformat()], '0' * 12)
+
+    def test_booked_and_held_slots_are_cleared(self):
+        Appointment.objects.create(
+            doctor=self.doctor,
+            patient=PatientProfile.objects.get(user__username='bob'),
+            appointment_date=self.day,
+            appointment_time=time(10, 0)
+        )
+        bob = Client()
+        bob.login(username='bob', password='pass')
+        bob.post(reverse('hold_appointment_slot'), {
+            'doctor_id': self.doctor.id, 'date': self.day.isoformat(), 'time': '10:30'
+        })
+
+        self.assertEqual(self.days(self.day, self.day)['days'], {self.day.isoformat(): '0' * 12})
+
+    def test_window_is_clamped_to_today_and_capped(self):
+        payload = self.days(date.today() - timedelta(days=5), date.today() + timedelta(days=400))
+
+        self.assertEqual(payload['from'], date.today().isoformat())
+        self.assertEqual(len(payload['days']), MAX_RANGE_DAYS)
+
+
+@fast_passwords
+class FirstAvailableTests(TestCase):
+
+    def setUp(self):
+        self.day = date.today() + timedelta(days=1)
+        self.doctors = [make_doctor(f'doctor{i}') for i in range(3)]
+        # doctor0 from 11:00, doctor1 from 10:00, doctor2 not approved
+        with self.captureOnCommitCallbacks(execute=True):
+            for doctor, start in zip(self.doctors, (11, 10, 9)):
+                doctor.specialization = 'ent'
+                doctor.save()
+                TimeSlot.objects.create(
+                    doctor=doctor,
+                    day_of_week=WEEKDAY_CODES[self.day.weekday()],
+                    start_time=time(start, 0),
+                    end_time=time(start + 1, 0)
+                )
+        DoctorProfile.objects.filter(id=self.doctors[2].id).update(is_approved=False)
+        make_patient('alice')
+        make_patient('bob')
+
+    def soonest(self, limit=3):
+        return [
+            (slot.doctor_id, slot.slot_time)
+            for slot in earliest_open_slots('ent', self.day, self.day, limit)
+        ]
+
+    def test_soonest_slots_across_approved_doctors(self):
+        first, second = self.doctors[:2]
+        self.assertEqual(self.soonest(), [
+            (second.id, time(10, 0)), (second.id, time(10, 30)), (first.id, time(11, 0))
+        ])
+
+    def test_booked_and_held_slots_are_skipped(self):
+        second = self.doctors[1]
+        Appointment.objects.create(
+            doctor=second,
+            patient=PatientProfile.objects.get(user__username='alice'),
+            appointment_date=self.day,
+            appointment_time=time(10, 0)
+        )
+        bob = Client()
+        bob.login(username='bob', password='pass')
+        bob.post(reverse('hold_appointment_slot'), {
+            'doctor_id': second.id, 'date': self.day.isoformat(), 'time': '10:30'
+        })
+
+        self.assertEqual(self.soonest(1), [(self.doctors[0].id, time(11, 0))])
+
+    def test_endpoint(self):
+        client = Client()
+        client.login(username='alice', password='pass')
+        slots = client.get(reverse('get_first_available_slots'), {
+            'specialization': 'ent',
+            'from': self.day.isoformat(),
+            'limit': 2,
+        }).json()['slots']
+
+        self.assertEqual(
+            [(slot['doctor_id'], slot['date'], slot['time']) for slot in slots],
+            [(self.doctors[1].id, self.day.isoformat(), '10:00'),
+             (self.doctors[1].id, self.day.isoformat(), '10:30')]
+        )
+
+
+@fast_passwords
+class ConditionalGetTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.doctor = make_doctor()
+        make_patient('alice')
+        self.client.login(username='alice', password='pass')
+        self.day = date.today() + timedelta(days=1)
+        TimeSlot.objects.create(
+            doctor=self.doctor,
+            day_of_week=WEEKDAY_CODES[self.day.weekday()],
+            start_time=time(10, 0),
+            end_time=time(11, 0)
+        )
+
+    def get_slots(self, **headers):
+        return self.client.get(reverse('get_available_slots'), {
+            'doctor_id': self.doctor.id,
+            'date': self.day.isoformat(),
+        }, headers=headers)
+
+    def test_unchanged_slots_return_304(self):
+        first = self.get_slots()
+        self.assertEqual(first.status_code, 200)
+
+        # Only the session and user lookups
+        with self.assertNumQueries(2):
+            second = self.get_slots(if_none_match=first['ETag'])
+        self.assertEqual(second.status_code, 304)
+
+    def test_own_hold_changes_etag(self):
+        first = self.get_slots()
+        self.client.post(reverse('hold_appointment_slot'), {
+            'doctor_id': self.doctor.id, 'date': self.day.isoformat(), 'time': '10:30'
+        })
+
+        second = self.get_slots(if_none_match=first['ETag'])
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.json()['slots'], ['10:00', '10:30'])
+        self.assertEqual(self.get_slots(if_none_match=second['ETag']).status_code, 304)
+
+    @override_settings(SLOT_HOLD_SECONDS=0.5)
+    def test_lapsed_hold_changes_etag(self):
+        bob = Client()
+        bob.login(username=make_patient('bob').username, password='pass')
+        bob.post(reverse('hold_appointment_slot'), {
+            'doctor_id': self.doctor.id, 'date': self.day.isoformat(), 'time': '10:00'
+        })
+        first = self.get_slots()
+        self.assertEqual(first.json()['slots'], ['10:30'])
+        self.assertEqual(self.get_slots(if_none_match=first['ETag']).status_code, 304)
+
+        # The hold lapses without any write that would bump the version
+        sleep(0.6)
+
+        second = self.get_slots(if_none_match=first['ETag'])
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.json()['slots'], ['10:00', '10:30'])
+        self.assertEqual(self.get_slots(if_none_match=second['ETag']).status_code, 304)
+
+    def test_booking_changes_etag(self):
+        first = self.get_slots()
+        Appointment.objects.create(
+            doctor=self.doctor,
+            patient=PatientProfile.objects.get(user__username='alice'),
+            appointment_date=self.day,
+            appointment_time=time(10, 0)
+        )
+
+        second = self.get_slots(if_none_match=first['ETag'])
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.json()['slots'], ['10:30'])
+
+    def test_doctor_list_etag(self):
+        url = reverse('get_doctors_by_specialization')
+        first = self.client.get(url, {'specialization': 'general'})
+        self.assertEqual(first.json()['doctors'][0]['id'], self.doctor.id)
+
+        self.assertEqual(
+            self.client.get(url, {'specialization': 'general'}, headers={'if_none_match': first['ETag']}).status_code,
+            304
+        )
+
+        self.doctor.is_available = False
+        self.doctor.save()
+
+        third = self.client.get(url, {'specialization': 'general'}, headers={'if_none_match': first['ETag']})
+        self.assertEqual(third.json()['doctors'], [])
+
+
+@fast_passwords
+class BookingBootstrapTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.doctor = make_doctor()
+        self.user = make_patient('alice')
+        self.day = date.today() + timedelta(days=1)
+        TimeSlot.objects.create(
+            doctor=self.doctor,
+            day_of_week=WEEKDAY_CODES[self.day.weekday()],
+            start_time=time(10, 0),
+            end_time=time(11, 0)
+        )
+
+    def test_payload_groups_doctors_and_ships_first_week(self):
+        payload = booking_bootstrap(self.user)
+
+        self.assertEqual(payload['specialization'], 'general')
+        self.assertEqual(payload['doctors']['general'][0]['id'], self.doctor.id)
+        self.assertEqual(payload['doctors']['dentist'], [])
+
+        availability = payload['availability']
+        self.assertEqual(availability['doctor_id'], self.doctor.id)
+        self.assertEqual(len(availability['days']), BOOTSTRAP_DAYS)
+        self.assertNotEqual(int(availability['days'][self.day.isoformat()], 16), 0)
+
+    def test_warm_call_is_one_query(self):
+        booking_bootstrap(self.user)
+
+        with self.assertNumQueries(1):
+            booking_bootstrap(self.user)
+
+    def test_booking_invalidates_cached_availability(self):
+        before = booking_bootstrap(self.user)['availability']['days'][self.day.isoformat()]
+        Appointment.objects.create(
+            doctor=self.doctor,
+            patient=self.user.patientprofile,
+            appointment_date=self.day,
+            appointment_time=time(10, 0)
+        )
+
+        after = booking_bootstrap(self.user)['availability']['days'][self.day.isoformat()]
+        self.assertNotEqual(before, after)
+
+    def test_page_inlines_payload(self):
+        self.client.login(username='alice', password='pass')
+
+        response = self.client.get(reverse('book_appointments'))
+
+        self.assertContains(response, 'id="booking-bootstrap"')
+
+
+@fast_passwords
+class AsyncLookupTests(TestCase):
+    """
+    The lookup views are async; drive them through the ASGI handler.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.doctor = make_doctor()
+        self.user = make_patient('alice')
+        self.day = date.today() + timedelta(days=1)
+        TimeSlot.objects.create(
+            doctor=self.doctor,
+            day_of_week=WEEKDAY_CODES[self.day.weekday()],
+            start_time=time(10, 0),
+            end_time=time(11, 0)
+        )
+
+    async def test_slots_over_asgi(self):
+        await self.async_client.aforce_login(self.user)
+        url = reverse('get_available_slots')
+        params = {'doctor_id': self.doctor.id, 'date': self.day.isoformat()}
+
+        first = await self.async_client.get(url, params)
+        self.assertEqual(first.json()['slots'], ['10:00', '10:30'])
+
+        second = await self.async_client.get(url, params, headers={'if-none-match': first['ETag']})
+        self.assertEqual(second.status_code, 304)
+
+    async def test_doctor_lookups_over_asgi(self):
+        await self.async_client.aforce_login(self.user)
+
+        by_specialization = await self.async_client.get(
+            reverse('get_doctors_by_specialization'), {'specialization': 'general'}
+        )
+        search = await self.async_client.get(reverse('search_doctors'), {'q': 'doc'})
+
+        self.assertEqual([doc['id'] for doc in by_specialization.json()['doctors']], [self.doctor.id])
+        self.assertEqual([doc['id'] for doc in search.json()['doctors']], [self.doctor.id])
+
+    async def test_anonymous_request_is_redirected(self):
+        response = await self.async_client.get(reverse('get_available_slots'))
+
+        self.assertEqual(response.status_code, 302)
+
+
+@fast_passwords
+class MedicalHistoryPdfTests(TestCase):
+
+    def setUp(self):
+        pdf_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(pdf_dir.cleanup)
+        self.enterContext(override_settings(MEDICAL_PDF_CACHE_DIR=pdf_dir.name))
+        self.pdf_dir = pdf_dir.name
+
+        self.doctor = make_doctor()
+        self.user = make_patient('alice')
+        self.history = MedicalHistory.objects.create(
+            patient=self.user.patientprofile, last_updated_by=self.doctor
+        )
+        self.client.login(username='alice', password='pass')
+
+    def stored_files(self):
+        return [name for _, _, names in os.walk(self.pdf_dir) for name in names]
+
+    def download(self, **headers):
+        return self.client.get(reverse('patient_medical_history_pdf'), headers=headers)
+
+    def test_repeat_download_is_stored_copy_or_304(self):
+        first = self.download()
+        self.assertEqual(first['Content-Type'], 'application/pdf')
+        self.assertTrue(first.content.startswith(b'%PDF'))
+        self.assertEqual(len(self.stored_files()), 1)
+
+        self.assertEqual(self.download(if_none_match=first['ETag']).status_code, 304)
+        self.assertEqual(self.download().content, first.content)
+
+    def test_doctor_save_rerenders_in_background(self):
+        first = self.download()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.history.notes = 'Penicillin reaction'
+            self.history.save()
+        # One worker: anything queued before this has finished when it returns
+        medical_pdf.executor.submit(lambda: None).result()
+
+        self.assertEqual(len(self.stored_files()), 1)
+        self.assertIsNotNone(medical_pdf.stored_pdf(medical_pdf.pdf_histories().get(id=self.history.id)))
+
+        second = self.download(if_none_match=first['ETag'])
+        self.assertEqual(second.status_code, 200)
+        self.assertNotEqual(second['ETag'], first['ETag'])
+
+    def test_native_renderer_prints_the_template_content(self):
+        self.history.allergies = 'Dust & <pollen>'
+        self.history.save()
+        history = medical_pdf.pdf_histories().get(id=self.history.id)
+
+        def text(name):
+            with override_settings(MEDICAL_PDF_RENDERER=name):
+                pdf = medical_pdf.render_pdf(*medical_pdf.render_source(history))
+            return ' '.join(PdfReader(BytesIO(pdf)).pages[0].extract_text().split())
+
+        self.assertEqual(text('reportlab'), text('xhtml2pdf'))
+        self.assertIn('Dust & <pollen>', text('reportlab'))
+
+    def test_stale_render_finishing_last_keeps_the_newer_copy(self):
+        stale = medical_pdf.pdf_histories().get(id=self.history.id)
+        stale_key = medical_pdf.pdf_key(stale)
+        stale_source = medical_pdf.render_source(stale)
+        self.history.notes = 'Penicillin reaction'
+        self.history.save()
+        current = medical_pdf.pdf_histories().get(id=self.history.id)
+        key = medical_pdf.pdf_key(current)
+
+        # The newer render was queued while the stale one still ran
+        queued, older = Future(), Future()
+        medical_pdf._in_flight[key] = queued
+        self.addCleanup(medical_pdf._in_flight.pop, key, None)
+
+        medical_pdf.render_and_store(
+            current.patient_id, key, *medical_pdf.render_source(current), current.updated_at
+        )
+        medical_pdf.render_and_store(stale.patient_id, stale_key, *stale_source, stale.updated_at)
+        older.set_result(None)
+        medical_pdf._finished(key, older)
+
+        self.assertEqual(self.stored_files(), [f'{key}.pdf'])
+        self.assertIsNotNone(medical_pdf.stored_pdf(current))
+        self.assertIs(medical_pdf._in_flight[key], queued)
+
+    def test_renderer_setting_changes_the_etag(self):
+        first = self.download()
+
+        with override_settings(MEDICAL_PDF_RENDERER='reportlab'):
+            second = self.download(if_none_match=first['ETag'])
+
+        self.assertEqual(second.status_code, 200)
+        self.assertTrue(second.content.startswith(b'%PDF'))
+
+    def test_zip_export_resumes(self):
+        other = make_patient('bob')
+        MedicalHistory.objects.create(patient=other.patientprofile)
+        output = os.path.join(self.pdf_dir, 'export.zip')
+
+        call_command(
+            'export_medical_history_pdfs', output, patients=[self.user.patientprofile.id],
+            workers=1, stdout=StringIO()
+        )
+        out = StringIO()
+        call_command('export_medical_history_pdfs', output, workers=1, batch_size=1, stdout=out)
+
+        self.assertIn('Resuming: 1 already', out.getvalue())
+        with zipfile.ZipFile(output) as archive:
+            self.assertEqual(sorted(archive.namelist()), [
+                f'medical_history_{self.user.patientprofile.id}.pdf',
+                f'medical_history_{other.patientprofile.id}.pdf',
+            ])
+            self.assertTrue(archive.read(archive.namelist()[1]).startswith(b'%PDF'))
+
+    def test_interrupted_zip_export_resumes(self):
+        other = make_patient('bob')
+        MedicalHistory.objects.create(patient=other.patientprofile)
+        output = os.path.join(self.pdf_dir, 'export.zip')
+
+        class Interrupted(Exception):
+            pass
+
+        class InterruptedExport(export_medical_history_pdfs.Command):
+            batches = 0
+
+            def render_batch(self, pool, history_ids):
+                self.batches += 1
+                if self.batches > 1:
+                    raise Interrupted
+                yield from super().render_batch(pool, history_ids)
+
+        with self.assertRaises(Interrupted):
+            call_command(InterruptedExport(), output, workers=1, batch_size=1, stdout=StringIO())
+        # The first batch is a complete part; the second left only a .tmp
+        self.assertFalse(os.path.exists(output))
+        self.assertEqual(sorted(os.listdir(output + '.parts')), ['part-00000.zip', 'part-00001.zip.tmp'])
+
+        out = StringIO()
+        call_command('export_medical_history_pdfs', output, workers=1, batch_size=1, stdout=out)
+
+        self.assertIn('Resuming: 1 already', out.getvalue())
+        self.assertFalse(os.path.exists(output + '.parts'))
+        with zipfile.ZipFile(output) as archive:
+            self.assertIsNone(archive.testzip())
+            self.assertEqual(sorted(archive.namelist()), [
+                f'medical_history_{self.user.patientprofile.id}.pdf',
+                f'medical_history_{other.patientprofile.id}.pdf',
+            ])
@@ -12,7 +12,12 @@ urlpatterns = [
     path('cancel_appointment/<int:appointment_id>/', views.cancel_appointment, name='cancel_appointment'),
     
     path('get-available-slots/', views.get_available_slots, name='get_available_slots'),
+    path('hold-slot/', views.hold_appointment_slot, name='hold_appointment_slot'),
+    path('get-available-slots-range/', views.get_available_slots_range, name='get_available_slots_range'),
+    path('get-first-available-slots/', views.get_first_available_slots, name='get_first_available_slots'),
+    path('get-booking-bootstrap/', views.get_booking_bootstrap, name='get_booking_bootstrap'),
     path('get-doctors-by-specialization/', views.get_doctors_by_specialization, name='get_doctors_by_specialization'),
+    path('search-doctors/', views.search_doctors, name='search_doctors'),
 
     
     path('patient_profile/',views.patient_profile,name="patient_profile"),
@@ -1,15 +1,33 @@
-from django.shortcuts import render, redirect, get_object_or_404
+from asgiref.sync import sync_to_async
+from django.shortcuts import render, redirect, get_object_or_404, aget_object_or_404
 from .forms import PatientRegistrationForm     
 from django.contrib.auth.decorators import login_required 
 from django.contrib.auth import logout   
-from users.models import DoctorProfile, TimeSlot, Appointment, PatientProfile, Feedback      
+from users.models import DoctorProfile, TimeSlot, Appointment, PatientProfile, Feedback, SlotHold
 from django.contrib import messages 
 from django.http import JsonResponse
+from django.db import IntegrityError, connection, transaction
+from django.views.decorators.http import require_POST
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
 from users.models import Specialization
+from users.availability import (
+    MAX_RANGE_DAYS, aavailable_times, anext_hold_expiry, availability_bitmaps,
+    earliest_open_slots, hold_slot, next_hold_expiry, overlaps_other_booking, past_cutoff, slot_held
+)
+from users import search as doctor_search
+from users import slot_engine
+from users.cache_versions import RESPONSE_TTL, aget_version, get_version, get_versions, response_etag
+from users.pagination import APPOINTMENT_ORDERING, paginate_keyset
 
 from datetime import date, datetime, timedelta
 
 
+# Days of availability shipped with the booking page for the first doctor
+BOOTSTRAP_DAYS = 7
+
+
 
 
 #----------------------------------------------------------------------------------
@@ -51,7 +69,7 @@ def patient_dashboard(request):
     upcoming_appointments = Appointment.objects.filter(
         patient=patient_profile,
         appointment_date__gte=date.today()
-    ).order_by('appointment_date', 'appointment_time')
+    ).select_related('doctor__user').order_by('appointment_date', 'appointment_time')
 
     context = {
         'patient': patient_profile,
@@ -156,43 +174,57 @@ def book_appointments(request):
             messages.error(request, "You cannot book an appointment for a past date.")
             return redirect('book_appointments')
 
-        # -------- RULE 2: One appointment per doctor per day per patient --------
-        existing_patient_booking = Appointment.objects.filter(
-            doctor=doctor,
-            patient=patient_profile,
-            appointment_date=appointment_date_obj,
-            status__in=['pending', 'confirmed']
-        ).exists()
-
-        if existing_patient_booking:
-            messages.error(
-                request,
-                "You already have an appointment with this doctor on the selected date."
-            )
-            return redirect('book_appointments')
-
-        # -------- RULE 3: Prevent slot collision --------
-        slot_taken = Appointment.objects.filter(
-            doctor=doctor,
-            appointment_date=appointment_date_obj,
-            appointment_time=appointment_time_obj,
-            status__in=['pending', 'confirmed']
-        ).exists()
-
-        if slot_taken:
+        # -------- Slot held by another patient still filling in the form --------
+        if slot_held(doctor, appointment_date_obj, appointment_time_obj, request.user):
             messages.error(
                 request,
                 "This time slot is already booked. Please choose another time."
             )
             return redirect('book_appointments')
 
-        Appointment.objects.create(
-            doctor=doctor,
-            patient=patient_profile,
-            appointment_date=appointment_date_obj,
-            appointment_time=appointment_time_obj,
-            status='pending'
-        )
+        # -------- RULE 2 & RULE 3 --------
+        # One appointment per doctor per day per patient, and no slot collision.
+        # The unique constraints on Appointment catch a second booking of the
+        # same start time; an overlap from another start time (after the
+        # doctor changed slot length) is checked after the insert, in the
+        # same transaction, so it cannot race with another patient either.
+        try:
+            with transaction.atomic():
+                if connection.features.has_select_for_update:
+                    # Serialize bookings of this doctor; SQLite serializes
+                    # writers already, from the insert below
+                    DoctorProfile.objects.select_for_update().filter(id=doctor.id).first()
+                appointment = Appointment.objects.create(
+                    doctor=doctor,
+                    patient=patient_profile,
+                    appointment_date=appointment_date_obj,
+                    appointment_time=appointment_time_obj,
+                    duration_minutes=doctor.slot_minutes,
+                    status='pending'
+                )
+                if overlaps_other_booking(appointment):
+                    raise IntegrityError("Appointment overlaps another booking.")
+                # The patient's hold has served its purpose
+                SlotHold.objects.filter(user=request.user).delete()
+        except IntegrityError:
+            existing_patient_booking = Appointment.objects.filter(
+                doctor=doctor,
+                patient=patient_profile,
+                appointment_date=appointment_date_obj,
+                status__in=Appointment.ACTIVE_STATUSES
+            ).exists()
+
+            if existing_patient_booking:
+                messages.error(
+                    request,
+                    "You already have an appointment with this doctor on the selected date."
+                )
+            else:
+                messages.error(
+                    request,
+                    "This time slot is already booked. Please choose another time."
+                )
+            return redirect('book_appointments')
 
         messages.success(request, "Appointment booked successfully!")
         return redirect('view_appointments')
@@ -200,91 +232,318 @@ def book_appointments(request):
     context = {
         'patient': patient_profile,
         'specializations': specializations,
+        'bootstrap': booking_bootstrap(request.user),
     }
     return render(request, 'patients/book_appointments.html', context)
 
 
 
+def booking_bootstrap(user, specialization=None):
+    """
+    Everything the booking page needs before the patient picks anything:
+    specializations, approved and available doctors grouped by
+    specialization, and the next BOOTSTRAP_DAYS of availability (day
+    bitmaps) for the first doctor of `specialization` (or of the first
+    specialization that has doctors).
+
+    The doctor groups are cached under the specialization versions and the
+    availability under the doctor's version, so a warm call costs a single
+    query (the patient's own-hold check).
+    """
+    codes = [value for value, _ in DoctorProfile.SPECIALIZATION_CHOICES]
+
+    doctors_key = f"bootstrap:doctors:{response_etag('bootstrap', *get_versions('specialization', codes))}"
+    doctors = cache.get(doctors_key)
+    if doctors is None:
+        doctors = {code: [] for code in codes}
+        for doc in DoctorProfile.objects.filter(
+            is_approved=True,
+            is_available=True
+        ).select_related('user').order_by('id'):
+            doctors.setdefault(doc.specialization, []).append(
+                {'id': doc.id, 'name': f"{doc.user.first_name} ({doc.get_specialization_display()})"}
+            )
+        cache.set(doctors_key, doctors, RESPONSE_TTL)
+
+    if not doctors.get(specialization):
+        specialization = next((code for code in codes if doctors.get(code)), specialization)
+
+    availability = None
+    if doctors.get(specialization):
+        doctor_id = doctors[specialization][0]['id']
+        start = date.today()
+        end = start + timedelta(days=BOOTSTRAP_DAYS - 1)
+
+        # The shared body hides every hold; a patient holding one of this
+        # doctor's slots gets a live build that keeps their slot visible
+        own_hold = SlotHold.objects.filter(
+            user=user,
+            doctor_id=doctor_id,
+            hold_date__range=(start, end),
+            expires_at__gt=timezone.now()
+        ).exists()
+
+        version = get_version('doctor', doctor_id)
+        availability_key = "bootstrap:availability:" + response_etag(
+            'bootstrap', doctor_id, start, version, next_hold_expiry(doctor_id, version), past_cutoff(start)
+        )
+        if not own_hold:
+            availability = cache.get(availability_key)
+
+        if availability is None:
+            doctor = DoctorProfile.objects.get(id=doctor_id)
+            cell_minutes, days = availability_bitmaps(doctor, start, end, user if own_hold else None)
+            availability = {
+                'doctor_id': doctor_id,
+                'slot_minutes': doctor.slot_minutes,
+                'cell_minutes': cell_minutes,
+                'from': start.isoformat(),
+                'to': end.isoformat(),
+                'days': days,
+            }
+            if not own_hold:
+                cache.set(availability_key, availability, RESPONSE_TTL)
+
+    return {
+        'specializations': [
+            {'value': value, 'label': label}
+            for value, label in DoctorProfile.SPECIALIZATION_CHOICES
+        ],
+        'specialization': specialization,
+        'doctors': doctors,
+        'availability': availability,
+    }
+
+
+
+# The read-only AJAX lookups below are async views: served through asgi.py
+# a lookup waits on the event loop instead of holding a worker thread. They
+# get the user from request.auser(), as request.user would query
+# synchronously. Slot holds write in a transaction and the doctor search
+# runs a raw cursor, so those two stay sync.
+
+# AJAX view returning the booking page bootstrap for another specialization
+@login_required
+async def get_booking_bootstrap(request):
+    user = await request.auser()
+    payload = await sync_to_async(booking_bootstrap)(user, request.GET.get('specialization'))
+    response = JsonResponse(payload)
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+
 
 
 
 
 # AJAX view to get available slots
 @login_required
-def get_available_slots(request):
+async def get_available_slots(request):
     doctor_id = request.GET.get('doctor_id')
     date_str = request.GET.get('date')
 
     if not doctor_id or not date_str:
         return JsonResponse({'slots': []})
 
+    try:
+        doctor_id = int(doctor_id)
+        date_obj = datetime.strptime(date_str, "%Y-%m-%d").date()
+    except ValueError:
+        return JsonResponse({'slots': []})
+
+    user = await request.auser()
+
+    # The body shows the patient's own hold, so the ETag is per patient.
+    # Taking, extending or releasing a hold bumps the doctor's version; a
+    # hold lapsing moves the earliest hold expiry. Both are cached, so a 304
+    # normally runs no query of its own. Today's slots also drop out as the
+    # clock passes them.
+    version = await aget_version('doctor', doctor_id)
+    version_tag = response_etag(
+        'slots', doctor_id, date_obj, version,
+        await anext_hold_expiry(doctor_id, version), past_cutoff(date_obj)
+    )
+    etag = f'"{version_tag}-{user.pk}"'
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        return not_modified
+
+    # The patient's own hold stays selectable for them only
+    own_hold = await SlotHold.objects.filter(
+        user=user,
+        doctor_id=doctor_id,
+        hold_date=date_obj,
+        expires_at__gt=timezone.now()
+    ).values_list('hold_time', flat=True).afirst()
+    own_label = own_hold.strftime("%H:%M") if own_hold else ''
+
+    # Shared body, keyed by the doctor's version
+    cache_key = f"slots:{version_tag}"
+    available_slots = await cache.aget(cache_key)
+    if available_slots is None:
+        doctor = await aget_object_or_404(DoctorProfile, id=doctor_id)
+        # Precomputed inventory read (falls back to live expansion past the horizon)
+        available_slots = [
+            slot_engine.label(minutes)
+            for minutes in await aavailable_times(doctor, date_obj)
+        ]
+        await cache.aset(cache_key, available_slots, RESPONSE_TTL)
+
+    if own_label and own_label not in available_slots:
+        available_slots = sorted(available_slots + [own_label])
+
+    response = JsonResponse({'slots': available_slots})
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+
+# AJAX view to hold a slot while the patient completes the booking form
+@login_required
+@require_POST
+def hold_appointment_slot(request):
+    doctor_id = request.POST.get('doctor_id')
+    date_str = request.POST.get('date')
+    time_str = request.POST.get('time')
+
+    if not doctor_id or not date_str or not time_str:
+        return JsonResponse({'held': False, 'error': "All fields are required."}, status=400)
+
     doctor = get_object_or_404(DoctorProfile, id=doctor_id)
 
     try:
         date_obj = datetime.strptime(date_str, "%Y-%m-%d").date()
+        time_obj = datetime.strptime(time_str, "%H:%M").time()
     except ValueError:
-        return JsonResponse({'slots': []})
+        return JsonResponse({'held': False, 'error': "Invalid date or time."}, status=400)
 
-    # Map weekday
-    weekday_map = ['mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun']
-    day_code = weekday_map[date_obj.weekday()]
+    hold = hold_slot(doctor, date_obj, time_obj, request.user)
+    if hold is None:
+        return JsonResponse({
+            'held': False,
+            'error': "This time slot is already booked. Please choose another time."
+        }, status=409)
 
-    # Get doctor's availability windows
-    availability_qs = TimeSlot.objects.filter(
-        doctor=doctor,
-        day_of_week=day_code,
-        is_active=True
-    )
+    return JsonResponse({'held': True, 'expires_at': hold.expires_at.isoformat()})
 
-    if not availability_qs.exists():
-        return JsonResponse({'slots': []})
 
-    # Get already booked times
-    booked_times = Appointment.objects.filter(
-        doctor=doctor,
-        appointment_date=date_obj,
-        status__in=['pending', 'confirmed'],
-        appointment_time__isnull=False
-    ).values_list('appointment_time', flat=True)
 
-    booked_set = set(bt.strftime("%H:%M") for bt in booked_times)
+# AJAX view to get availability of a doctor for a whole date range
+@login_required
+async def get_available_slots_range(request):
+    """
+    Returns one hex bitmap per day (see users.availability.encode_day_bitmap)
+    so the booking calendar can load a week or month in a single request.
+    """
+    doctor_id = request.GET.get('doctor_id')
+    from_str = request.GET.get('from')
+    to_str = request.GET.get('to')
 
-    SLOT_DURATION = timedelta(minutes=30)
-    available_slots = []
+    if not doctor_id or not from_str or not to_str:
+        return JsonResponse({'days': {}})
 
-    for slot in availability_qs:
-        start_dt = datetime.combine(date_obj, slot.start_time)
-        end_dt = datetime.combine(date_obj, slot.end_time)
+    doctor = await aget_object_or_404(DoctorProfile, id=doctor_id)
 
-        while start_dt + SLOT_DURATION <= end_dt:
-            time_str = start_dt.strftime("%H:%M")
+    try:
+        from_date = datetime.strptime(from_str, "%Y-%m-%d").date()
+        to_date = datetime.strptime(to_str, "%Y-%m-%d").date()
+    except ValueError:
+        return JsonResponse({'days': {}})
 
-            if time_str not in booked_set:
-                available_slots.append(time_str)
+    # No bookable slots in the past; cap the window size
+    from_date = max(from_date, date.today())
+    to_date = min(to_date, from_date + timedelta(days=MAX_RANGE_DAYS - 1))
 
-            start_dt += SLOT_DURATION
+    if to_date < from_date:
+        return JsonResponse({'days': {}})
 
-    return JsonResponse({'slots': available_slots})
+    cell_minutes, days = await sync_to_async(availability_bitmaps)(
+        doctor, from_date, to_date, await request.auser()
+    )
+
+    return JsonResponse({
+        'slot_minutes': doctor.slot_minutes,
+        'cell_minutes': cell_minutes,
+        'from': from_date.isoformat(),
+        'to': to_date.isoformat(),
+        'days': days,
+    })
 
 
 
+# AJAX view to find the soonest open slots across a specialization
 @login_required
-def get_doctors_by_specialization(request):
+async def get_first_available_slots(request):
     specialization_value = request.GET.get('specialization')
     if not specialization_value:
-        return JsonResponse({'doctors': []})
+        return JsonResponse({'slots': []})
 
-    doctors = DoctorProfile.objects.filter(
-        specialization=specialization_value,
-        is_approved=True,
-        is_available=True
-    )
+    try:
+        from_date = datetime.strptime(request.GET['from'], "%Y-%m-%d").date() if request.GET.get('from') else None
+        to_date = datetime.strptime(request.GET['to'], "%Y-%m-%d").date() if request.GET.get('to') else None
+        limit = int(request.GET.get('limit', 5))
+    except ValueError:
+        return JsonResponse({'slots': []})
 
-    doctors_list = [
-        {'id': doc.id, 'name': f"{doc.user.first_name} ({doc.get_specialization_display()})"}
-        for doc in doctors
+    slots = await sync_to_async(earliest_open_slots)(specialization_value, from_date, to_date, max(limit, 1))
+
+    slots_list = [
+        {
+            'doctor_id': slot.doctor_id,
+            'doctor_name': f"{slot.doctor.user.first_name} ({slot.doctor.get_specialization_display()})",
+            'date': slot.slot_date.isoformat(),
+            'time': slot.slot_time.strftime("%H:%M"),
+        }
+        for slot in slots
     ]
-    return JsonResponse({'doctors': doctors_list})
+    return JsonResponse({'slots': slots_list})
+
+
+
+@login_required
+async def get_doctors_by_specialization(request):
+    specialization_value = request.GET.get('specialization')
+    if not specialization_value:
+        return JsonResponse({'doctors': []})
+
+    etag = response_etag('doctors', specialization_value, await aget_version('specialization', specialization_value))
+    not_modified = get_conditional_response(request, etag=f'"{etag}"')
+    if not_modified is not None:
+        return not_modified
+
+    cache_key = f"doctors:{etag}"
+    doctors_list = await cache.aget(cache_key)
+    if doctors_list is None:
+        doctors = DoctorProfile.objects.filter(
+            specialization=specialization_value,
+            is_approved=True,
+            is_available=True
+        ).select_related('user')
+
+        doctors_list = [
+            {'id': doc.id, 'name': f"{doc.user.first_name} ({doc.get_specialization_display()})"}
+            async for doc in doctors
+        ]
+        await cache.aset(cache_key, doctors_list, RESPONSE_TTL)
+
+    response = JsonResponse({'doctors': doctors_list})
+    response['ETag'] = f'"{etag}"'
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+# Sync: the FTS query goes through a raw cursor, which has no async form,
+# and as an async view every keystroke paid for three thread hops
+# (session, user, query) instead of one
+@login_required
+def search_doctors(request):
+    """
+    Typeahead over bookable doctors: every word of `q` matched as a prefix
+    of the name, specialization, qualification or bio.
+    """
+    return JsonResponse({'doctors': doctor_search.search_doctors(request.GET.get('q', ''))})
 
 
 
@@ -314,10 +573,12 @@ def view_appointments(request):
         messages.warning(request, "Please complete your profile first.")
         return redirect('patient_profile')
 
-    # Fetch all appointments for this patient
-    appointments = Appointment.objects.filter(
-        patient=patient_profile
-    ).order_by('-appointment_date', '-appointment_time')  # latest first
+    # Appointments of this patient, latest first, one page at a time
+    appointments = paginate_keyset(
+        Appointment.objects.filter(patient=patient_profile).select_related('doctor__user'),
+        APPOINTMENT_ORDERING,
+        request.GET
+    )
 
     context = {
         'patient': patient_profile,
@@ -345,7 +606,7 @@ def view_appointments(request):
 @login_required
 def submit_feedback(request):
     patient = request.user.patientprofile
-    doctors = DoctorProfile.objects.all()  # or filter relevant doctors
+    doctors = DoctorProfile.objects.select_related('user')  # or filter relevant doctors
 
     if request.method == 'POST':
         doctor_id = request.POST.get('doctor')
@@ -390,36 +651,26 @@ def patient_medical_history(request):
 
 from django.shortcuts import get_object_or_404
 from django.http import HttpResponse
-from django.template.loader import render_to_string
-from xhtml2pdf import pisa
-from django.conf import settings
-import os
 from users.models import PatientProfile, MedicalHistory
+from users import medical_pdf
 
 @login_required
 def patient_medical_history_pdf(request):
-    patient = get_object_or_404(PatientProfile, user=request.user)
-    history = get_object_or_404(MedicalHistory, patient=patient)
+    history = get_object_or_404(medical_pdf.pdf_histories(), patient__user=request.user)
 
-    # Absolute path for logo (required for xhtml2pdf)
-    logo_path = os.path.join(settings.STATIC_ROOT, 'img', 'pg_logo.png')
+    # The stored copy's content key doubles as the ETag
+    key = medical_pdf.pdf_key(history)
+    etag = f'"{key}"'
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        return not_modified
 
-    html = render_to_string(
-        'patients/medical_history_pdf.html',
-        {
-            'patient': patient,
-            'history': history,
-            'doctor': history.last_updated_by,
-            'logo_path': logo_path,
-        }
-    )
+    pdf = medical_pdf.get_pdf(history, key)
+    if pdf is None:
+        return HttpResponse('Error generating PDF', status=500)
 
-    response = HttpResponse(content_type='application/pdf')
+    response = HttpResponse(pdf, content_type='application/pdf')
     response['Content-Disposition'] = 'attachment; filename="medical_history.pdf"'
-
-    # Create PDF
-    pisa_status = pisa.CreatePDF(html, dest=response)
-    if pisa_status.err:
-        return HttpResponse('Error generating PDF <pre>' + html + '</pre>')
-
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, no_cache=True)
     return response
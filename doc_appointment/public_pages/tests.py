@@ -1,3 +1,60 @@
+from django.core.cache import cache
 from django.test import TestCase
+from django.urls import reverse
 
-# Create your tests here.
+from users.models import DoctorProfile, User
+
+
+class DoctorDirectoryTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('doc', role='doctor', first_name='Ada', last_name='Lane')
+        self.doctor = DoctorProfile.objects.create(user=self.user, is_approved=True)
+
+    def test_anonymous_page_is_public_and_conditional(self):
+        first = self.client.get(reverse('doctors'))
+
+        self.assertContains(first, 'Ada Lane')
+        self.assertIn('public', first['Cache-Control'])
+        self.assertIn('Last-Modified', first)
+
+        second = self.client.get(reverse('doctors'), headers={'if-none-match': first['ETag']})
+        self.assertEqual(second.status_code, 304)
+
+    def test_repeat_hits_come_from_cache(self):
+        self.client.get(reverse('doctors'))
+
+        with self.assertNumQueries(0):
+            self.client.get(reverse('doctors'))
+
+    def test_profile_and_user_saves_invalidate(self):
+        first = self.client.get(reverse('doctors'))
+
+        self.user.first_name = 'Grace'
+        self.user.save()
+        renamed = self.client.get(reverse('doctors'), headers={'if-none-match': first['ETag']})
+        self.assertContains(renamed, 'Grace Lane')
+
+        self.doctor.is_available = False
+        self.doctor.save()
+        self.assertContains(self.client.get(reverse('doctors')), 'No doctors available')
+
+    def test_evicted_versions_do_not_revive_old_pages(self):
+        cache.clear()
+        self.client.get(reverse('doctors'))
+        self.user.first_name = 'Grace'
+        self.user.save()
+
+        # The counters are evicted, the page cached before the rename is not
+        cache.delete_many([f'version:specialization:{code}' for code, _ in DoctorProfile.SPECIALIZATION_CHOICES])
+
+        self.assertContains(self.client.get(reverse('doctors')), 'Grace Lane')
+
+    def test_signed_in_users_get_a_private_response(self):
+        self.client.force_login(self.user)
+
+        response = self.client.get(reverse('doctors'))
+
+        self.assertContains(response, 'Ada Lane')
+        self.assertIn('private', response['Cache-Control'])
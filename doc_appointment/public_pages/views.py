@@ -1,5 +1,17 @@
 from django.shortcuts import render
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
 from users.models import DoctorProfile
+from users.cache_versions import get_versions, last_modified
+
+
+# How long shared caches and browsers may reuse the anonymous directory page
+DIRECTORY_MAX_AGE = 60
+# Server-side page and fragment entries are keyed by version, so they can live long
+DIRECTORY_CACHE_SECONDS = 60 * 60
 
 
 
@@ -20,14 +32,68 @@ def contact(request):
 
 
 
-def doctors(request):
+def _directory_context(codes, versions):
     doctors = DoctorProfile.objects.filter(
         user__is_active=True,
         is_approved=True,
         is_available=True
-    )
+    ).select_related('user')
 
-    context = {
-        'doctors': doctors
+    # Only specializations whose card fragment is not cached are queried,
+    # all of them in one go
+    fragment_keys = {
+        code: make_template_fragment_key('directory_cards', [code, version])
+        for code, version in zip(codes, versions)
     }
-    return render(request, 'pages/doctors.html', context)
\ No newline at end of file
+    cached = cache.get_many(fragment_keys.values())
+    missing = [code for code, key in fragment_keys.items() if key not in cached]
+
+    cards = {code: [] for code in missing}
+    if missing:
+        for doctor in doctors.filter(specialization__in=missing).order_by('id'):
+            cards[doctor.specialization].append(doctor)
+
+    return {
+        'doctor_groups': [
+            {'code': code, 'version': version, 'doctors': cards.get(code, [])}
+            for code, version in zip(codes, versions)
+        ],
+        'directory_version': '.'.join(str(version) for version in versions),
+        # Known for free on a cold cache; otherwise a lazy EXISTS
+        'has_doctors': any(cards.values()) if len(missing) == len(codes) else doctors.exists,
+        'fragment_timeout': DIRECTORY_CACHE_SECONDS,
+    }
+
+
+def doctors(request):
+    """
+    Public doctor directory. Cards are rendered per specialization inside
+    fragment caches keyed by that specialization's version (bumped by
+    DoctorProfile/User signals); anonymous visitors get the whole page from
+    the cache, with ETag/Last-Modified so a reverse proxy can serve repeats.
+    """
+    codes = [value for value, _ in DoctorProfile.SPECIALIZATION_CHOICES]
+    versions = get_versions('specialization', codes)
+
+    if request.user.is_authenticated:
+        response = render(request, 'pages/doctors.html', _directory_context(codes, versions))
+        patch_cache_control(response, private=True)
+        return response
+
+    directory_version = '.'.join(str(version) for version in versions)
+    etag = f'"directory-{directory_version}"'
+    modified = last_modified('specialization', codes)
+
+    response = get_conditional_response(request, etag=etag, last_modified=modified)
+    if response is None:
+        page_key = f"directory:page:{directory_version}"
+        content = cache.get(page_key)
+        if content is None:
+            content = render(request, 'pages/doctors.html', _directory_context(codes, versions)).content
+            cache.set(page_key, content, DIRECTORY_CACHE_SECONDS)
+        response = HttpResponse(content)
+
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(modified)
+    patch_cache_control(response, public=True, max_age=DIRECTORY_MAX_AGE)
+    return response
@@ -32,7 +32,12 @@ class DoctorProfileAdmin(admin.ModelAdmin):
     actions = ['approve_doctors']
 
     def approve_doctors(self, request, queryset):
-        updated = queryset.update(is_approved=True)
+        # Saved one by one so the dashboard counters and list caches follow
+        updated = 0
+        for doctor in queryset.filter(is_approved=False):
+            doctor.is_approved = True
+            doctor.save(update_fields=['is_approved'])
+            updated += 1
         self.message_user(request, f"{updated} doctor(s) approved successfully.")
     approve_doctors.short_description = "Approve selected doctors"
 
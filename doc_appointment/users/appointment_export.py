@@ -0,0 +1,187 @@
+"""
+Streaming CSV / NDJSON export of appointments.
+
+Rows are read with values_list() and .iterator(chunk_size=...), so no
+model instances are built and the database cursor is walked in chunks,
+and they are written out in ~64KB pieces through StreamingHttpResponse.
+Memory stays flat however many appointments match; the work is done
+while the response is being sent, not in the view.
+
+CSV text cells that a spreadsheet would read as a formula are prefixed
+with a quote; NDJSON is left as stored.
+"""
+import csv
+import io
+import json
+import zlib
+from datetime import datetime
+
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+
+from users.models import Appointment
+
+
+# Column name -> lookup; the order is the CSV column order
+COLUMNS = (
+    ('id', 'id'),
+    ('date', 'appointment_date'),
+    ('time', 'appointment_time'),
+    ('status', 'status'),
+    ('doctor_id', 'doctor_id'),
+    ('doctor_first_name', 'doctor__user__first_name'),
+    ('doctor_last_name', 'doctor__user__last_name'),
+    ('specialization', 'doctor__specialization'),
+    ('patient_id', 'patient_id'),
+    ('patient_first_name', 'patient__user__first_name'),
+    ('patient_last_name', 'patient__user__last_name'),
+    ('reason', 'reason'),
+    ('cancelled_by', 'cancelled_by'),
+    ('cancellation_reason', 'cancellation_reason'),
+    ('created_at', 'created_at'),
+)
+
+# Rows fetched from the database cursor at a time
+CHUNK_SIZE = 2000
+# Bytes of output gathered before a piece is sent
+FLUSH_SIZE = 64 * 1024
+
+# Leading characters that make Excel/LibreOffice/Sheets evaluate a cell
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def _parse_id(params, name):
+    value = params.get(name)
+    if not value:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise ValidationError(f"{name} must be an id.")
+
+
+def _parse_date(params, name):
+    value = params.get(name)
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").date()
+    except ValueError:
+        raise ValidationError(f"{name} must be a date (YYYY-MM-DD).")
+
+
+def filtered_appointments(params):
+    """
+    Appointments matching the `doctor`, `patient`, `from`, `to` (inclusive)
+    and `status` (repeatable) query parameters, oldest first. Raises
+    ValidationError for a malformed value.
+    """
+    appointments = Appointment.objects.all()
+
+    doctor_id = _parse_id(params, 'doctor')
+    if doctor_id is not None:
+        appointments = appointments.filter(doctor_id=doctor_id)
+    patient_id = _parse_id(params, 'patient')
+    if patient_id is not None:
+        appointments = appointments.filter(patient_id=patient_id)
+
+    from_date, to_date = _parse_date(params, 'from'), _parse_date(params, 'to')
+    if from_date and to_date and from_date > to_date:
+        raise ValidationError("from must not be after to.")
+    if from_date:
+        appointments = appointments.filter(appointment_date__gte=from_date)
+    if to_date:
+        appointments = appointments.filter(appointment_date__lte=to_date)
+
+    statuses = [status for status in params.getlist('status') if status]
+    if statuses:
+        unknown = set(statuses) - {value for value, _ in Appointment.STATUS_CHOICES}
+        if unknown:
+            raise ValidationError(f"Unknown status: {', '.join(sorted(unknown))}.")
+        appointments = appointments.filter(status__in=statuses)
+
+    return appointments.order_by('appointment_date', 'appointment_time', 'id')
+
+
+def export_rows(appointments):
+    """
+    Tuples in COLUMNS order, fetched CHUNK_SIZE rows at a time.
+    """
+    return appointments.values_list(
+        *(lookup for _, lookup in COLUMNS)
+    ).iterator(chunk_size=CHUNK_SIZE)
+
+
+def _buffered(write_rows):
+    """
+    Run write_rows(buffer) -- a generator that writes rows into a
+    StringIO and yields after each one -- and yield the text in pieces
+    of about FLUSH_SIZE.
+    """
+    buffer = io.StringIO()
+    for _ in write_rows(buffer):
+        if buffer.tell() >= FLUSH_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def csv_cell(value):
+    """
+    `value`, with free text that would start a formula quoted with a
+    leading apostrophe.
+    """
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def csv_chunks(rows):
+    def write_rows(buffer):
+        writer = csv.writer(buffer)
+        writer.writerow(name for name, _ in COLUMNS)
+        for row in rows:
+            writer.writerow([csv_cell(value) for value in row])
+            yield
+    return _buffered(write_rows)
+
+
+def ndjson_chunks(rows):
+    names = [name for name, _ in COLUMNS]
+
+    def write_rows(buffer):
+        for row in rows:
+            buffer.write(json.dumps(dict(zip(names, row)), cls=DjangoJSONEncoder))
+            buffer.write('\n')
+            yield
+    return _buffered(write_rows)
+
+
+def gzipped(chunks):
+    """
+    Compress text chunks into one gzip stream as they are produced.
+    """
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode())
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_chunks(appointments, fmt, gzip=False):
+    """
+    The response body for `fmt` ('csv' or 'ndjson'), optionally gzipped.
+    """
+    rows = export_rows(appointments)
+    chunks = csv_chunks(rows) if fmt == 'csv' else ndjson_chunks(rows)
+    if gzip:
+        return gzipped(chunks)
+    return (chunk.encode() for chunk in chunks)
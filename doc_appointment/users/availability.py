@@ -0,0 +1,720 @@
+import threading
+import time
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from math import gcd
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from users import slot_engine
+from users.cache_versions import RESPONSE_TTL, bump_version
+from users.models import Appointment, DoctorProfile, SlotHold, SlotInventory, TimeSlot
+
+
+WEEKDAY_CODES = ['mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun']
+
+# Appointments in these statuses occupy their slot
+ACTIVE_STATUSES = Appointment.ACTIVE_STATUSES
+
+# Longest window accepted by the range availability endpoint
+MAX_RANGE_DAYS = 92
+
+# Most results returned by the "first available" search
+MAX_EARLIEST_RESULTS = 50
+
+# Doctors rebuilt per bulk_create batch, keeps memory bounded on full rebuilds
+REBUILD_CHUNK_SIZE = 100
+
+
+def inventory_days():
+    return getattr(settings, 'SLOT_INVENTORY_DAYS', 30)
+
+
+def hold_seconds():
+    return getattr(settings, 'SLOT_HOLD_SECONDS', 300)
+
+
+def merge_intervals(intervals):
+    """
+    Normalize (start, end) intervals into a sorted list of disjoint ones,
+    merging any that overlap or touch (9-12 + 11-13 -> 9-13).
+    """
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def apply_weekly_template(doctor, days, start_time, end_time):
+    """
+    Add the window start_time-end_time to each of `days` and normalize the
+    active TimeSlots of those days into disjoint intervals. The resulting
+    diff is written with one delete and one bulk_create in a transaction.
+    Returns the list of days whose availability actually changed.
+    """
+    existing = defaultdict(list)
+    for slot in TimeSlot.objects.filter(
+        doctor=doctor,
+        day_of_week__in=days,
+        is_active=True
+    ):
+        existing[slot.day_of_week].append(slot)
+
+    to_delete = []
+    to_create = []
+    changed_days = []
+
+    for day in days:
+        current = {(slot.start_time, slot.end_time): slot for slot in existing[day]}
+        merged = merge_intervals(list(current) + [(start_time, end_time)])
+
+        stale = [slot.id for key, slot in current.items() if key not in merged]
+        # Exact duplicates of one interval collapse to a single row
+        duplicates = [
+            slot.id for slot in existing[day]
+            if slot.id != current[(slot.start_time, slot.end_time)].id
+        ]
+        new = [interval for interval in merged if interval not in current]
+
+        if stale or duplicates or new:
+            changed_days.append(day)
+        to_delete.extend(stale + duplicates)
+        to_create.extend(
+            TimeSlot(
+                doctor=doctor,
+                day_of_week=day,
+                start_time=interval_start,
+                end_time=interval_end,
+                is_active=True
+            )
+            for interval_start, interval_end in new
+        )
+
+    if changed_days:
+        with transaction.atomic():
+            TimeSlot.objects.filter(id__in=to_delete).delete()
+            TimeSlot.objects.bulk_create(to_create)
+            # bulk_create skips post_save, so refresh the inventory ourselves
+            rebuild_on_commit(doctor.id, changed_days)
+
+    return changed_days
+
+
+def _booked_intervals(doctor_ids, start, end, exclude_id=None):
+    """
+    {(doctor_id, date): [(start, end), ...]} minute intervals taken by the
+    active appointments of the doctors in [start, end], one query.
+    """
+    appointments = Appointment.objects.filter(
+        doctor_id__in=doctor_ids,
+        appointment_date__range=(start, end),
+        status__in=ACTIVE_STATUSES,
+        appointment_time__isnull=False
+    )
+    if exclude_id is not None:
+        appointments = appointments.exclude(id=exclude_id)
+
+    booked = defaultdict(list)
+    for doctor_id, appointment_date, appointment_time, duration, slot_minutes in appointments.values_list(
+        'doctor_id', 'appointment_date', 'appointment_time', 'duration_minutes', 'doctor__slot_minutes'
+    ):
+        begin = slot_engine.to_minutes(appointment_time)
+        booked[(doctor_id, appointment_date)].append((begin, begin + (duration or slot_minutes)))
+    return booked
+
+
+def _held_intervals(doctor, start, end, user=None):
+    """
+    {date: [(start, end), ...]} minute intervals held by users other than
+    `user` in [start, end]. A hold covers one slot of the doctor's length.
+    """
+    held = defaultdict(list)
+    for hold_date, hold_time in held_slots(doctor.id, start, end, user).values_list('hold_date', 'hold_time'):
+        begin = slot_engine.to_minutes(hold_time)
+        held[hold_date].append((begin, begin + doctor.slot_minutes))
+    return held
+
+
+def _dates(start, end, weekdays=None):
+    days = [start + timedelta(days=offset) for offset in range((end - start).days + 1)]
+    if weekdays is not None:
+        days = [day for day in days if WEEKDAY_CODES[day.weekday()] in weekdays]
+    return days
+
+
+def _expected_slots(doctor_ids, start, end, weekdays=None):
+    """
+    Build {(doctor_id, date, minute_offset): is_booked} for the given
+    doctors and date range (only the dates on `weekdays`, when given) with
+    one TimeSlot query and one Appointment query. Each (doctor, weekday) is
+    expanded once and reused for every matching date. A slot is booked when
+    an active appointment overlaps it.
+    """
+    timeslots = TimeSlot.objects.filter(doctor_id__in=doctor_ids, is_active=True)
+    if weekdays is not None:
+        timeslots = timeslots.filter(day_of_week__in=weekdays)
+
+    windows = defaultdict(list)
+    slot_settings = {}
+    for doctor_id, day_code, start_time, end_time, slot_minutes, buffer_minutes in timeslots.values_list(
+        'doctor_id', 'day_of_week', 'start_time', 'end_time',
+        'doctor__slot_minutes', 'doctor__buffer_minutes'
+    ):
+        windows[(doctor_id, day_code)].append(
+            (slot_engine.to_minutes(start_time), slot_engine.to_minutes(end_time))
+        )
+        slot_settings[doctor_id] = (slot_minutes, buffer_minutes)
+
+    expanded = {
+        key: slot_engine.expand(day_windows, *slot_settings[key[0]])
+        for key, day_windows in windows.items()
+    }
+
+    booked = _booked_intervals(doctor_ids, start, end)
+
+    expected = {}
+    days = _dates(start, end, weekdays)
+    for doctor_id in doctor_ids:
+        for day in days:
+            starts = expanded.get((doctor_id, WEEKDAY_CODES[day.weekday()]), ())
+            if not starts:
+                continue
+            slot_minutes = slot_settings[doctor_id][0]
+            busy = booked.get((doctor_id, day), ())
+            for minutes in starts:
+                expected[(doctor_id, day, minutes)] = slot_engine.overlaps(minutes, slot_minutes, busy)
+
+    return expected
+
+
+def _chunks(ids, size=REBUILD_CHUNK_SIZE):
+    for i in range(0, len(ids), size):
+        yield ids[i:i + size]
+
+
+def rebuild_slot_inventory(doctor_ids=None, days=None):
+    """
+    Regenerate the inventory of the given doctors (all when None) from today
+    through the rolling horizon. Returns the number of rows written.
+    """
+    days = days or inventory_days()
+    start = date.today()
+    end = start + timedelta(days=days - 1)
+
+    if doctor_ids is None:
+        doctor_ids = DoctorProfile.objects.values_list('id', flat=True)
+    else:
+        doctor_ids = DoctorProfile.objects.filter(id__in=doctor_ids).values_list('id', flat=True)
+    doctor_ids = list(doctor_ids.order_by('id'))
+
+    written = 0
+    for chunk in _chunks(doctor_ids):
+        rows = [
+            SlotInventory(
+                doctor_id=doctor_id,
+                slot_date=slot_date,
+                slot_time=slot_engine.to_time(minutes),
+                is_booked=is_booked
+            )
+            for (doctor_id, slot_date, minutes), is_booked
+            in _expected_slots(chunk, start, end).items()
+        ]
+
+        with transaction.atomic():
+            SlotInventory.objects.filter(doctor_id__in=chunk).delete()
+            SlotInventory.objects.bulk_create(rows, batch_size=1000)
+            DoctorProfile.objects.filter(id__in=chunk).update(slot_inventory_until=end)
+
+        # Responses cached while the rebuild was pending are stale now
+        for doctor_id in chunk:
+            bump_version('doctor', doctor_id)
+
+        written += len(rows)
+
+    return written
+
+
+def rebuild_inventory_weekdays(doctor_id, weekdays):
+    """
+    Regenerate only the dates on `weekdays` (day codes) inside the doctor's
+    current horizon, after a TimeSlot change touching those days. Doctors
+    without a current horizon get a full rebuild. Returns the number of
+    rows written.
+    """
+    start = date.today()
+    until = DoctorProfile.objects.filter(id=doctor_id).values_list('slot_inventory_until', flat=True).first()
+    if until is None or until < start:
+        return rebuild_slot_inventory([doctor_id])
+
+    rows = [
+        SlotInventory(
+            doctor_id=doctor_id,
+            slot_date=slot_date,
+            slot_time=slot_engine.to_time(minutes),
+            is_booked=is_booked
+        )
+        for (_, slot_date, minutes), is_booked
+        in _expected_slots([doctor_id], start, until, weekdays).items()
+    ]
+    with transaction.atomic():
+        SlotInventory.objects.filter(
+            doctor_id=doctor_id,
+            slot_date__in=_dates(start, until, weekdays)
+        ).delete()
+        SlotInventory.objects.bulk_create(rows, batch_size=1000)
+
+    bump_version('doctor', doctor_id)
+    return len(rows)
+
+
+_pending = threading.local()
+
+
+def rebuild_on_commit(doctor_id, weekdays=None):
+    """
+    Rebuild the doctor's inventory once the transaction commits: only the
+    dates on `weekdays` (day codes), or the whole horizon when None. Doctors
+    queued in the same transaction (a queryset delete sends post_delete per
+    TimeSlot) are rebuilt together, once each.
+    """
+    if not hasattr(_pending, 'doctors'):
+        _pending.doctors = {}
+    if weekdays is None:
+        _pending.doctors[doctor_id] = None
+    elif _pending.doctors.get(doctor_id, ()) is not None:
+        _pending.doctors.setdefault(doctor_id, set()).update(weekdays)
+    transaction.on_commit(_rebuild_pending)
+
+
+def _rebuild_pending():
+    # The first callback of a commit takes every queued doctor, the rest
+    # find nothing left. Doctors queued in a rolled back transaction ride
+    # along with the next commit, which is only a wasted rebuild.
+    doctors, _pending.doctors = _pending.doctors, {}
+    full = sorted(doctor_id for doctor_id, weekdays in doctors.items() if weekdays is None)
+    if full:
+        rebuild_slot_inventory(full)
+    for doctor_id, weekdays in sorted(doctors.items()):
+        if weekdays is not None:
+            rebuild_inventory_weekdays(doctor_id, weekdays)
+
+
+def refresh_inventory_day(doctor_id, slot_date):
+    """
+    Re-derive the booked flags of one doctor's inventory day from
+    Appointment. An appointment blocks every slot it overlaps, so a change
+    to one can flip its neighbours too; only rows that flip are written.
+    """
+    rows = list(SlotInventory.objects.filter(
+        doctor_id=doctor_id,
+        slot_date=slot_date
+    ).values_list('id', 'slot_time', 'is_booked', 'doctor__slot_minutes'))
+    if not rows:
+        return
+
+    busy = _booked_intervals([doctor_id], slot_date, slot_date).get((doctor_id, slot_date), ())
+    flips = {True: [], False: []}
+    for row_id, slot_time, is_booked, slot_minutes in rows:
+        booked = slot_engine.overlaps(slot_engine.to_minutes(slot_time), slot_minutes, busy)
+        if booked != is_booked:
+            flips[booked].append(row_id)
+
+    for is_booked, row_ids in flips.items():
+        if row_ids:
+            SlotInventory.objects.filter(id__in=row_ids).update(is_booked=is_booked)
+
+
+def overlaps_other_booking(appointment):
+    """
+    Whether another active appointment of the doctor overlaps this one.
+    The unique constraints only catch an identical start time; the booking
+    path runs this after its insert, inside the same transaction.
+    """
+    day = appointment.appointment_date
+    busy = _booked_intervals(
+        [appointment.doctor_id], day, day, exclude_id=appointment.id
+    ).get((appointment.doctor_id, day), ())
+    return slot_engine.overlaps(
+        slot_engine.to_minutes(appointment.appointment_time),
+        appointment.duration_minutes or appointment.doctor.slot_minutes,
+        busy
+    )
+
+
+def slot_held(doctor, date_obj, time_obj, user):
+    """
+    Whether a hold by someone other than `user` overlaps the doctor's slot
+    starting at time_obj.
+    """
+    return slot_engine.overlaps(
+        slot_engine.to_minutes(time_obj),
+        doctor.slot_minutes,
+        _held_intervals(doctor, date_obj, date_obj, user).get(date_obj, ())
+    )
+
+
+def find_inventory_drift(doctor_ids=None):
+    """
+    Compare stored inventory with what TimeSlot/Appointment imply.
+    Returns {doctor_id: {'missing': n, 'extra': n, 'wrong_booked': n}}
+    for every doctor whose inventory is out of date.
+    """
+    start = date.today()
+    doctors = DoctorProfile.objects.filter(slot_inventory_until__gte=start)
+    if doctor_ids is not None:
+        doctors = doctors.filter(id__in=doctor_ids)
+
+    drift = {}
+    for doctor_id, until in doctors.values_list('id', 'slot_inventory_until').order_by('id'):
+        expected = _expected_slots([doctor_id], start, until)
+        stored = {
+            (doctor_id, slot_date, slot_engine.to_minutes(slot_time)): is_booked
+            for slot_date, slot_time, is_booked in SlotInventory.objects.filter(
+                doctor_id=doctor_id,
+                slot_date__range=(start, until)
+            ).values_list('slot_date', 'slot_time', 'is_booked')
+        }
+
+        missing = len(expected.keys() - stored.keys())
+        extra = len(stored.keys() - expected.keys())
+        wrong_booked = sum(
+            1 for key in expected.keys() & stored.keys()
+            if expected[key] != stored[key]
+        )
+
+        if missing or extra or wrong_booked:
+            drift[doctor_id] = {
+                'missing': missing,
+                'extra': extra,
+                'wrong_booked': wrong_booked,
+            }
+
+    return drift
+
+
+def past_cutoff(date_obj):
+    """
+    Minute of the day up to which `date_obj` has passed: the current minute
+    today, -1 for later dates. Starts at or before it are not offered, as in
+    earliest_open_slots().
+    """
+    now = datetime.now()
+    if date_obj != now.date():
+        return -1
+    return now.hour * 60 + now.minute
+
+
+def compute_available_times(doctor, date_obj):
+    """
+    Live computation straight from TimeSlot and Appointment, used for dates
+    outside the doctor's inventory horizon.
+    """
+    windows = TimeSlot.objects.filter(
+        doctor=doctor,
+        day_of_week=WEEKDAY_CODES[date_obj.weekday()],
+        is_active=True
+    ).values_list('start_time', 'end_time')
+
+    starts = slot_engine.expand_times(windows, doctor.slot_minutes, doctor.buffer_minutes)
+    if not starts:
+        return []
+
+    booked = _booked_intervals([doctor.id], date_obj, date_obj).get((doctor.id, date_obj), ())
+
+    return [
+        minutes for minutes in starts
+        if not slot_engine.overlaps(minutes, doctor.slot_minutes, booked)
+    ]
+
+
+def available_times(doctor, date_obj, user=None):
+    """
+    Free slot start times (minute offsets) for a doctor on a date, minus
+    slots held by other users. Dates inside the precomputed horizon are a
+    single indexed read of SlotInventory.
+    """
+    until = doctor.slot_inventory_until
+    if until and date.today() <= date_obj <= until:
+        starts = [
+            slot_engine.to_minutes(slot_time)
+            for slot_time in SlotInventory.objects.filter(
+                doctor=doctor,
+                slot_date=date_obj,
+                is_booked=False
+            ).order_by('slot_time').values_list('slot_time', flat=True)
+        ]
+    else:
+        starts = compute_available_times(doctor, date_obj)
+
+    cutoff = past_cutoff(date_obj)
+    starts = [minutes for minutes in starts if minutes > cutoff]
+    if not starts:
+        return starts
+
+    held = _held_intervals(doctor, date_obj, date_obj, user).get(date_obj, ())
+    return [
+        minutes for minutes in starts
+        if not slot_engine.overlaps(minutes, doctor.slot_minutes, held)
+    ]
+
+
+async def aavailable_times(doctor, date_obj, user=None):
+    """
+    available_times() on the async ORM, for the async lookup views. Dates
+    past the inventory horizon still take the sync live computation.
+    """
+    until = doctor.slot_inventory_until
+    if until and date.today() <= date_obj <= until:
+        starts = [
+            slot_engine.to_minutes(slot_time)
+            async for slot_time in SlotInventory.objects.filter(
+                doctor=doctor,
+                slot_date=date_obj,
+                is_booked=False
+            ).order_by('slot_time').values_list('slot_time', flat=True)
+        ]
+    else:
+        starts = await sync_to_async(compute_available_times)(doctor, date_obj)
+
+    cutoff = past_cutoff(date_obj)
+    starts = [minutes for minutes in starts if minutes > cutoff]
+    if not starts:
+        return starts
+
+    held = []
+    async for hold_time in held_slots(doctor.id, date_obj, date_obj, user).values_list('hold_time', flat=True):
+        begin = slot_engine.to_minutes(hold_time)
+        held.append((begin, begin + doctor.slot_minutes))
+    return [
+        minutes for minutes in starts
+        if not slot_engine.overlaps(minutes, doctor.slot_minutes, held)
+    ]
+
+
+# -------------------------------------------------
+# Slot holds
+# -------------------------------------------------
+
+def held_slots(doctor_id, start, end, user=None):
+    """
+    Unexpired holds on a doctor's slots in [start, end], excluding the
+    requesting user's own hold.
+    """
+    holds = SlotHold.objects.filter(
+        doctor_id=doctor_id,
+        hold_date__range=(start, end),
+        expires_at__gt=timezone.now()
+    )
+    if user is not None:
+        holds = holds.exclude(user=user)
+    return holds
+
+
+def _hold_expiry_key(doctor_id, version):
+    return f"holds:{doctor_id}:{version}"
+
+
+def _hold_expiries(doctor_id):
+    return SlotHold.objects.filter(
+        doctor_id=doctor_id,
+        expires_at__gt=timezone.now()
+    ).order_by('expires_at').values_list('expires_at', flat=True)
+
+
+def next_hold_expiry(doctor_id, version):
+    """
+    Epoch seconds at which the doctor's earliest unexpired hold lapses, or 0.
+    Availability ETags include it: a lapsing hold frees its slot without any
+    write, so no version bump. Cached under the doctor's version, so only
+    the first call after a change or a lapse queries.
+    """
+    key = _hold_expiry_key(doctor_id, version)
+    expiry = cache.get(key)
+    if expiry is None or 0 < expiry <= time.time():
+        first = _hold_expiries(doctor_id).first()
+        expiry = first.timestamp() if first else 0
+        cache.set(key, expiry, RESPONSE_TTL)
+    return expiry
+
+
+async def anext_hold_expiry(doctor_id, version):
+    """
+    next_hold_expiry() on the async ORM and cache API.
+    """
+    key = _hold_expiry_key(doctor_id, version)
+    expiry = await cache.aget(key)
+    if expiry is None or 0 < expiry <= time.time():
+        first = await _hold_expiries(doctor_id).afirst()
+        expiry = first.timestamp() if first else 0
+        await cache.aset(key, expiry, RESPONSE_TTL)
+    return expiry
+
+
+def hold_slot(doctor, date_obj, time_obj, user):
+    """
+    Reserve a free slot for `user` for SLOT_HOLD_SECONDS, replacing any other
+    hold the user has. Re-holding the same slot extends it. Returns the hold,
+    or None when the slot is booked or held by someone else.
+    """
+    if slot_engine.to_minutes(time_obj) not in available_times(doctor, date_obj, user):
+        return None
+
+    now = timezone.now()
+    expires_at = now + timedelta(seconds=hold_seconds())
+
+    with transaction.atomic():
+        # A lapsed hold by someone else must not block the insert
+        SlotHold.objects.filter(
+            doctor=doctor,
+            hold_date=date_obj,
+            hold_time=time_obj,
+            expires_at__lte=now
+        ).delete()
+        # One hold per user at a time
+        SlotHold.objects.filter(user=user).exclude(
+            doctor=doctor,
+            hold_date=date_obj,
+            hold_time=time_obj
+        ).delete()
+
+        hold, created = SlotHold.objects.get_or_create(
+            doctor=doctor,
+            hold_date=date_obj,
+            hold_time=time_obj,
+            defaults={'user': user, 'expires_at': expires_at}
+        )
+
+    if not created:
+        if hold.user_id != user.id:
+            return None
+        hold.expires_at = expires_at
+        hold.save(update_fields=['expires_at'])
+
+    return hold
+
+
+def sweep_expired_holds():
+    """
+    Bulk-delete lapsed holds. Returns the number of rows removed.
+    """
+    deleted, _ = SlotHold.objects.filter(expires_at__lte=timezone.now()).delete()
+    return deleted
+
+
+def bitmap_cell_minutes(starts, slot_minutes):
+    """
+    Largest cell size (minutes) that puts every slot start exactly on a cell
+    boundary: the slot length for the usual on-the-hour/half-hour windows.
+    """
+    cell_minutes = slot_minutes
+    for minutes in starts:
+        cell_minutes = gcd(cell_minutes, minutes)
+    return cell_minutes
+
+
+def encode_day_bitmap(starts, cell_minutes):
+    """
+    Encode free slot start offsets of one day as a hex bitmap of
+    cell_minutes cells, most significant bit first (cell 0 = 00:00).
+    """
+    cells = -(-slot_engine.MINUTES_PER_DAY // cell_minutes)
+    width = -(-cells // 4)
+    bits = 0
+    for minutes in starts:
+        bits |= 1 << (width * 4 - 1 - minutes // cell_minutes)
+
+    return format(bits, f'0{width}x')
+
+
+def availability_bitmaps(doctor, start, end, user=None):
+    """
+    Free-slot bitmaps for every day in [start, end], built from one TimeSlot
+    query and one Appointment query for the whole window (plus one for holds).
+    Returns (cell_minutes, {iso_date: hex_bitmap}).
+    """
+    held = _held_intervals(doctor, start, end, user)
+    today_cutoff = past_cutoff(start)
+
+    free = defaultdict(list)
+    for (_, slot_date, minutes), is_booked in _expected_slots([doctor.id], start, end).items():
+        if slot_date == start and minutes <= today_cutoff:
+            continue
+        if not is_booked and not slot_engine.overlaps(minutes, doctor.slot_minutes, held.get(slot_date, ())):
+            free[slot_date].append(minutes)
+
+    cell_minutes = bitmap_cell_minutes(
+        (minutes for starts in free.values() for minutes in starts),
+        doctor.slot_minutes + doctor.buffer_minutes
+    )
+
+    bitmaps = {}
+    day = start
+    while day <= end:
+        bitmaps[day.isoformat()] = encode_day_bitmap(free.get(day, ()), cell_minutes)
+        day += timedelta(days=1)
+
+    return cell_minutes, bitmaps
+
+
+def earliest_open_slots(specialization, start=None, end=None, limit=5):
+    """
+    The `limit` soonest free (doctor, date, time) inventory rows across the
+    approved, available doctors of a specialization. Walks the partial
+    open-slot index in date/time order and stops after `limit` matches.
+    Only dates inside each doctor's inventory horizon are considered.
+    Slots overlapping a hold are skipped; each hold blocks a slot or two,
+    so the first page normally suffices.
+    """
+    today = date.today()
+    start = max(start or today, today)
+
+    slots = SlotInventory.objects.filter(
+        doctor__specialization=specialization,
+        doctor__is_approved=True,
+        doctor__is_available=True,
+        is_booked=False,
+        slot_date__gte=start
+    )
+    if end:
+        slots = slots.filter(slot_date__lte=end)
+    if start == today:
+        cutoff = past_cutoff(today)
+        slots = slots.filter(Q(slot_date__gt=today) | Q(slot_time__gt=slot_engine.to_time(cutoff)))
+
+    held = defaultdict(list)
+    for doctor_id, hold_date, hold_time, slot_minutes in SlotHold.objects.filter(
+        doctor__specialization=specialization,
+        hold_date__gte=start,
+        expires_at__gt=timezone.now()
+    ).values_list('doctor_id', 'hold_date', 'hold_time', 'doctor__slot_minutes'):
+        begin = slot_engine.to_minutes(hold_time)
+        held[(doctor_id, hold_date)].append((begin, begin + slot_minutes))
+
+    limit = min(limit, MAX_EARLIEST_RESULTS)
+    page_size = limit + 2 * sum(len(intervals) for intervals in held.values())
+    slots = slots.select_related('doctor__user').order_by('slot_date', 'slot_time', 'doctor_id')
+
+    found = []
+    offset = 0
+    while True:
+        page = list(slots[offset:offset + page_size])
+        found.extend(
+            slot for slot in page
+            if not slot_engine.overlaps(
+                slot_engine.to_minutes(slot.slot_time),
+                slot.doctor.slot_minutes,
+                held.get((slot.doctor_id, slot.slot_date), ())
+            )
+        )
+        if len(found) >= limit or len(page) < page_size:
+            return found[:limit]
+        offset += page_size
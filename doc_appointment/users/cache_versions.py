@@ -0,0 +1,98 @@
+"""
+Version counters for cached responses.
+
+Each scope ("doctor", "specialization", ...) keeps an integer per key in the
+Django cache. Signals bump the counter when a change is made; responses
+derive their ETag and server-side cache key from it, so a bump invalidates
+both at once. The time of the last bump is kept next to the counter for
+Last-Modified headers.
+
+Counters start from the clock instead of 1, so one that was evicted comes
+back higher than any value it had and can never match a response cached
+under an old version. Every process must see the same counters: settings
+configure Redis (REDIS_URL) for anything beyond a single process.
+"""
+import hashlib
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+
+# Seconds cached response bodies are kept
+RESPONSE_TTL = 60
+
+
+def _version_key(scope, ident):
+    return f"version:{scope}:{ident}"
+
+
+def _modified_key(scope, ident):
+    return f"version:{scope}:{ident}:modified"
+
+
+def _initial_version():
+    # Milliseconds: ahead of any count of bumps a key could have had
+    return time.time_ns() // 1_000_000
+
+
+def get_version(scope, ident):
+    return cache.get_or_set(_version_key(scope, ident), _initial_version, timeout=None)
+
+
+async def aget_version(scope, ident):
+    return await cache.aget_or_set(_version_key(scope, ident), _initial_version, timeout=None)
+
+
+def get_versions(scope, idents):
+    """
+    Versions for several keys of one scope in a single cache round trip
+    (plus one per key missing from the cache).
+    """
+    keys = [_version_key(scope, ident) for ident in idents]
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            found[key] = cache.get_or_set(key, _initial_version, timeout=None)
+    return tuple(found[key] for key in keys)
+
+
+def bump_version(scope, ident):
+    key = _version_key(scope, ident)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Evicted or never read: any fresh start is a new version
+        cache.add(key, _initial_version(), timeout=None)
+    cache.set(_modified_key(scope, ident), time.time(), timeout=None)
+
+
+def last_modified(scope, idents):
+    """
+    Epoch seconds of the latest bump among the keys. Keys never bumped (or
+    evicted) count as modified now, and remember it.
+    """
+    keys = [_modified_key(scope, ident) for ident in idents]
+    found = cache.get_many(keys)
+    missing = {key: time.time() for key in keys if key not in found}
+    if missing:
+        cache.set_many(missing, timeout=None)
+        found.update(missing)
+    return int(max(found.values()))
+
+
+def bump_on_commit(scope, ident):
+    """
+    Bump now, and again once the transaction commits so that anything cached
+    from a read taken before the commit is discarded as well.
+    """
+    bump_version(scope, ident)
+    transaction.on_commit(lambda: bump_version(scope, ident))
+
+
+def response_etag(*parts):
+    """
+    Opaque ETag for a response built from `parts`.
+    """
+    raw = ':'.join(str(part) for part in parts)
+    return hashlib.md5(raw.encode()).hexdigest()
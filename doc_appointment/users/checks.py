@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+
+@register(Tags.caches, deploy=True)
+def shared_cache_check(app_configs, **kwargs):
+    """
+    Response caches are invalidated through version counters in the cache
+    (users/cache_versions.py), which only works if every worker shares it.
+    """
+    backend = settings.CACHES['default']['BACKEND']
+    if backend.endswith(('LocMemCache', 'DummyCache')):
+        return [Warning(
+            "The default cache is private to each process, so cached "
+            "responses are not invalidated across workers.",
+            hint="Set REDIS_URL to use a shared Redis cache.",
+            id='users.W001',
+        )]
+    return []
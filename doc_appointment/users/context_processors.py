@@ -0,0 +1,11 @@
+from django.utils.functional import SimpleLazyObject
+
+from users.inbox_counters import unread_counts
+
+
+def inbox(request):
+    """
+    Unread counts of the signed-in admin or doctor as `inbox`. Lazy, so only
+    pages that show a count pay for its primary-key lookup.
+    """
+    return {'inbox': SimpleLazyObject(lambda: unread_counts(request.user))}
@@ -0,0 +1,57 @@
+"""
+Denormalized totals for the admin dashboard.
+
+Each counter is a DashboardCounter row adjusted with an F() expression by
+the signals in users/signals.py, inside the writer's transaction, so the
+dashboard renders from a single SELECT. Bulk `QuerySet.update()` calls skip
+signals; `reconcile_counters()` (run periodically through the
+reconcile_dashboard_counters command) recounts and repairs any drift.
+"""
+from django.db.models import F
+
+from users.models import Appointment, DashboardCounter, DoctorProfile, PatientProfile
+
+
+# Counter name -> queryset whose count() is the true value
+COUNTERS = {
+    'doctors': lambda: DoctorProfile.objects.all(),
+    'available_doctors': lambda: DoctorProfile.objects.filter(is_available=True),
+    'pending_doctors': lambda: DoctorProfile.objects.filter(is_approved=False),
+    'patients': lambda: PatientProfile.objects.all(),
+    'appointments': lambda: Appointment.objects.all(),
+}
+
+
+def adjust(name, delta):
+    if not delta:
+        return
+    updated = DashboardCounter.objects.filter(name=name).update(value=F('value') + delta)
+    if not updated:
+        # Row missing (fresh table): seed it from the real count instead
+        DashboardCounter.objects.get_or_create(
+            name=name, defaults={'value': COUNTERS[name]().count()}
+        )
+
+
+def read_counters():
+    """
+    All counters in one query; missing rows read as 0.
+    """
+    values = dict.fromkeys(COUNTERS, 0)
+    values.update(DashboardCounter.objects.values_list('name', 'value'))
+    return values
+
+
+def reconcile_counters():
+    """
+    Recount every counter and fix the stored value where it drifted.
+    Returns {name: (stored, actual)} for the counters that were corrected.
+    """
+    stored = read_counters()
+    corrected = {}
+    for name, queryset in COUNTERS.items():
+        actual = queryset().count()
+        if stored[name] != actual:
+            DashboardCounter.objects.update_or_create(name=name, defaults={'value': actual})
+            corrected[name] = (stored[name], actual)
+    return corrected
@@ -0,0 +1,118 @@
+"""
+Resized JPEG and WebP copies of doctor profile pictures for `srcset`.
+
+Each variant is stored beside the original in the same storage, named
+after it: doctor_pics/ada.jpg -> doctor_pics/ada.320w.jpg and
+doctor_pics/ada.320w.webp. They are made when a picture is uploaded
+(doctor_register, edit_doctor_profile) and by the
+make_doctor_photo_variants backfill command; replacing a picture deletes
+the old one's variants. Templates read them through
+DoctorProfile.photo and fall back to the original until they exist.
+"""
+import os
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+
+# Widths of the generated variants; pictures are never scaled up
+VARIANT_WIDTHS = (160, 320, 640)
+
+# srcset format -> (file extension, Pillow format, save options)
+FORMATS = {
+    'jpeg': ('jpg', 'JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+    'webp': ('webp', 'WEBP', {'quality': 80, 'method': 4}),
+}
+
+# Variant used for plain `src`
+DEFAULT_WIDTH = 320
+
+
+def variant_name(name, width, fmt):
+    stem, _ = os.path.splitext(name)
+    return f"{stem}.{width}w.{FORMATS[fmt][0]}"
+
+
+def has_variants(field_file):
+    # The largest WebP is written last
+    return field_file.storage.exists(variant_name(field_file.name, VARIANT_WIDTHS[-1], 'webp'))
+
+
+def make_variants(field_file, force=False):
+    """
+    Write every width and format of the picture in `field_file`. Returns
+    the number of files written: 0 if the variants already exist (unless
+    `force`), or if the original is missing or not an image.
+    """
+    if not field_file or (not force and has_variants(field_file)):
+        return 0
+
+    storage = field_file.storage
+    try:
+        with storage.open(field_file.name, 'rb') as f:
+            original = Image.open(f)
+            original.load()
+    except (FileNotFoundError, UnidentifiedImageError):
+        return 0
+
+    image = ImageOps.exif_transpose(original)
+    if image.mode != 'RGB':
+        # JPEG has no alpha; flatten transparent pictures onto white
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.convert('RGBA').getchannel('A'))
+        image = background
+
+    written = 0
+    for width in VARIANT_WIDTHS:
+        resized = image
+        if image.width > width:
+            resized = image.resize((width, round(image.height * width / image.width)), Image.LANCZOS)
+        for fmt, (_, pillow_format, options) in FORMATS.items():
+            out = BytesIO()
+            resized.save(out, pillow_format, **options)
+            name = variant_name(field_file.name, width, fmt)
+            if storage.exists(name):
+                storage.delete(name)
+            storage.save(name, ContentFile(out.getvalue()))
+            written += 1
+    return written
+
+
+def delete_variants(field_file):
+    """
+    Remove the variants of the picture in `field_file`, leaving the
+    original. Returns the number of files deleted.
+    """
+    if not field_file:
+        return 0
+
+    storage = field_file.storage
+    deleted = 0
+    for width in VARIANT_WIDTHS:
+        for fmt in FORMATS:
+            name = variant_name(field_file.name, width, fmt)
+            if storage.exists(name):
+                storage.delete(name)
+                deleted += 1
+    return deleted
+
+
+def variants(field_file):
+    """
+    {'src': url, 'jpeg': srcset, 'webp': srcset} for a picture whose
+    variants exist, else None.
+    """
+    if not field_file or not has_variants(field_file):
+        return None
+
+    storage = field_file.storage
+    photo = {
+        fmt: ', '.join(
+            f"{storage.url(variant_name(field_file.name, width, fmt))} {width}w"
+            for width in VARIANT_WIDTHS
+        )
+        for fmt in FORMATS
+    }
+    photo['src'] = storage.url(variant_name(field_file.name, DEFAULT_WIDTH, 'jpeg'))
+    return photo
@@ -0,0 +1,245 @@
+"""
+Live updates for open admin and doctor pages over Server-Sent Events.
+
+Signals publish small JSON events to a channel ("doctor:<profile id>" or
+"admins") once the writing transaction commits; each open page holds one
+subscription through an async SSE view and receives the events as they
+happen instead of polling. Payloads are built only when the channel has
+subscribers, so writes cost nothing while nobody is listening.
+
+The broker lives in the memory of the ASGI process: no external service
+is needed, but a page only hears about writes made by the process it is
+connected to, so run a single ASGI worker (or put a shared broker behind
+`publish()`) when it matters; README.md shows the uvicorn command. Under
+WSGI the stream views answer 204 and browsers stop reconnecting.
+"""
+import asyncio
+import itertools
+import json
+import threading
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateformat import format as format_date
+
+from users.models import Appointment, DoctorMessage, InboxCounter, MessageThread
+
+
+# A comment line this often keeps proxies from timing the stream out
+HEARTBEAT_SECONDS = 15
+# Events queued for one slow page before further ones are dropped for it
+QUEUE_SIZE = 100
+# Browser reconnect delay after a dropped connection, in milliseconds
+RETRY_MS = 5000
+
+
+ADMIN_CHANNEL = 'admins'
+
+
+def doctor_channel(doctor_id):
+    return f"doctor:{doctor_id}"
+
+
+def format_event(event_id, event_type, data):
+    payload = json.dumps(data, cls=DjangoJSONEncoder, separators=(',', ':'))
+    return f"id: {event_id}\nevent: {event_type}\ndata: {payload}\n\n"
+
+
+def _offer(queue, message):
+    try:
+        queue.put_nowait(message)
+    except asyncio.QueueFull:
+        # The page fell behind; it catches up on its next full load
+        pass
+
+
+class Broker:
+    """
+    Channel -> subscriber queues. subscribe() is called from the event loop
+    of the ASGI server; publish() from any thread, usually a sync view's.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+        self._ids = itertools.count(1)
+
+    def subscribe(self, channel):
+        queue = asyncio.Queue(QUEUE_SIZE)
+        with self._lock:
+            self._subscribers.setdefault(channel, set()).add((asyncio.get_running_loop(), queue))
+        return queue
+
+    def unsubscribe(self, channel, queue):
+        with self._lock:
+            subscribers = self._subscribers.get(channel, set())
+            subscribers.difference_update({s for s in subscribers if s[1] is queue})
+            if not subscribers:
+                self._subscribers.pop(channel, None)
+
+    def has_subscribers(self, channel):
+        return channel in self._subscribers
+
+    def publish(self, channel, event_type, data):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        if not subscribers:
+            return
+
+        message = format_event(next(self._ids), event_type, data)
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(_offer, queue, message)
+            except RuntimeError:
+                # Loop already closed: the connection is gone
+                self.unsubscribe(channel, queue)
+
+
+broker = Broker()
+
+
+def publish_on_commit(channels, event_type, build):
+    """
+    After the current transaction commits, publish `build()` to those of
+    `channels` that have subscribers. `build` runs at most once.
+    """
+    def send():
+        listening = [channel for channel in channels if broker.has_subscribers(channel)]
+        if not listening:
+            return
+        data = build()
+        if data is None:
+            return
+        for channel in listening:
+            broker.publish(channel, event_type, data)
+
+    transaction.on_commit(send)
+
+
+# -------------------------------------------------
+# Payloads (built after commit, from the committed rows)
+# -------------------------------------------------
+
+def _display_time(value):
+    return format_date(timezone.localtime(value), 'd M Y H:i')
+
+
+def appointment_payload(appointment_id):
+    appointment = Appointment.objects.select_related('patient__user').filter(id=appointment_id).first()
+    if appointment is None:
+        return None
+    patient = appointment.patient
+    return {
+        'id': appointment.id,
+        'date': appointment.appointment_date,
+        'time': appointment.appointment_time.strftime('%H:%M'),
+        'status': appointment.status,
+        'status_display': appointment.get_status_display(),
+        'reason': appointment.reason or '',
+        'patient_id': patient.id,
+        'patient': f"{patient.user.first_name} {patient.user.last_name}".strip(),
+        'gender': patient.get_gender_display(),
+    }
+
+
+def _inbox_total(doctor_id, side):
+    if side == 'doctor':
+        counters = InboxCounter.objects.filter(user__doctorprofile__id=doctor_id)
+    else:
+        # Admins share one inbox, so any admin row will do
+        counters = InboxCounter.objects.filter(user__role='admin')
+    return counters.values_list('unread_messages', flat=True).first() or 0
+
+
+def thread_payload(thread_id, doctor_id, side, message_id=None):
+    """
+    Thread summary and inbox total as seen by `side` ('doctor' or 'admin'),
+    plus the message itself when `message_id` is given. A deleted thread
+    comes back as its id with `deleted` set.
+    """
+    inbox = _inbox_total(doctor_id, side)
+    thread = MessageThread.objects.select_related('doctor__user', 'last_message__sender').filter(id=thread_id).first()
+    if thread is None:
+        return {'thread_id': thread_id, 'deleted': True, 'inbox': inbox}
+
+    last = thread.last_message
+    data = {
+        'thread_id': thread.id,
+        'doctor': thread.doctor.user.get_full_name(),
+        'subject': thread.subject,
+        'message_count': thread.message_count,
+        f'{side}_unread': getattr(thread, f'{side}_unread'),
+        'last_activity': _display_time(thread.last_activity),
+        'last_message': last.message if last else '',
+        'last_from_doctor': bool(last and last.sender and last.sender.role == 'doctor'),
+        'inbox': inbox,
+    }
+    if message_id is not None:
+        message = DoctorMessage.objects.select_related('sender').filter(id=message_id).first()
+        if message is not None:
+            data['message'] = {
+                'id': message.id,
+                'subject': message.subject,
+                'text': message.message,
+                'from_doctor': bool(message.sender and message.sender.role == 'doctor'),
+                'sender': message.sender.get_username() if message.sender else '',
+                'created_at': _display_time(message.created_at),
+            }
+    return data
+
+
+def appointment_changed(appointment):
+    publish_on_commit(
+        [doctor_channel(appointment.doctor_id)],
+        'appointment',
+        lambda: appointment_payload(appointment.id)
+    )
+
+
+def thread_changed(thread_id, doctor_id, message_id=None):
+    """
+    Publish a thread's new state to its doctor and to the admins, each with
+    their own unread counts. Also used after deletes: the payload then says
+    the thread is gone, or carries its counts without the removed message.
+    """
+    event_type = 'message' if message_id is not None else 'thread'
+    for channel, side in ((doctor_channel(doctor_id), 'doctor'), (ADMIN_CHANNEL, 'admin')):
+        publish_on_commit(
+            [channel],
+            event_type,
+            lambda side=side: thread_payload(thread_id, doctor_id, side, message_id)
+        )
+
+
+# -------------------------------------------------
+# Streaming
+# -------------------------------------------------
+
+async def event_stream(channel):
+    queue = broker.subscribe(channel)
+    try:
+        yield f"retry: {RETRY_MS}\n\n"
+        while True:
+            try:
+                yield await asyncio.wait_for(queue.get(), HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+    finally:
+        broker.unsubscribe(channel, queue)
+
+
+def event_stream_response(request, channel):
+    """
+    SSE response streaming `channel` for as long as the page stays open.
+    """
+    if 'wsgi.version' in request.META:
+        # A WSGI worker would buffer the endless stream; 204 tells the
+        # browser not to reconnect
+        return HttpResponse(status=204)
+
+    response = StreamingHttpResponse(event_stream(channel), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -17,4 +17,11 @@ class DoctorMessageForm(forms.ModelForm):
             'doctor': forms.Select(attrs={'class': 'form-control'}),
             'subject': forms.TextInput(attrs={'class': 'form-control'}),
             'message': forms.Textarea(attrs={'class': 'form-control', 'rows': 5}),
-        }
\ No newline at end of file
+        }
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Option labels use DoctorProfile.__str__, which reads the user
+        self.fields['doctor'].queryset = DoctorProfile.objects.select_related('user')
+        # Every message opens a thread with one doctor
+        self.fields['doctor'].required = True
@@ -0,0 +1,170 @@
+"""
+Denormalized unread counts for the admin and doctor inboxes.
+
+A DoctorMessage sent by a doctor is addressed to the admins; any other
+message with a doctor set is addressed to that doctor. Patient Feedback is
+addressed to the admins. Every recipient has an InboxCounter row, and every
+MessageThread an unread count per side, adjusted with F() expressions
+inside the writer's transaction: by the signals in users/signals.py on
+create/delete, and by mark_message_read() / mark_thread_read() /
+mark_feedback_read(), which flip is_read with a conditional UPDATE so two
+admins reading the same message only decrement once.
+
+The panels read the counts through users.context_processors.inbox, a single
+primary-key lookup. `reconcile_inbox_counters()` repairs drift left by bulk
+updates, which skip signals.
+"""
+from django.db import transaction
+from django.db.models import F
+
+from users.events import thread_changed
+from users.models import DoctorMessage, Feedback, InboxCounter, MessageThread, User
+
+
+# Roles that have an inbox
+COUNTED_ROLES = ('admin', 'doctor')
+
+
+def admin_inbox():
+    return DoctorMessage.objects.filter(sender__role='doctor')
+
+
+def doctor_inbox(user):
+    return DoctorMessage.objects.filter(doctor__user=user).exclude(sender__role='doctor')
+
+
+def actual_counts(user):
+    """
+    (unread_messages, unread_feedback) recounted from the message tables.
+    """
+    if user.role == 'admin':
+        return (
+            admin_inbox().filter(is_read=False).count(),
+            Feedback.objects.filter(is_read=False).count(),
+        )
+    if user.role == 'doctor':
+        return doctor_inbox(user).filter(is_read=False).count(), 0
+    return 0, 0
+
+
+def addressed_to_admin(message):
+    return message.sender is not None and message.sender.role == 'doctor'
+
+
+def _adjust_unread(to_admin, doctor_id, thread_id, delta):
+    if not delta:
+        return
+    if to_admin:
+        counters = InboxCounter.objects.filter(user__role='admin')
+        thread_field = 'admin_unread'
+    elif doctor_id is not None:
+        counters = InboxCounter.objects.filter(user__doctorprofile__id=doctor_id)
+        thread_field = 'doctor_unread'
+    else:
+        return
+
+    counters.update(unread_messages=F('unread_messages') + delta)
+    if thread_id is not None:
+        MessageThread.objects.filter(pk=thread_id).update(**{thread_field: F(thread_field) + delta})
+
+
+def adjust_messages(message, delta):
+    _adjust_unread(addressed_to_admin(message), message.doctor_id, message.thread_id, delta)
+
+
+def adjust_feedback(delta):
+    if delta:
+        InboxCounter.objects.filter(user__role='admin').update(
+            unread_feedback=F('unread_feedback') + delta
+        )
+
+
+def mark_message_read(message):
+    """
+    Mark `message` read; returns False when it already was.
+    """
+    with transaction.atomic():
+        updated = DoctorMessage.objects.filter(pk=message.pk, is_read=False).update(is_read=True)
+        adjust_messages(message, -updated)
+        if updated and message.thread_id is not None:
+            thread_changed(message.thread_id, message.doctor_id)
+    message.is_read = True
+    return bool(updated)
+
+
+def mark_thread_read(thread, user):
+    """
+    Mark the messages of `thread` addressed to `user` read; returns how many
+    were unread. Free when the thread has nothing unread for that side.
+    """
+    to_admin = user.role == 'admin'
+    field = 'admin_unread' if to_admin else 'doctor_unread'
+    if not getattr(thread, field):
+        return 0
+
+    unread = DoctorMessage.objects.filter(thread=thread, is_read=False)
+    if to_admin:
+        unread = unread.filter(sender__role='doctor')
+    else:
+        unread = unread.exclude(sender__role='doctor')
+
+    with transaction.atomic():
+        updated = unread.update(is_read=True)
+        _adjust_unread(to_admin, thread.doctor_id, thread.pk, -updated)
+        if updated:
+            thread_changed(thread.pk, thread.doctor_id)
+    setattr(thread, field, getattr(thread, field) - updated)
+    return updated
+
+
+def mark_feedback_read(feedback):
+    """
+    Mark `feedback` read; returns False when it already was.
+    """
+    with transaction.atomic():
+        updated = Feedback.objects.filter(pk=feedback.pk, is_read=False).update(is_read=True)
+        adjust_feedback(-updated)
+    feedback.is_read = True
+    return bool(updated)
+
+
+def unread_counts(user):
+    """
+    {'unread_messages': n, 'unread_feedback': n} for `user`, in one
+    primary-key lookup. A missing row is seeded from the real counts.
+    """
+    if not user.is_authenticated or user.role not in COUNTED_ROLES:
+        return {'unread_messages': 0, 'unread_feedback': 0}
+
+    counts = InboxCounter.objects.filter(pk=user.pk).values(
+        'unread_messages', 'unread_feedback'
+    ).first()
+    if counts is None:
+        messages, feedback = actual_counts(user)
+        InboxCounter.objects.get_or_create(
+            user=user,
+            defaults={'unread_messages': messages, 'unread_feedback': feedback}
+        )
+        counts = {'unread_messages': messages, 'unread_feedback': feedback}
+    return counts
+
+
+def reconcile_inbox_counters():
+    """
+    Recount every admin and doctor inbox and fix drifted rows.
+    Returns {username: (stored, actual)} for the rows that were corrected.
+    """
+    stored = {
+        row.user_id: (row.unread_messages, row.unread_feedback)
+        for row in InboxCounter.objects.all()
+    }
+    corrected = {}
+    for user in User.objects.filter(role__in=COUNTED_ROLES):
+        actual = actual_counts(user)
+        if stored.get(user.pk) != actual:
+            InboxCounter.objects.update_or_create(
+                user=user,
+                defaults={'unread_messages': actual[0], 'unread_feedback': actual[1]}
+            )
+            corrected[user.username] = (stored.get(user.pk), actual)
+    return corrected
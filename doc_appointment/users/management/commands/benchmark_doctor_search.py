@@ -0,0 +1,124 @@
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.urls import reverse
+
+from users.models import DoctorProfile, User
+from users.search import rebuild_search_index
+
+
+FIRST_NAMES = (
+    'Aisha', 'Arjun', 'Beatriz', 'Chen', 'Daniel', 'Elena', 'Farah', 'Gabriel', 'Hana', 'Ibrahim',
+    'Jasmine', 'Kiran', 'Lucia', 'Mohammed', 'Nadia', 'Omar', 'Priya', 'Rahul', 'Sara', 'Thomas',
+)
+LAST_NAMES = (
+    'Ahmed', 'Bose', 'Castro', 'Das', 'Evans', 'Fernandes', 'Gupta', 'Haddad', 'Iyer', 'Joseph',
+    'Khan', 'Lopez', 'Menon', 'Nair', 'Okafor', 'Pillai', 'Qureshi', 'Rao', 'Silva', 'Thomas',
+)
+QUALIFICATIONS = ('MBBS', 'MD', 'MS', 'DNB', 'BDS', 'MDS', 'DGO', 'DCH', 'FRCS', 'MRCP')
+BIO_WORDS = (
+    'experienced', 'compassionate', 'surgery', 'children', 'women', 'fracture', 'hearing', 'vision',
+    'dental', 'implants', 'cataract', 'sinus', 'spine', 'knee', 'pregnancy', 'vaccination', 'allergy',
+    'diabetes', 'hospital', 'clinic', 'research', 'emergency', 'laser', 'sports', 'injury', 'care',
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Time typeahead requests to the search_doctors view against a "
+        "throwaway SQLite database filled with synthetic doctors."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--doctors', type=int, default=50000)
+        parser.add_argument('--queries', type=int, default=1000)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument(
+            '--max-p95-ms', type=float, default=10.0,
+            help="Fail when the 95th percentile request time exceeds this."
+        )
+
+    def handle(self, *args, **options):
+        setup_test_environment(debug=False)
+        with tempfile.TemporaryDirectory() as tmp:
+            # A database of its own: the default test database name would
+            # clobber a test run going on at the same time
+            connection.settings_dict['TEST']['NAME'] = os.path.join(tmp, 'benchmark.sqlite3')
+            old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+            try:
+                self.run_benchmark(options)
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+                teardown_test_environment()
+
+    def run_benchmark(self, options):
+        rng = random.Random(options['seed'])
+        specializations = [code for code, _ in DoctorProfile.SPECIALIZATION_CHOICES]
+
+        started = time.perf_counter()
+        # bulk_create skips the indexing signals; the index is rebuilt below
+        users = User.objects.bulk_create(
+            User(
+                username=f'bench-doctor-{i}', role='doctor',
+                first_name=rng.choice(FIRST_NAMES), last_name=rng.choice(LAST_NAMES),
+            )
+            for i in range(options['doctors'])
+        )
+        DoctorProfile.objects.bulk_create(
+            DoctorProfile(
+                user=user,
+                is_approved=True,
+                specialization=rng.choice(specializations),
+                qualification=', '.join(rng.sample(QUALIFICATIONS, 2)),
+                bio=' '.join(rng.choices(BIO_WORDS, k=20)),
+            )
+            for user in users
+        )
+        indexed = rebuild_search_index()
+        self.stdout.write(
+            f"Indexed {indexed} doctors in {time.perf_counter() - started:.1f}s"
+        )
+
+        # Typeahead-shaped input: a name or word cut at 2-6 letters,
+        # sometimes followed by a second word
+        vocabulary = FIRST_NAMES + LAST_NAMES + QUALIFICATIONS + BIO_WORDS + tuple(
+            label for _, label in DoctorProfile.SPECIALIZATION_CHOICES
+        )
+        queries = []
+        for _ in range(options['queries']):
+            text = rng.choice(vocabulary)[:rng.randint(2, 6)]
+            if rng.random() < 0.4:
+                text += ' ' + rng.choice(vocabulary)[:rng.randint(2, 6)]
+            queries.append(text)
+
+        client = Client()
+        client.force_login(User.objects.create_user('bench-patient', role='patient'))
+        url = reverse('search_doctors')
+
+        timings = []
+        for text in queries:
+            start = time.perf_counter()
+            response = client.get(url, {'q': text})
+            timings.append((time.perf_counter() - start) * 1000)
+            if response.status_code != 200:
+                raise CommandError(f"{text!r} returned {response.status_code}")
+
+        timings.sort()
+        p50 = statistics.median(timings)
+        p95 = timings[int(len(timings) * 0.95) - 1]
+        p99 = timings[int(len(timings) * 0.99) - 1]
+        self.stdout.write(
+            f"{len(timings)} requests: p50 {p50:.2f}ms, p95 {p95:.2f}ms, "
+            f"p99 {p99:.2f}ms, max {timings[-1]:.2f}ms"
+        )
+
+        if p95 > options['max_p95_ms']:
+            raise CommandError(f"p95 {p95:.2f}ms exceeds {options['max_p95_ms']}ms")
+        self.stdout.write(self.style.SUCCESS(f"p95 within {options['max_p95_ms']}ms"))
@@ -0,0 +1,192 @@
+import http.client
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, time as clock, timedelta
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.core.servers.basehttp import run
+from django.db import connection
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from users.availability import WEEKDAY_CODES, rebuild_slot_inventory
+from users.models import DoctorProfile, TimeSlot, User
+
+
+# Search words that match the synthetic doctors below
+SEARCH_TERMS = ('doc', 'bench', 'gen', 'den', 'car', 'ort', 'bench doc')
+
+# Seconds to wait for a server process to accept connections
+STARTUP_TIMEOUT = 30
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class Command(BaseCommand):
+    help = (
+        "Load the JSON lookups over HTTP, served by the project's own views "
+        "behind Django's threaded WSGI server and behind uvicorn (one "
+        "worker). Each server runs in its own process against a throwaway "
+        "SQLite database; reports requests per second and latency."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--doctors', type=int, default=100)
+        parser.add_argument('--requests', type=int, default=1000, help="Requests per endpoint and server.")
+        parser.add_argument('--concurrency', type=int, default=16)
+        parser.add_argument('--seed', type=int, default=1)
+        # Used by the server processes the benchmark starts
+        parser.add_argument('--serve', choices=('wsgi', 'asgi'))
+        parser.add_argument('--database')
+        parser.add_argument('--port', type=int)
+
+    def handle(self, *args, **options):
+        if options['serve']:
+            return self.serve(options)
+
+        # Never the default test database: a test run going on at the same
+        # time would have it wiped underneath it
+        with tempfile.TemporaryDirectory() as tmp:
+            database = os.path.join(tmp, 'benchmark.sqlite3')
+            connection.settings_dict['TEST']['NAME'] = database
+            old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+            try:
+                self.run_benchmark(options, database)
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    @override_settings(DEBUG=False, ALLOWED_HOSTS=['127.0.0.1'])
+    def serve(self, options):
+        connection.close()
+        connection.settings_dict['NAME'] = options['database']
+        if options['serve'] == 'wsgi':
+            from django.core.wsgi import get_wsgi_application
+            run('127.0.0.1', options['port'], get_wsgi_application(), threading=True)
+        else:
+            import uvicorn
+            from django.core.asgi import get_asgi_application
+            uvicorn.run(
+                get_asgi_application(), host='127.0.0.1', port=options['port'],
+                log_level='warning', lifespan='off'
+            )
+
+    def run_benchmark(self, options, database):
+        rng = random.Random(options['seed'])
+        doctor_ids = self.seed(options['doctors'])
+        patient = User.objects.create_user('bench-patient', role='patient')
+
+        login = Client()
+        login.force_login(patient)
+        cookie = f"{settings.SESSION_COOKIE_NAME}={login.cookies[settings.SESSION_COOKIE_NAME].value}"
+        # The servers open the file themselves
+        connection.close()
+
+        today = date.today()
+        specializations = [code for code, _ in DoctorProfile.SPECIALIZATION_CHOICES]
+        endpoints = {
+            'get_available_slots': lambda: {
+                'doctor_id': rng.choice(doctor_ids),
+                'date': (today + timedelta(days=rng.randint(1, 14))).isoformat(),
+            },
+            'get_doctors_by_specialization': lambda: {'specialization': rng.choice(specializations)},
+            'search_doctors': lambda: {'q': rng.choice(SEARCH_TERMS)},
+        }
+        requests = {
+            name: [
+                f"{reverse(name)}?{urlencode(make_params())}"
+                for _ in range(options['requests'])
+            ]
+            for name, make_params in endpoints.items()
+        }
+
+        self.stdout.write(
+            f"{options['requests']} requests per endpoint, concurrency {options['concurrency']}"
+        )
+        for label in ('wsgi', 'asgi'):
+            port = free_port()
+            server = self.start_server(label, database, port)
+            try:
+                for name, urls in requests.items():
+                    elapsed, timings = self.load(port, urls, cookie, options['concurrency'])
+                    self.report(name, label, elapsed, timings)
+            finally:
+                server.terminate()
+                server.wait()
+
+    def seed(self, count):
+        doctor_ids = []
+        specializations = [code for code, _ in DoctorProfile.SPECIALIZATION_CHOICES]
+        for i in range(count):
+            user = User.objects.create_user(
+                f'bench-doctor-{i}', role='doctor', first_name='Bench', last_name=f'Doc{i}'
+            )
+            doctor = DoctorProfile.objects.create(
+                user=user, is_approved=True, specialization=specializations[i % len(specializations)]
+            )
+            TimeSlot.objects.bulk_create(
+                TimeSlot(doctor=doctor, day_of_week=code, start_time=clock(9, 0), end_time=clock(17, 0))
+                for code in WEEKDAY_CODES
+            )
+            doctor_ids.append(doctor.id)
+        rebuild_slot_inventory(doctor_ids)
+        return doctor_ids
+
+    def start_server(self, label, database, port):
+        command = [
+            sys.executable, os.path.join(settings.BASE_DIR, 'manage.py'), 'benchmark_json_endpoints',
+            '--serve', label, '--database', database, '--port', str(port),
+            '--settings', os.environ['DJANGO_SETTINGS_MODULE'],
+        ]
+        server = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        deadline = time.monotonic() + STARTUP_TIMEOUT
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise CommandError(f"The {label} server exited with status {server.returncode}")
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=1).close()
+                return server
+            except OSError:
+                time.sleep(0.1)
+        server.terminate()
+        raise CommandError(f"The {label} server did not start within {STARTUP_TIMEOUT}s")
+
+    def load(self, port, urls, cookie, concurrency):
+        def get(url):
+            conn = http.client.HTTPConnection('127.0.0.1', port)
+            start = time.perf_counter()
+            try:
+                conn.request('GET', url, headers={'Cookie': cookie})
+                response = conn.getresponse()
+                response.read()
+            finally:
+                conn.close()
+            if response.status != 200:
+                raise CommandError(f"{url} returned {response.status}")
+            return (time.perf_counter() - start) * 1000
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as pool:
+            timings = list(pool.map(get, urls))
+        return time.perf_counter() - started, timings
+
+    def report(self, name, label, elapsed, timings):
+        timings = sorted(timings)
+        p50 = statistics.median(timings)
+        p99 = timings[int(len(timings) * 0.99) - 1]
+        self.stdout.write(
+            f"{name:<32} {label}: {len(timings) / elapsed:8.0f} req/s, "
+            f"p50 {p50:.2f}ms, p99 {p99:.2f}ms"
+        )
@@ -0,0 +1,86 @@
+import multiprocessing
+import resource
+import statistics
+import time
+from datetime import date
+
+import django
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from users import medical_pdf
+from users.models import DoctorProfile, MedicalHistory, PatientProfile, User
+
+
+def sample_history():
+    """
+    An unsaved history with every printed field filled in; rendering it
+    needs no database.
+    """
+    patient = PatientProfile(
+        id=1,
+        user=User(first_name='Sample', last_name='Patient'),
+        date_of_birth=date(1980, 5, 17),
+        gender='female'
+    )
+    doctor = DoctorProfile(user=User(first_name='Sample', last_name='Doctor'))
+    return MedicalHistory(
+        patient=patient,
+        last_updated_by=doctor,
+        has_surgery='yes',
+        smoker='no',
+        alcohol_use='unknown',
+        allergies='Penicillin, peanuts',
+        chronic_conditions='Type 2 diabetes, hypertension. ' * 4,
+        pain_severity='mild',
+        notes='Follow-up every three months; review medication and diet. ' * 12,
+    )
+
+
+def run_renderer(name, renders):
+    """
+    Runs in a fresh process per renderer so peak RSS is its own. Returns
+    (render times in ms, RSS in KB before rendering, peak RSS in KB).
+    """
+    history = sample_history()
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # Warm-up: imports, fonts and the native layout cache
+    with override_settings(MEDICAL_PDF_RENDERER=name):
+        medical_pdf.render_pdf(*medical_pdf.render_source(history))
+
+        timings = []
+        for _ in range(renders):
+            start = time.perf_counter()
+            # Source building is part of each path's cost (template vs dict)
+            medical_pdf.render_pdf(*medical_pdf.render_source(history))
+            timings.append((time.perf_counter() - start) * 1000)
+
+    return timings, baseline, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare latency and peak memory of the medical history PDF "
+        "renderers (xhtml2pdf template vs native reportlab), each in its "
+        "own process."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--renders', type=int, default=50)
+
+    def handle(self, *args, **options):
+        renders = max(options['renders'], 1)
+        context = multiprocessing.get_context('spawn')
+
+        self.stdout.write(f"{renders} renders per renderer")
+        for name in medical_pdf.RENDERERS:
+            with context.Pool(1, initializer=django.setup) as pool:
+                timings, baseline, peak = pool.apply(run_renderer, (name, renders))
+
+            timings.sort()
+            p95 = timings[max(int(len(timings) * 0.95) - 1, 0)]
+            self.stdout.write(
+                f"{name:<10} p50 {statistics.median(timings):7.1f}ms, p95 {p95:7.1f}ms, "
+                f"peak RSS {peak / 1024:6.1f}MB (+{(peak - baseline) / 1024:.1f}MB over baseline)"
+            )
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from users.availability import find_inventory_drift, rebuild_slot_inventory
+
+
+class Command(BaseCommand):
+    help = "Compare the slot inventory with TimeSlot/Appointment and report drift."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--doctor', type=int, action='append', dest='doctor_ids',
+            help="Only check this doctor profile id (repeatable)."
+        )
+        parser.add_argument(
+            '--fix', action='store_true',
+            help="Rebuild the inventory of every doctor with drift."
+        )
+
+    def handle(self, *args, **options):
+        drift = find_inventory_drift(options['doctor_ids'])
+
+        if not drift:
+            self.stdout.write(self.style.SUCCESS("Slot inventory is consistent."))
+            return
+
+        for doctor_id, counts in drift.items():
+            self.stdout.write(
+                f"Doctor {doctor_id}: {counts['missing']} missing, "
+                f"{counts['extra']} extra, {counts['wrong_booked']} wrong booked flag(s)"
+            )
+
+        if options['fix']:
+            rebuild_slot_inventory(list(drift))
+            self.stdout.write(self.style.SUCCESS(f"Rebuilt {len(drift)} doctor(s)."))
+        else:
+            raise CommandError(f"Slot inventory drift found for {len(drift)} doctor(s).")
@@ -0,0 +1,160 @@
+import os
+import shutil
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+
+from users import medical_pdf
+from users.models import MedicalHistory
+
+
+def entry_name(patient_id):
+    return f"medical_history_{patient_id}.pdf"
+
+
+class Command(BaseCommand):
+    help = (
+        "Write the medical history PDFs of the selected patients (all by "
+        "default) into a ZIP file. Renders run on a process pool and are "
+        "written as they finish. Each batch is saved as a part file next to "
+        "the output and the parts are merged at the end; rerunning with the "
+        "same output file resumes, skipping patients already exported."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help="Path of the ZIP file to write or resume.")
+        parser.add_argument('--patient', type=int, nargs='+', dest='patients', help="Patient profile ids.")
+        parser.add_argument('--doctor', type=int, help="Only histories last updated by this doctor profile id.")
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+        parser.add_argument(
+            '--batch-size', type=int, default=50,
+            help="Patients rendered between archive checkpoints; bounds memory and lost work."
+        )
+
+    def handle(self, *args, **options):
+        histories = MedicalHistory.objects.all()
+        if options['patients']:
+            histories = histories.filter(patient_id__in=options['patients'])
+        if options['doctor']:
+            histories = histories.filter(last_updated_by_id=options['doctor'])
+
+        output = options['output']
+        parts_dir = output + '.parts'
+        parts = self.complete_parts(parts_dir)
+        done = set()
+        for archive in [output, *parts]:
+            try:
+                done |= self.archived_patients(archive)
+            except zipfile.BadZipFile:
+                raise CommandError(f"{archive} is not a readable ZIP file; remove it to start over.")
+
+        selected = histories.order_by('patient_id').values_list('id', 'patient_id')
+        pending = [
+            (history_id, patient_id)
+            for history_id, patient_id in selected
+            if entry_name(patient_id) not in done
+        ]
+        total = len(selected)
+        written = total - len(pending)
+        if written:
+            self.stdout.write(f"Resuming: {written} already exported")
+
+        failed = []
+        batch_size = max(options['batch_size'], 1)
+
+        with ProcessPoolExecutor(max_workers=max(options['workers'], 1), initializer=django.setup) as pool:
+            for start in range(0, len(pending), batch_size):
+                history_ids = [history_id for history_id, _ in pending[start:start + batch_size]]
+                # Each batch is a part of its own, renamed into place once
+                # complete: an interrupted run loses at most the batch in
+                # progress and never damages what was already written
+                part = os.path.join(parts_dir, f"part-{len(parts):05d}.zip")
+                os.makedirs(parts_dir, exist_ok=True)
+                with zipfile.ZipFile(part + '.tmp', 'w', compression=zipfile.ZIP_STORED) as archive:
+                    for patient_id, pdf in self.render_batch(pool, history_ids):
+                        if pdf is None:
+                            failed.append(patient_id)
+                            continue
+                        archive.writestr(entry_name(patient_id), pdf)
+                        written += 1
+                os.replace(part + '.tmp', part)
+                parts.append(part)
+                self.stdout.write(f"{written}/{total} exported")
+
+        if parts:
+            self.merge(output, parts)
+            shutil.rmtree(parts_dir)
+
+        if failed:
+            raise CommandError(
+                f"Could not render {len(failed)} PDF(s), patients: {', '.join(map(str, failed))}. "
+                f"Rerun to retry them."
+            )
+        self.stdout.write(self.style.SUCCESS(f"Exported {written} PDF(s) to {output}"))
+
+    def archived_patients(self, path):
+        if not os.path.exists(path):
+            return set()
+        with zipfile.ZipFile(path) as archive:
+            return set(archive.namelist())
+
+    def complete_parts(self, parts_dir):
+        """
+        Parts finished by earlier runs, in order. Leftover .tmp files are
+        batches that were interrupted and are deleted.
+        """
+        if not os.path.isdir(parts_dir):
+            return []
+        parts = []
+        for name in sorted(os.listdir(parts_dir)):
+            path = os.path.join(parts_dir, name)
+            if name.endswith('.tmp'):
+                os.remove(path)
+            elif name.endswith('.zip'):
+                parts.append(path)
+        return parts
+
+    def merge(self, output, parts):
+        """
+        Write the existing output plus the parts into a new archive and
+        rename it over the output, so the output is always a complete file.
+        """
+        seen = set()
+        with zipfile.ZipFile(output + '.tmp', 'w', compression=zipfile.ZIP_STORED) as merged:
+            for path in [output, *parts]:
+                if not os.path.exists(path):
+                    continue
+                with zipfile.ZipFile(path) as archive:
+                    for info in archive.infolist():
+                        # A crash between the rename and removing the parts
+                        # leaves entries in both
+                        if info.filename in seen:
+                            continue
+                        seen.add(info.filename)
+                        with archive.open(info) as source, merged.open(info, 'w') as target:
+                            shutil.copyfileobj(source, target)
+        os.replace(output + '.tmp', output)
+
+    def render_batch(self, pool, history_ids):
+        """
+        Yield (patient_id, pdf bytes or None) as renders finish. Copies the
+        download view already stored are used as is; the rest render on the
+        pool and are stored for the next download too.
+        """
+        futures = {}
+        for history in medical_pdf.pdf_histories().filter(id__in=history_ids):
+            key = medical_pdf.pdf_key(history)
+            pdf = medical_pdf.stored_pdf(history, key)
+            if pdf is not None:
+                yield history.patient_id, pdf
+                continue
+            future = pool.submit(
+                medical_pdf.render_and_store, history.patient_id, key,
+                *medical_pdf.render_source(history), history.updated_at
+            )
+            futures[future] = history.patient_id
+
+        for future in as_completed(futures):
+            yield futures[future], future.result()
@@ -0,0 +1,42 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from users.cache_versions import bump_version
+from users.doctor_photos import make_variants
+from users.models import DoctorProfile
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate the resized JPEG/WebP variants of existing doctor profile "
+        "pictures, in parallel. Pictures that already have them are skipped "
+        "unless --force is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+        parser.add_argument('--force', action='store_true', help="Regenerate existing variants.")
+
+    def handle(self, *args, **options):
+        doctors = list(DoctorProfile.objects.exclude(profile_picture='').exclude(profile_picture__isnull=True))
+        # Doctors can share a file (the default picture); write each once
+        pictures = {doctor.profile_picture.name: doctor.profile_picture for doctor in doctors}
+
+        # Pillow releases the GIL while resizing and encoding, so threads scale
+        with ThreadPoolExecutor(max_workers=max(options['workers'], 1)) as pool:
+            written = dict(zip(pictures, pool.map(
+                lambda picture: make_variants(picture, force=options['force']),
+                pictures.values()
+            )))
+
+        processed = {name for name, count in written.items() if count}
+        # Cached directory cards pick up the new srcset
+        for specialization in {d.specialization for d in doctors if d.profile_picture.name in processed}:
+            bump_version('specialization', specialization)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Generated variants for {len(processed)} of {len(pictures)} picture(s) "
+            f"({sum(written.values())} file(s))."
+        ))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from users.search import fts_enabled, rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text doctor search index from DoctorProfile/User."
+
+    def handle(self, *args, **options):
+        if not fts_enabled():
+            self.stdout.write("Database has no FTS5 index; search uses the icontains fallback.")
+            return
+
+        indexed = rebuild_search_index()
+        self.stdout.write(self.style.SUCCESS(f"Indexed {indexed} doctor(s)."))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from users.availability import inventory_days, rebuild_slot_inventory
+
+
+class Command(BaseCommand):
+    help = "Regenerate the precomputed slot inventory (run daily to roll the horizon forward)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--doctor', type=int, action='append', dest='doctor_ids',
+            help="Only rebuild this doctor profile id (repeatable)."
+        )
+        parser.add_argument(
+            '--days', type=int, default=None,
+            help="Horizon in days, defaults to settings.SLOT_INVENTORY_DAYS."
+        )
+
+    def handle(self, *args, **options):
+        days = options['days'] or inventory_days()
+        written = rebuild_slot_inventory(options['doctor_ids'], days=days)
+        self.stdout.write(self.style.SUCCESS(
+            f"Slot inventory rebuilt: {written} slot(s) over {days} day(s)."
+        ))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from users.dashboard_counters import reconcile_counters
+from users.inbox_counters import reconcile_inbox_counters
+from users.message_threads import reconcile_threads
+
+
+class Command(BaseCommand):
+    help = (
+        "Recount the admin dashboard totals, inbox unread counts and message "
+        "threads, repairing any drift."
+    )
+
+    def handle(self, *args, **options):
+        corrected = reconcile_counters()
+        corrected.update(
+            (f"inbox:{username}", counts)
+            for username, counts in reconcile_inbox_counters().items()
+        )
+
+        threads = reconcile_threads()
+
+        if not corrected and not threads:
+            self.stdout.write(self.style.SUCCESS("Dashboard counters are consistent."))
+            return
+
+        for name, (stored, actual) in corrected.items():
+            self.stdout.write(f"{name}: {stored} -> {actual}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Corrected {len(corrected)} counter(s) and {threads} message thread(s)."
+        ))
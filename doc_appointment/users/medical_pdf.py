@@ -0,0 +1,233 @@
+"""
+Rendered medical history PDFs, stored on disk under a content key.
+
+The key covers everything the PDF prints: the patient, the history's
+`updated_at`, the header fields (name, date of birth, gender, doctor) and
+the layout version (a digest of the template source, or the native
+renderer's LAYOUT_VERSION). An unchanged history is therefore served from
+MEDICAL_PDF_CACHE_DIR and doubles as the response ETag, and editing the
+template retires every stored copy without a manual version bump.
+
+MEDICAL_PDF_RENDERER picks the backend: 'xhtml2pdf' renders the HTML
+template, 'reportlab' builds the same document directly with platypus
+(users/medical_pdf_native.py) and skips the HTML/CSS parsing.
+
+Rendering is split in two: render_source() reads the database (cheap) and
+render_pdf() does the CPU-bound pass on plain data. When a doctor saves a
+history the source is built on commit and the PDF on a background thread,
+so the patient's next download is usually a file read.
+"""
+import hashlib
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from io import BytesIO
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.template.loader import get_template, render_to_string
+from xhtml2pdf import pisa
+
+from users import medical_pdf_native
+from users.models import MedicalHistory
+
+
+logger = logging.getLogger(__name__)
+
+TEMPLATE_NAME = 'patients/medical_history_pdf.html'
+
+# Renders queued by history saves. One worker: a render is CPU bound and
+# holds the GIL for most of its run, more threads would only slow requests
+executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='medical-pdf')
+
+# key -> Future of renders not yet stored, so a download waits for a
+# queued render instead of starting its own
+_in_flight = {}
+_in_flight_lock = threading.Lock()
+
+
+RENDERERS = ('xhtml2pdf', 'reportlab')
+
+
+def renderer():
+    name = getattr(settings, 'MEDICAL_PDF_RENDERER', 'xhtml2pdf')
+    if name not in RENDERERS:
+        raise ImproperlyConfigured(f"MEDICAL_PDF_RENDERER must be one of {', '.join(RENDERERS)}")
+    return name
+
+
+def cache_dir():
+    return getattr(settings, 'MEDICAL_PDF_CACHE_DIR', os.path.join(settings.BASE_DIR, 'pdf_cache'))
+
+
+@lru_cache(maxsize=None)
+def template_digest():
+    return hashlib.sha256(get_template(TEMPLATE_NAME).template.source.encode()).hexdigest()[:16]
+
+
+def pdf_histories():
+    """
+    MedicalHistory rows with everything the PDF prints joined in.
+    """
+    return MedicalHistory.objects.select_related('patient__user', 'last_updated_by__user')
+
+
+def pdf_key(history):
+    patient = history.patient
+    doctor = history.last_updated_by
+    parts = (
+        patient.id,
+        history.updated_at.isoformat(),
+        layout_version(renderer()),
+        patient.user.get_full_name(),
+        patient.date_of_birth,
+        patient.gender,
+        doctor.user.get_full_name() if doctor else '',
+    )
+    return hashlib.sha256(repr(parts).encode()).hexdigest()[:32]
+
+
+def _path(patient_id, key):
+    return os.path.join(cache_dir(), str(patient_id), f'{key}.pdf')
+
+
+def layout_version(name):
+    if name == 'reportlab':
+        return f'reportlab:{medical_pdf_native.LAYOUT_VERSION}'
+    return f'xhtml2pdf:{template_digest()}'
+
+
+def render_html(history):
+    return render_to_string(TEMPLATE_NAME, {
+        'patient': history.patient,
+        'history': history,
+        'doctor': history.last_updated_by,
+        # Absolute path for logo (required for xhtml2pdf)
+        'logo_path': os.path.join(settings.STATIC_ROOT, 'img', 'pg_logo.png'),
+    })
+
+
+def render_source(history):
+    """
+    (renderer name, input for render_pdf()) for `history`. The input is
+    plain data, so it can be handed to another thread or process.
+    """
+    name = renderer()
+    if name == 'reportlab':
+        return name, medical_pdf_native.document_fields(history)
+    return name, render_html(history)
+
+
+def render_pdf(name, source):
+    """
+    PDF bytes from a render_source() input, or None when rendering failed.
+    """
+    if name == 'reportlab':
+        return medical_pdf_native.render(source)
+    out = BytesIO()
+    if pisa.CreatePDF(source, dest=out).err:
+        return None
+    return out.getvalue()
+
+
+def render_and_store(patient_id, key, name, source, updated_at):
+    """
+    render_pdf() and store the result, replacing the patient's copies of
+    older history versions. Returns the PDF bytes, or None when rendering
+    failed.
+
+    The file's mtime is set to the history's `updated_at`, so a stale render
+    that finishes after a newer one keeps the newer copy and drops its own.
+    """
+    pdf = render_pdf(name, source)
+    if pdf is None:
+        return None
+
+    path = _path(patient_id, key)
+    folder = os.path.dirname(path)
+    os.makedirs(folder, exist_ok=True)
+    # Write aside and rename, so readers never see a partial file
+    temp = f'{path}.{threading.get_ident()}.tmp'
+    with open(temp, 'wb') as f:
+        f.write(pdf)
+    stamp = updated_at.timestamp()
+    os.utime(temp, (stamp, stamp))
+    os.replace(temp, path)
+
+    written = os.stat(path).st_mtime_ns
+    for filename in os.listdir(folder):
+        other = os.path.join(folder, filename)
+        if not filename.endswith('.pdf') or other == path:
+            continue
+        try:
+            if os.stat(other).st_mtime_ns <= written:
+                os.remove(other)
+            else:
+                os.remove(path)
+        except FileNotFoundError:
+            pass
+    return pdf
+
+
+def stored_pdf(history, key=None):
+    """
+    The stored PDF bytes for the history's current content, or None.
+    """
+    try:
+        with open(_path(history.patient_id, key or pdf_key(history)), 'rb') as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def get_pdf(history, key=None):
+    """
+    PDF bytes for `history`: the stored copy, the result of a render already
+    queued for it, or a fresh render in this thread. None if rendering fails.
+    """
+    key = key or pdf_key(history)
+    pdf = stored_pdf(history, key)
+    if pdf is not None:
+        return pdf
+
+    with _in_flight_lock:
+        queued = _in_flight.get(key)
+    if queued is not None:
+        pdf = queued.result()
+        if pdf is not None:
+            return pdf
+
+    return render_and_store(history.patient_id, key, *render_source(history), history.updated_at)
+
+
+def prerender(history_id):
+    """
+    Queue a background render of a history unless its current version is
+    stored or already queued. Reads the history, so call it after commit.
+    """
+    history = pdf_histories().filter(id=history_id).first()
+    if history is None:
+        return
+
+    key = pdf_key(history)
+    if os.path.exists(_path(history.patient_id, key)):
+        return
+    name, source = render_source(history)
+
+    with _in_flight_lock:
+        if key in _in_flight:
+            return
+        future = executor.submit(render_and_store, history.patient_id, key, name, source, history.updated_at)
+        _in_flight[key] = future
+    future.add_done_callback(lambda done: _finished(key, done))
+
+
+def _finished(key, future):
+    with _in_flight_lock:
+        # Only this render's own entry: a newer one may have been queued
+        if _in_flight.get(key) is future:
+            del _in_flight[key]
+    if future.exception() is not None:
+        logger.error("Background medical history PDF render failed", exc_info=future.exception())
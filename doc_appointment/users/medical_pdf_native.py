@@ -0,0 +1,173 @@
+"""
+reportlab renderer for the medical history PDF, without the HTML step.
+
+Lays out the same content as templates/patients/medical_history_pdf.html
+(header with logo, patient/doctor table, medical history table) directly
+as platypus flowables. The decoded logo, paragraph and table styles are
+built once per process; a render only creates the per-patient tables.
+
+Takes the plain dict from document_fields() so it can run on a process
+pool (users/management/commands/export_medical_history_pdfs.py).
+Bump LAYOUT_VERSION when the output changes, it is part of the stored
+PDF key.
+"""
+import os
+from functools import lru_cache
+from io import BytesIO
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from reportlab.lib import colors
+from reportlab.lib.enums import TA_LEFT
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import ParagraphStyle
+from reportlab.lib.units import cm
+from reportlab.lib.utils import ImageReader
+from reportlab.platypus import HRFlowable, Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+
+LAYOUT_VERSION = 1
+
+HOSPITAL_NAME = "PG Medical Trust Hospital, Nilambur"
+HOSPITAL_ADDRESS = "VK Road, Nilambur, Malappuram, Kerala"
+
+TEAL = colors.HexColor('#0a6c5d')
+BORDER = colors.HexColor('#333333')
+
+MARGIN = 2 * cm
+LOGO_WIDTH = 110 * 0.75  # 110px
+HEADER_HEIGHT = 80
+
+
+def document_fields(history):
+    """
+    The text the PDF prints, formatted as the HTML template does.
+    """
+    patient = history.patient
+    doctor = history.last_updated_by
+    return {
+        'patient_name': patient.user.get_full_name(),
+        'patient_id': str(patient.id),
+        'date_of_birth': patient.date_of_birth.strftime('%Y-%m-%d') if patient.date_of_birth else '',
+        'gender': (patient.gender or '').title(),
+        'doctor': f"Dr. {doctor.user.get_full_name() if doctor else ''}",
+        'rows': [
+            ("History of Surgery", history.get_has_surgery_display()),
+            ("Smoking History", history.get_smoker_display()),
+            ("Alcohol Use", history.get_alcohol_use_display()),
+            ("Allergies", history.allergies or '-'),
+            ("Chronic Conditions", history.chronic_conditions or '-'),
+            ("Pain Severity", history.get_pain_severity_display()),
+            ("Additional Notes", history.notes or '-'),
+        ],
+    }
+
+
+@lru_cache(maxsize=None)
+def _layout():
+    body = ParagraphStyle('body', fontName='Helvetica', fontSize=10, leading=13, alignment=TA_LEFT)
+    cell_padding = [
+        ('BOX', (0, 0), (-1, -1), 0.75, BORDER),
+        ('INNERGRID', (0, 0), (-1, -1), 0.75, BORDER),
+        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+        ('TOPPADDING', (0, 0), (-1, -1), 6),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
+        ('LEFTPADDING', (0, 0), (-1, -1), 6),
+        ('RIGHTPADDING', (0, 0), (-1, -1), 6),
+    ]
+    width = A4[0] - 2 * MARGIN
+
+    logo_path = os.path.join(settings.STATIC_ROOT, 'img', 'pg_logo.png')
+    logo = ImageReader(logo_path) if os.path.exists(logo_path) else None
+    logo_height = 0
+    if logo is not None:
+        logo_w, logo_h = logo.getSize()
+        logo_height = LOGO_WIDTH * logo_h / logo_w
+
+    return {
+        'width': width,
+        'body': body,
+        'label': ParagraphStyle('label', parent=body, fontName='Helvetica-Bold'),
+        'heading': ParagraphStyle(
+            'heading', parent=body, fontName='Helvetica-Bold', fontSize=13, leading=16,
+            textColor=TEAL, spaceBefore=18, spaceAfter=6
+        ),
+        'logo': logo,
+        'logo_height': logo_height,
+        'info_style': TableStyle(cell_padding + [
+            ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#f2f2f2')),
+            ('BACKGROUND', (2, 0), (2, 1), colors.HexColor('#f2f2f2')),
+            ('SPAN', (1, 2), (3, 2)),
+        ]),
+        'info_widths': [width * 0.22, width * 0.28, width * 0.22, width * 0.28],
+        'medical_style': TableStyle(cell_padding + [
+            ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#f7f7f7')),
+        ]),
+        'medical_widths': [width * 0.30, width * 0.70],
+    }
+
+
+def _draw_header(canvas, doc):
+    """
+    The letterhead: logo, hospital name and address over a teal rule.
+    """
+    layout = _layout()
+    top = A4[1] - MARGIN
+    canvas.saveState()
+    if layout['logo'] is not None:
+        canvas.drawImage(
+            layout['logo'], MARGIN, top - layout['logo_height'],
+            width=LOGO_WIDTH, height=layout['logo_height'], mask='auto'
+        )
+    text_x = MARGIN + layout['width'] * 0.25
+    canvas.setFillColor(TEAL)
+    canvas.setFont('Helvetica-Bold', 16)
+    canvas.drawString(text_x, top - HEADER_HEIGHT / 2, HOSPITAL_NAME)
+    canvas.setFillColor(colors.HexColor('#444444'))
+    canvas.setFont('Helvetica', 9)
+    canvas.drawString(text_x, top - HEADER_HEIGHT / 2 - 14, HOSPITAL_ADDRESS)
+    canvas.setStrokeColor(TEAL)
+    canvas.setLineWidth(2.25)
+    canvas.line(MARGIN, top - HEADER_HEIGHT, A4[0] - MARGIN, top - HEADER_HEIGHT)
+    canvas.restoreState()
+
+
+def render(fields):
+    """
+    PDF bytes for the dict built by document_fields().
+    """
+    layout = _layout()
+    body, label = layout['body'], layout['label']
+
+    def cell(text, style=body):
+        return Paragraph(escape(text), style)
+
+    info = Table([
+        [cell("Patient Name", label), cell(fields['patient_name']),
+         cell("Patient ID", label), cell(fields['patient_id'])],
+        [cell("Date of Birth", label), cell(fields['date_of_birth']),
+         cell("Gender", label), cell(fields['gender'])],
+        [cell("Doctor", label), cell(fields['doctor']), '', ''],
+    ], colWidths=layout['info_widths'], style=layout['info_style'])
+
+    medical = Table(
+        [[cell(name, label), cell(value)] for name, value in fields['rows']],
+        colWidths=layout['medical_widths'], style=layout['medical_style']
+    )
+
+    out = BytesIO()
+    doc = SimpleDocTemplate(
+        out, pagesize=A4, leftMargin=MARGIN, rightMargin=MARGIN,
+        topMargin=MARGIN, bottomMargin=MARGIN
+    )
+    doc.build(
+        [
+            Spacer(0, HEADER_HEIGHT + 12),
+            info,
+            Paragraph("Medical History", layout['heading']),
+            HRFlowable(width='100%', thickness=0.75, color=TEAL, spaceBefore=0, spaceAfter=8),
+            medical,
+        ],
+        onFirstPage=_draw_header,
+    )
+    return out.getvalue()
@@ -0,0 +1,117 @@
+"""
+Conversation threads for DoctorMessage.
+
+Every message belongs to a MessageThread between one doctor and the admins:
+start_thread() opens one with its first message and reply() appends to the
+thread of the message being answered. The signals in users/signals.py keep
+each thread's last message, activity time and message count current, and
+users/inbox_counters.py its per-side unread counts, so inboxes list threads
+without reading messages and opening a thread is one range read on
+(thread, created_at).
+"""
+import re
+
+from django.db import transaction
+from django.db.models import F
+
+from users.models import DoctorMessage, MessageThread
+
+
+# Any run of leading "Re:" prefixes, as added by the reply forms
+REPLY_PREFIX = re.compile(r'^\s*(?:re\s*:\s*)+', re.IGNORECASE)
+
+
+def base_subject(subject):
+    return REPLY_PREFIX.sub('', subject).strip() or subject
+
+
+def start_thread(doctor, sender, subject, message):
+    """
+    Open a thread with `doctor` and post its first message.
+    """
+    with transaction.atomic():
+        thread = MessageThread.objects.create(doctor=doctor, subject=base_subject(subject))
+        return DoctorMessage.objects.create(
+            thread=thread, doctor=doctor, sender=sender, subject=subject, message=message
+        )
+
+
+def reply(original, sender, subject, message):
+    """
+    Post a reply in the thread of `original`.
+    """
+    if original.thread_id is None:
+        return start_thread(original.doctor, sender, subject, message)
+    return DoctorMessage.objects.create(
+        thread_id=original.thread_id,
+        doctor_id=original.thread.doctor_id,
+        sender=sender,
+        subject=subject,
+        message=message
+    )
+
+
+def thread_messages(thread):
+    return DoctorMessage.objects.filter(thread=thread).select_related('sender').order_by('created_at', 'id')
+
+
+def message_added(message):
+    MessageThread.objects.filter(pk=message.thread_id).update(
+        last_message=message,
+        last_activity=message.created_at,
+        message_count=F('message_count') + 1
+    )
+
+
+def message_removed(message):
+    """
+    Point the thread at its new last message, or drop it once empty.
+    """
+    latest = DoctorMessage.objects.filter(
+        thread_id=message.thread_id
+    ).order_by('-created_at', '-id').first()
+
+    threads = MessageThread.objects.filter(pk=message.thread_id)
+    if latest is None:
+        threads.delete()
+        return
+    threads.update(
+        last_message=latest,
+        last_activity=latest.created_at,
+        message_count=F('message_count') - 1
+    )
+
+
+def reconcile_threads():
+    """
+    Recount every thread from its messages and fix drifted rows.
+    Returns the number of threads corrected.
+    """
+    actual = {}
+    for row in DoctorMessage.objects.filter(thread__isnull=False).order_by(
+        'thread_id', 'created_at', 'id'
+    ).values('id', 'thread_id', 'created_at', 'is_read', 'sender__role'):
+        thread = actual.setdefault(row['thread_id'], {
+            'message_count': 0, 'doctor_unread': 0, 'admin_unread': 0,
+        })
+        thread['message_count'] += 1
+        thread['last_message_id'] = row['id']
+        thread['last_activity'] = row['created_at']
+        if not row['is_read']:
+            side = 'admin_unread' if row['sender__role'] == 'doctor' else 'doctor_unread'
+            thread[side] += 1
+
+    corrected = []
+    for thread in MessageThread.objects.all():
+        values = actual.get(thread.pk)
+        if values is None:
+            continue
+        if any(getattr(thread, field) != value for field, value in values.items()):
+            for field, value in values.items():
+                setattr(thread, field, value)
+            corrected.append(thread)
+
+    MessageThread.objects.bulk_update(corrected, [
+        'message_count', 'doctor_unread', 'admin_unread', 'last_message', 'last_activity'
+    ])
+    return len(corrected)
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.8 on 2026-10-18 20:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0017_alter_doctormessage_options_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='doctorprofile',
+            name='slot_inventory_until',
+            field=models.DateField(blank=True, editable=False, null=True),
+        ),
+        migrations.CreateModel(
+            name='SlotInventory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('slot_date', models.DateField()),
+                ('slot_time', models.TimeField()),
+                ('is_booked', models.BooleanField(default=False)),
+                ('doctor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='slot_inventory', to='users.doctorprofile')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['doctor', 'slot_date', 'is_booked', 'slot_time'], name='inventory_free_slots_idx')],
+                'constraints': [models.UniqueConstraint(fields=('doctor', 'slot_date', 'slot_time'), name='unique_inventory_slot')],
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.8 on 2026-10-18 20:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0018_doctorprofile_slot_inventory_until_slotinventory'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='slotinventory',
+            index=models.Index(condition=models.Q(('is_booked', False)), fields=['slot_date', 'slot_time'], name='inventory_open_slots_idx'),
+        ),
+    ]
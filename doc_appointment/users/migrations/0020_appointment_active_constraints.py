@@ -0,0 +1,58 @@
+# Generated by Django 5.2.8 on 2026-10-18 20:10
+
+from django.db import migrations, models
+
+
+ACTIVE_STATUSES = ('pending', 'confirmed')
+
+
+def cancel_duplicate_bookings(apps, schema_editor):
+    """
+    Existing double bookings would violate the new constraints: keep the
+    earliest active appointment of each clash and cancel the rest.
+    """
+    Appointment = apps.get_model('users', 'Appointment')
+
+    seen_slots = set()
+    seen_days = set()
+    duplicates = []
+
+    for appt_id, doctor_id, patient_id, appt_date, appt_time in (
+        Appointment.objects.filter(status__in=ACTIVE_STATUSES)
+        .order_by('id')
+        .values_list('id', 'doctor_id', 'patient_id', 'appointment_date', 'appointment_time')
+    ):
+        slot_key = (doctor_id, appt_date, appt_time)
+        day_key = (doctor_id, patient_id, appt_date)
+
+        if slot_key in seen_slots or day_key in seen_days:
+            duplicates.append(appt_id)
+            continue
+
+        seen_slots.add(slot_key)
+        seen_days.add(day_key)
+
+    Appointment.objects.filter(id__in=duplicates).update(
+        status='cancelled',
+        cancelled_by='admin',
+        cancellation_reason='Duplicate booking cancelled automatically.'
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0019_slotinventory_inventory_open_slots_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(cancel_duplicate_bookings, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='appointment',
+            constraint=models.UniqueConstraint(condition=models.Q(('status__in', ('pending', 'confirmed'))), fields=('doctor', 'appointment_date', 'appointment_time'), name='unique_active_doctor_slot'),
+        ),
+        migrations.AddConstraint(
+            model_name='appointment',
+            constraint=models.UniqueConstraint(condition=models.Q(('status__in', ('pending', 'confirmed'))), fields=('doctor', 'patient', 'appointment_date'), name='unique_active_patient_day'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.8 on 2026-10-18 20:14
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0020_appointment_active_constraints'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlotHold',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hold_date', models.DateField()),
+                ('hold_time', models.TimeField()),
+                ('expires_at', models.DateTimeField()),
+                ('doctor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='slot_holds', to='users.doctorprofile')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='slot_holds', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['expires_at'], name='slot_hold_expiry_idx')],
+                'constraints': [models.UniqueConstraint(fields=('doctor', 'hold_date', 'hold_time'), name='unique_slot_hold')],
+            },
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.8 on 2026-10-18 20:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0022_doctorprofile_buffer_minutes_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['doctor', 'appointment_date', 'status'], name='appt_doctor_date_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['patient', 'appointment_date'], name='appt_patient_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='doctormessage',
+            index=models.Index(fields=['doctor', 'sender', 'is_read'], name='docmsg_doctor_sender_read_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='doctormessage',
+            index=models.Index(fields=['sender', 'created_at'], name='docmsg_sender_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='feedback',
+            index=models.Index(condition=models.Q(('is_read', False)), fields=['-created_at'], name='feedback_unread_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='timeslot',
+            index=models.Index(fields=['doctor', 'day_of_week', 'is_active'], name='timeslot_doctor_day_idx'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.8 on 2026-10-18 20:27
+
+from django.db import migrations, models
+
+
+def seed_counters(apps, schema_editor):
+    """
+    Start every dashboard counter from the current real count.
+    """
+    DashboardCounter = apps.get_model('users', 'DashboardCounter')
+    DoctorProfile = apps.get_model('users', 'DoctorProfile')
+    PatientProfile = apps.get_model('users', 'PatientProfile')
+    Appointment = apps.get_model('users', 'Appointment')
+    DoctorMessage = apps.get_model('users', 'DoctorMessage')
+
+    counts = {
+        'doctors': DoctorProfile.objects.count(),
+        'available_doctors': DoctorProfile.objects.filter(is_available=True).count(),
+        'pending_doctors': DoctorProfile.objects.filter(is_approved=False).count(),
+        'patients': PatientProfile.objects.count(),
+        'appointments': Appointment.objects.count(),
+        'unread_messages': DoctorMessage.objects.filter(is_read=False).count(),
+    }
+    DashboardCounter.objects.bulk_create(
+        DashboardCounter(name=name, value=value) for name, value in counts.items()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0023_composite_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DashboardCounter',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('value', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(seed_counters, migrations.RunPython.noop),
+    ]
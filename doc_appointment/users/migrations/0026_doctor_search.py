@@ -0,0 +1,65 @@
+# Generated by Django 5.2.8 on 2026-10-18 21:40
+
+from django.db import migrations
+
+
+SEARCH_TABLE = 'users_doctor_search'
+
+
+def create_search_table(apps, schema_editor):
+    """
+    FTS5 table behind users/search.py, filled with the bookable doctors.
+    Other databases use the icontains fallback and need nothing.
+    """
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+
+    DoctorProfile = apps.get_model('users', 'DoctorProfile')
+    labels = dict(DoctorProfile._meta.get_field('specialization').choices)
+
+    schema_editor.execute(f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5(
+            name, specialization, qualification, bio,
+            tokenize = 'unicode61 remove_diacritics 2',
+            prefix = '2 3 4'
+        )
+    """)
+
+    rows = []
+    for doctor in DoctorProfile.objects.filter(
+        is_approved=True,
+        is_available=True,
+        user__is_active=True
+    ).select_related('user'):
+        user = doctor.user
+        name = f"{user.first_name} {user.last_name}".strip() or user.username
+        rows.append((
+            doctor.id,
+            name,
+            f"{labels.get(doctor.specialization, doctor.specialization)} {doctor.specialization}",
+            doctor.qualification or '',
+            doctor.bio or '',
+        ))
+
+    with schema_editor.connection.cursor() as cursor:
+        cursor.executemany(
+            f"INSERT INTO {SEARCH_TABLE}(rowid, name, specialization, qualification, bio) "
+            "VALUES (%s, %s, %s, %s, %s)",
+            rows
+        )
+
+
+def drop_search_table(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(f"DROP TABLE IF EXISTS {SEARCH_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0025_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_table, drop_search_table),
+    ]
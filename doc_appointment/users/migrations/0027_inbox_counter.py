@@ -0,0 +1,55 @@
+# Generated by Django 5.2.8 on 2026-10-18 20:43
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def seed_inbox_counters(apps, schema_editor):
+    """
+    Start every admin and doctor inbox from the current unread counts, and
+    drop the old all-messages dashboard counter these replace.
+    """
+    User = apps.get_model('users', 'User')
+    InboxCounter = apps.get_model('users', 'InboxCounter')
+    DoctorMessage = apps.get_model('users', 'DoctorMessage')
+    Feedback = apps.get_model('users', 'Feedback')
+    DashboardCounter = apps.get_model('users', 'DashboardCounter')
+
+    unread = DoctorMessage.objects.filter(is_read=False)
+    admin_messages = unread.filter(sender__role='doctor').count()
+    feedback = Feedback.objects.filter(is_read=False).count()
+
+    counters = []
+    for user in User.objects.filter(role__in=('admin', 'doctor')):
+        if user.role == 'admin':
+            counters.append(InboxCounter(
+                user=user, unread_messages=admin_messages, unread_feedback=feedback
+            ))
+        else:
+            counters.append(InboxCounter(
+                user=user,
+                unread_messages=unread.filter(doctor__user=user).exclude(sender__role='doctor').count()
+            ))
+    InboxCounter.objects.bulk_create(counters)
+
+    DashboardCounter.objects.filter(name='unread_messages').delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0026_doctor_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InboxCounter',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='inbox_counter', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('unread_messages', models.IntegerField(default=0)),
+                ('unread_feedback', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(seed_inbox_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,121 @@
+# Generated by Django 5.2.8 on 2026-10-18 20:46
+
+import django.db.models.deletion
+import django.utils.timezone
+import re
+
+from django.db import migrations, models
+
+
+REPLY_PREFIX = re.compile(r'^\s*(?:re\s*:\s*)+', re.IGNORECASE)
+
+
+def group_reply_chains(apps, schema_editor):
+    """
+    Put the existing messages into threads. A message without a "Re:"
+    prefix opens a thread; a reply joins the latest thread with the same
+    doctor and base subject, or opens one if its original is gone. Replies
+    that doctors sent with no doctor set get their sender's profile; other
+    replies without a doctor join the thread of their base subject when only
+    one doctor has it. Any message still without a doctor stops the
+    migration: it would have no thread and vanish from both inboxes.
+    """
+    DoctorMessage = apps.get_model('users', 'DoctorMessage')
+    DoctorProfile = apps.get_model('users', 'DoctorProfile')
+    MessageThread = apps.get_model('users', 'MessageThread')
+    User = apps.get_model('users', 'User')
+
+    doctor_of_user = dict(DoctorProfile.objects.values_list('user_id', 'id'))
+    roles = dict(User.objects.values_list('id', 'role'))
+
+    chains = {}
+    # base subject -> doctors with a thread of that subject
+    subject_doctors = {}
+    threads = []
+    messages = []
+    orphans = []
+    for msg in DoctorMessage.objects.order_by('created_at', 'id'):
+        base = REPLY_PREFIX.sub('', msg.subject).strip() or msg.subject
+        is_reply = bool(REPLY_PREFIX.match(msg.subject))
+        doctor_id = msg.doctor_id or doctor_of_user.get(msg.sender_id)
+        if doctor_id is None and is_reply:
+            candidates = subject_doctors.get(base.lower(), set())
+            if len(candidates) == 1:
+                doctor_id = next(iter(candidates))
+        if doctor_id is None:
+            orphans.append(msg.id)
+            continue
+
+        key = (doctor_id, base.lower())
+        thread = chains.get(key) if is_reply else None
+        if thread is None:
+            thread = MessageThread.objects.create(doctor_id=doctor_id, subject=base)
+            chains[key] = thread
+            subject_doctors.setdefault(base.lower(), set()).add(doctor_id)
+            threads.append(thread)
+
+        thread.message_count += 1
+        thread.last_message = msg
+        thread.last_activity = msg.created_at
+        if not msg.is_read:
+            if roles.get(msg.sender_id) == 'doctor':
+                thread.admin_unread += 1
+            else:
+                thread.doctor_unread += 1
+
+        msg.thread = thread
+        msg.doctor_id = doctor_id
+        messages.append(msg)
+
+    if orphans:
+        raise RuntimeError(
+            f"{len(orphans)} doctor message(s) have no doctor and no doctor "
+            f"sender, so no thread can hold them (ids: {', '.join(map(str, orphans))}). "
+            "Set their doctor or delete them, then migrate again."
+        )
+
+    DoctorMessage.objects.bulk_update(messages, ['thread', 'doctor'], batch_size=500)
+    MessageThread.objects.bulk_update(threads, [
+        'message_count', 'last_message', 'last_activity', 'doctor_unread', 'admin_unread'
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0027_inbox_counter'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MessageThread',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('subject', models.CharField(max_length=255)),
+                ('last_activity', models.DateTimeField(default=django.utils.timezone.now)),
+                ('message_count', models.IntegerField(default=0)),
+                ('doctor_unread', models.IntegerField(default=0)),
+                ('admin_unread', models.IntegerField(default=0)),
+                ('doctor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='message_threads', to='users.doctorprofile')),
+                ('last_message', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='users.doctormessage')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='doctormessage',
+            name='thread',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='messages', to='users.messagethread'),
+        ),
+        migrations.AddIndex(
+            model_name='doctormessage',
+            index=models.Index(fields=['thread', 'created_at'], name='docmsg_thread_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='messagethread',
+            index=models.Index(fields=['doctor', 'last_activity'], name='thread_doctor_activity_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='messagethread',
+            index=models.Index(fields=['last_activity'], name='thread_activity_idx'),
+        ),
+        migrations.RunPython(group_reply_chains, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.8 on 2026-10-18 21:30
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def freeze_durations(apps, schema_editor):
+    """
+    Existing appointments keep the slot length their doctor has now, so a
+    later change of slot_minutes does not resize them.
+    """
+    Appointment = apps.get_model('users', 'Appointment')
+    DoctorProfile = apps.get_model('users', 'DoctorProfile')
+
+    Appointment.objects.update(duration_minutes=Subquery(
+        DoctorProfile.objects.filter(id=OuterRef('doctor_id')).values('slot_minutes')[:1]
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0028_message_thread'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='appointment',
+            name='duration_minutes',
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+        migrations.RunPython(freeze_durations, migrations.RunPython.noop),
+    ]
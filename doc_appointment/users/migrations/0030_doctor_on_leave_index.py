@@ -0,0 +1,17 @@
+# Generated by Django 5.2.8 on 2026-10-18 21:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0029_appointment_duration_minutes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='doctorprofile',
+            index=models.Index(condition=models.Q(('is_available', False)), fields=['id'], name='doctor_on_leave_idx'),
+        ),
+    ]
@@ -0,0 +1,86 @@
+# Generated by Django 5.2.8 on 2026-10-18 22:10
+
+from importlib import import_module
+
+from django.db import migrations
+
+
+SEARCH_TABLE = 'users_doctor_search'
+NAME_TABLE = 'users_doctor_name_search'
+
+
+def rebuild_search_tables(apps, schema_editor):
+    """
+    Recreate the doctor search table with 5- and 6-letter prefix indexes
+    and the specialization code stored for results, and add the names-only
+    table searched first (see users/search.py).
+    """
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+
+    DoctorProfile = apps.get_model('users', 'DoctorProfile')
+    labels = dict(DoctorProfile._meta.get_field('specialization').choices)
+
+    schema_editor.execute(f"DROP TABLE IF EXISTS {SEARCH_TABLE}")
+    schema_editor.execute(f"DROP TABLE IF EXISTS {NAME_TABLE}")
+    schema_editor.execute(f"""
+        CREATE VIRTUAL TABLE {SEARCH_TABLE} USING fts5(
+            name, specialization, qualification, bio, specialization_code UNINDEXED,
+            tokenize = 'unicode61 remove_diacritics 2',
+            prefix = '2 3 4 5 6'
+        )
+    """)
+    schema_editor.execute(f"""
+        CREATE VIRTUAL TABLE {NAME_TABLE} USING fts5(
+            name,
+            tokenize = 'unicode61 remove_diacritics 2',
+            prefix = '2 3 4 5 6'
+        )
+    """)
+
+    rows = []
+    for doctor in DoctorProfile.objects.filter(
+        is_approved=True,
+        is_available=True,
+        user__is_active=True
+    ).select_related('user'):
+        user = doctor.user
+        name = f"{user.first_name} {user.last_name}".strip() or user.username
+        rows.append((
+            doctor.id,
+            name,
+            f"{labels.get(doctor.specialization, doctor.specialization)} {doctor.specialization}",
+            doctor.qualification or '',
+            doctor.bio or '',
+            doctor.specialization,
+        ))
+
+    with schema_editor.connection.cursor() as cursor:
+        cursor.executemany(
+            f"INSERT INTO {SEARCH_TABLE}(rowid, name, specialization, qualification, bio, specialization_code) "
+            "VALUES (%s, %s, %s, %s, %s, %s)",
+            rows
+        )
+        cursor.executemany(
+            f"INSERT INTO {NAME_TABLE}(rowid, name) VALUES (%s, %s)",
+            [row[:2] for row in rows]
+        )
+
+
+def restore_search_table(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(f"DROP TABLE IF EXISTS {NAME_TABLE}")
+    schema_editor.execute(f"DROP TABLE IF EXISTS {SEARCH_TABLE}")
+    import_module('users.migrations.0026_doctor_search').create_search_table(apps, schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0030_doctor_on_leave_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(rebuild_search_tables, restore_search_table),
+    ]
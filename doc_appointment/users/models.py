@@ -1,6 +1,11 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
 from django.conf import settings
+from django.core.validators import MaxValueValidator, MinValueValidator
+from django.utils import timezone
+from django.utils.functional import cached_property
+
+from users import doctor_photos
 
 class User(AbstractUser):
     ROLE_CHOICES = (
@@ -64,11 +69,42 @@ class DoctorProfile(models.Model):
     )
     is_available = models.BooleanField(default=True)
     is_approved = models.BooleanField(default=False)  # Pending by default
+
+    # Appointment length and gap between consecutive appointments
+    slot_minutes = models.PositiveSmallIntegerField(
+        default=30,
+        validators=[MinValueValidator(5), MaxValueValidator(240)]
+    )
+    buffer_minutes = models.PositiveSmallIntegerField(
+        default=0,
+        validators=[MaxValueValidator(120)]
+    )
     created_at = models.DateTimeField(auto_now_add=True)
 
+    # Last date covered by the precomputed SlotInventory rows (None = never built)
+    slot_inventory_until = models.DateField(null=True, blank=True, editable=False)
+
     def __str__(self):
         return self.user.first_name or self.user.username
 
+    @cached_property
+    def photo(self):
+        """
+        srcset data for the profile picture's resized variants, or None
+        until they exist (see users/doctor_photos.py).
+        """
+        return doctor_photos.variants(self.profile_picture)
+
+    class Meta:
+        indexes = [
+            # Doctors on leave, for the admin dashboard
+            models.Index(
+                fields=['id'],
+                condition=models.Q(is_available=False),
+                name='doctor_on_leave_idx'
+            ),
+        ]
+
 
 # -------------------------------------------------
 # Patient Profile
@@ -93,6 +129,12 @@ class PatientProfile(models.Model):
     
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Keyset pagination of the admin patient list
+            models.Index(fields=['created_at'], name='patient_created_idx'),
+        ]
+
     def __str__(self):
         return self.user.username
 
@@ -124,6 +166,11 @@ class TimeSlot(models.Model):
     end_time = models.TimeField()
     is_active = models.BooleanField(default=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['doctor', 'day_of_week', 'is_active'], name='timeslot_doctor_day_idx'),
+        ]
+
     def __str__(self):
         return f"{self.doctor} - {self.get_day_of_week_display()} ({self.start_time} - {self.end_time})"
 
@@ -158,6 +205,9 @@ class Appointment(models.Model):
     )
     appointment_date = models.DateField()
     appointment_time = models.TimeField()
+    # Length booked, taken from the doctor's slot_minutes at booking time
+    # (None = the doctor's current slot_minutes)
+    duration_minutes = models.PositiveSmallIntegerField(null=True, blank=True)
 
     status = models.CharField(
         max_length=10,
@@ -178,10 +228,197 @@ class Appointment(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # Statuses that hold on to the slot
+    ACTIVE_STATUSES = ('pending', 'confirmed')
+
+    class Meta:
+        constraints = [
+            # A slot can only be held by one active appointment
+            models.UniqueConstraint(
+                fields=['doctor', 'appointment_date', 'appointment_time'],
+                condition=models.Q(status__in=('pending', 'confirmed')),
+                name='unique_active_doctor_slot'
+            ),
+            # One active appointment per doctor per day per patient
+            models.UniqueConstraint(
+                fields=['doctor', 'patient', 'appointment_date'],
+                condition=models.Q(status__in=('pending', 'confirmed')),
+                name='unique_active_patient_day'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['doctor', 'appointment_date', 'status'], name='appt_doctor_date_status_idx'),
+            # Keyset pagination walks (date, time, id) of one doctor or patient
+            models.Index(
+                fields=['doctor', 'appointment_date', 'appointment_time'],
+                name='appt_doctor_date_time_idx'
+            ),
+            models.Index(
+                fields=['patient', 'appointment_date', 'appointment_time'],
+                name='appt_patient_date_time_idx'
+            ),
+        ]
+
     def __str__(self):
         return f"{self.patient} → {self.doctor} on {self.appointment_date}"
 
 
+# -------------------------------------------------
+# Slot Inventory (precomputed bookable slots)
+# -------------------------------------------------
+class SlotInventory(models.Model):
+    """
+    One row per bookable slot of a doctor on a concrete date, expanded from
+    TimeSlot a rolling SLOT_INVENTORY_DAYS ahead (see users/availability.py).
+    """
+    doctor = models.ForeignKey(
+        DoctorProfile,
+        on_delete=models.CASCADE,
+        related_name='slot_inventory'
+    )
+    slot_date = models.DateField()
+    slot_time = models.TimeField()
+    is_booked = models.BooleanField(default=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['doctor', 'slot_date', 'slot_time'],
+                name='unique_inventory_slot'
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=['doctor', 'slot_date', 'is_booked', 'slot_time'],
+                name='inventory_free_slots_idx'
+            ),
+            # Open slots in chronological order, for "first available" search
+            models.Index(
+                fields=['slot_date', 'slot_time'],
+                condition=models.Q(is_booked=False),
+                name='inventory_open_slots_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.doctor} - {self.slot_date} {self.slot_time:%H:%M}"
+
+
+# -------------------------------------------------
+# Slot Hold (short-lived reservation while booking)
+# -------------------------------------------------
+class SlotHold(models.Model):
+    """
+    TTL reservation of a slot taken when a patient picks a time on the
+    booking form. Hidden from other patients until it expires or is
+    converted into an Appointment; expired rows are swept in bulk.
+    """
+    doctor = models.ForeignKey(
+        DoctorProfile,
+        on_delete=models.CASCADE,
+        related_name='slot_holds'
+    )
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='slot_holds'
+    )
+    hold_date = models.DateField()
+    hold_time = models.TimeField()
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['doctor', 'hold_date', 'hold_time'],
+                name='unique_slot_hold'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['expires_at'], name='slot_hold_expiry_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.doctor} - {self.hold_date} {self.hold_time:%H:%M} held by {self.user}"
+
+
+# -------------------------------------------------
+# Dashboard Counter (denormalized admin dashboard totals)
+# -------------------------------------------------
+class DashboardCounter(models.Model):
+    """
+    One row per admin dashboard total, adjusted in place by signals (see
+    users/dashboard_counters.py) and periodically reconciled against the
+    real counts by the reconcile_dashboard_counters command.
+    """
+    name = models.CharField(max_length=50, primary_key=True)
+    value = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name} = {self.value}"
+
+
+# -------------------------------------------------
+# Inbox Counter (denormalized unread counts per recipient)
+# -------------------------------------------------
+class InboxCounter(models.Model):
+    """
+    Unread counts shown in the admin and doctor panels, one row per user,
+    adjusted in place by users/inbox_counters.py. Admins share one inbox,
+    so every admin row moves together.
+    """
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='inbox_counter'
+    )
+    unread_messages = models.IntegerField(default=0)
+    unread_feedback = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.user} ({self.unread_messages}/{self.unread_feedback})"
+
+
+# -------------------------------------------------
+# Message Thread (a conversation between a doctor and the admins)
+# -------------------------------------------------
+class MessageThread(models.Model):
+    """
+    Groups the DoctorMessages of one conversation. The last message,
+    activity time, message count and each side's unread count are kept
+    up to date as messages are added and read (see users/message_threads.py
+    and users/inbox_counters.py), so inboxes list threads without touching
+    the messages.
+    """
+    doctor = models.ForeignKey(
+        DoctorProfile,
+        on_delete=models.CASCADE,
+        related_name='message_threads'
+    )
+    subject = models.CharField(max_length=255)
+    last_message = models.ForeignKey(
+        'DoctorMessage',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+'
+    )
+    last_activity = models.DateTimeField(default=timezone.now)
+    message_count = models.IntegerField(default=0)
+    doctor_unread = models.IntegerField(default=0)
+    admin_unread = models.IntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['doctor', 'last_activity'], name='thread_doctor_activity_idx'),
+            models.Index(fields=['last_activity'], name='thread_activity_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.doctor} | {self.subject}"
+
+
 #For doctor message to the admin
 
 class DoctorMessage(models.Model):
@@ -202,6 +439,14 @@ class DoctorMessage(models.Model):
         related_name='sent_doctor_messages'
     )
 
+    thread = models.ForeignKey(
+        MessageThread,
+        on_delete=models.CASCADE,
+        related_name='messages',
+        null=True,
+        blank=True
+    )
+
     subject = models.CharField(max_length=255)
     message = models.TextField()
     is_read = models.BooleanField(default=False)
@@ -209,6 +454,12 @@ class DoctorMessage(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['thread', 'created_at'], name='docmsg_thread_created_idx'),
+            models.Index(fields=['doctor', 'sender', 'is_read'], name='docmsg_doctor_sender_read_idx'),
+            models.Index(fields=['sender', 'created_at'], name='docmsg_sender_created_idx'),
+            models.Index(fields=['created_at'], name='docmsg_created_idx'),
+        ]
 
     def __str__(self):
         sender_name = self.sender.get_username() if self.sender else "Doctor"
@@ -224,6 +475,18 @@ class Feedback(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     is_read = models.BooleanField(default=False)  # <- Add this field
 
+    class Meta:
+        indexes = [
+            # Django renders is_read=False as NOT "is_read", which SQLite can
+            # only serve from a partial index with the same condition
+            models.Index(
+                fields=['-created_at'],
+                condition=models.Q(is_read=False),
+                name='feedback_unread_created_idx'
+            ),
+            models.Index(fields=['created_at'], name='feedback_created_idx'),
+        ]
+
     def __str__(self):
         return f"{self.patient.user.get_full_name} -> {self.doctor.user.get_full_name}"
 
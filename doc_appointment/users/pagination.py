@@ -0,0 +1,134 @@
+"""
+Keyset (cursor) pagination for the long listings.
+
+A page is fetched with `ORDER BY <ordering> LIMIT page_size + 1` and the
+next page starts strictly after the last row's ordering values, so every
+page costs the same index range scan however deep the patient scrolls.
+The ordering must end in a unique field (normally `id`) to be stable.
+Cursors are opaque URL-safe strings; a malformed one yields the first page.
+"""
+import base64
+import binascii
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.http import QueryDict
+
+
+PAGE_SIZE = 25
+
+# Newest first, ending in the primary key so ties keep a stable order
+APPOINTMENT_ORDERING = ('-appointment_date', '-appointment_time', '-id')
+# Soonest first, for appointments still to come
+UPCOMING_ORDERING = ('appointment_date', 'appointment_time', 'id')
+CREATED_ORDERING = ('-created_at', '-id')
+# Message threads, most recent activity first
+THREAD_ORDERING = ('-last_activity', '-id')
+
+
+class KeysetPage:
+    """
+    One page of rows plus the cursor of the next page (None on the last).
+    Iterates and tests truthy like the list of rows it wraps.
+    `next_query` is the current query string with the cursor advanced,
+    ready for a "Load more" link.
+    """
+
+    def __init__(self, items, next_cursor, next_query=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.next_query = next_query
+
+    @property
+    def has_more(self):
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __bool__(self):
+        return bool(self.items)
+
+
+def _field_names(ordering):
+    return [field.lstrip('-') for field in ordering]
+
+
+def encode_cursor(row, ordering):
+    values = []
+    for name in _field_names(ordering):
+        value = getattr(row, name)
+        values.append(value.isoformat() if hasattr(value, 'isoformat') else value)
+    raw = json.dumps(values, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(model, ordering, cursor):
+    """
+    Ordering values encoded in `cursor`, converted back to Python by the
+    model fields, or None when the cursor is missing or malformed.
+    """
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+        if not isinstance(values, list) or len(values) != len(ordering):
+            return None
+        # Only the scalars encode_cursor() writes; null or nested values
+        # cannot be compared against
+        if not all(isinstance(value, (str, int, float)) and not isinstance(value, bool) for value in values):
+            return None
+        return [
+            model._meta.get_field(name).to_python(value)
+            for name, value in zip(_field_names(ordering), values)
+        ]
+    except (binascii.Error, TypeError, ValueError, ValidationError):
+        return None
+
+
+def _after(ordering, values):
+    """
+    Rows strictly after `values` in `ordering`:
+    (a > x) OR (a = x AND b > y) OR ... with the direction of each field.
+    The leading a >= x bound lets the database start an index range scan.
+    """
+    names = _field_names(ordering)
+    lookups = ['lt' if field.startswith('-') else 'gt' for field in ordering]
+
+    condition = Q()
+    for i, (name, lookup) in enumerate(zip(names, lookups)):
+        term = Q(**{f"{name}__{lookup}": values[i]})
+        for prev_name, prev_value in zip(names[:i], values[:i]):
+            term &= Q(**{prev_name: prev_value})
+        condition |= term
+
+    return Q(**{f"{names[0]}__{lookups[0]}e": values[0]}) & condition
+
+
+def paginate_keyset(queryset, ordering, params=None, param='after', page_size=PAGE_SIZE):
+    """
+    The page of `queryset` in `ordering` following the cursor found in
+    `params[param]` (normally request.GET). Other params, such as the
+    listing filters, are carried over into the page's `next_query`.
+    """
+    params = params if params is not None else QueryDict()
+    queryset = queryset.order_by(*ordering)
+
+    values = decode_cursor(queryset.model, ordering, params.get(param))
+    if values is not None:
+        queryset = queryset.filter(_after(ordering, values))
+
+    rows = list(queryset[:page_size + 1])
+    items = rows[:page_size]
+    if len(rows) <= page_size:
+        return KeysetPage(items, None)
+
+    next_cursor = encode_cursor(items[-1], ordering)
+    next_params = params.copy()
+    next_params[param] = next_cursor
+    return KeysetPage(items, next_cursor, '?' + next_params.urlencode())
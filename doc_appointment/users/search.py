@@ -0,0 +1,249 @@
+"""
+Full-text doctor search on SQLite FTS5 tables.
+
+`users_doctor_search` holds one document per bookable doctor (approved,
+available, active user), with rowid = DoctorProfile.id, columns for the
+name, specialization, qualification and bio, and the specialization code
+unindexed; `users_doctor_name_search` holds the names alone. Signals keep
+both in step with DoctorProfile/User saves, inside the writer's
+transaction; doctors that stop being bookable are removed. Queries match
+every typed word as a prefix, for typeahead, and results are read back
+from the index, so a search never loads DoctorProfile or User.
+
+Names are searched first, then all columns to fill the remaining places,
+so a name match is never crowded out by bio text. The name tier has its
+own table because a column filter still walks the doclists of every
+column: "di" would read every bio mentioning diabetes only to find no
+names.
+
+bm25 needs the document frequency of each phrase and the score of every
+row it ranks, which is what made short prefixes slow on a large table.
+Each tier therefore ranks at most MAX_CANDIDATES matches (the first ones
+by rowid), and prefixes up to 6 letters are indexed so that the common
+typeahead words are a single doclist read.
+
+On databases without FTS5 search falls back to icontains filters.
+"""
+import re
+
+from django.db import connection, transaction
+from django.db.models import Q
+
+from users.models import DoctorProfile
+
+
+SEARCH_TABLE = 'users_doctor_search'
+
+NAME_TABLE = 'users_doctor_name_search'
+
+SEARCH_TABLE_DDL = f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5(
+        name, specialization, qualification, bio, specialization_code UNINDEXED,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3 4 5 6'
+    )
+"""
+
+NAME_TABLE_DDL = f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {NAME_TABLE} USING fts5(
+        name,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3 4 5 6'
+    )
+"""
+
+# bm25 over the first MAX_CANDIDATES matches; the weights are of name,
+# specialization, qualification, bio
+SEARCH_SQL = f"""
+    SELECT rowid FROM (
+        SELECT rowid, bm25({SEARCH_TABLE}, 10.0, 5.0, 2.0, 1.0) AS score
+        FROM {SEARCH_TABLE}
+        WHERE {SEARCH_TABLE} MATCH %s
+        LIMIT %s
+    )
+    ORDER BY score
+    LIMIT %s
+"""
+
+NAME_SEARCH_SQL = f"""
+    SELECT rowid FROM (
+        SELECT rowid, bm25({NAME_TABLE}) AS score
+        FROM {NAME_TABLE}
+        WHERE {NAME_TABLE} MATCH %s
+        LIMIT %s
+    )
+    ORDER BY score
+    LIMIT %s
+"""
+
+INSERT_SQL = (
+    f"INSERT INTO {SEARCH_TABLE}(rowid, name, specialization, qualification, bio, specialization_code) "
+    "VALUES (%s, %s, %s, %s, %s, %s)"
+)
+
+INSERT_NAME_SQL = f"INSERT INTO {NAME_TABLE}(rowid, name) VALUES (%s, %s)"
+
+SPECIALIZATION_LABELS = dict(DoctorProfile.SPECIALIZATION_CHOICES)
+
+MAX_RESULTS = 20
+# Matches ranked per tier; a common prefix can match most doctors
+MAX_CANDIDATES = 200
+# Words beyond this are ignored; they rarely narrow a typeahead further
+MAX_QUERY_WORDS = 6
+INDEX_CHUNK_SIZE = 500
+
+
+def fts_enabled():
+    return connection.vendor == 'sqlite'
+
+
+def bookable_doctors():
+    return DoctorProfile.objects.filter(
+        is_approved=True,
+        is_available=True,
+        user__is_active=True
+    )
+
+
+def search_document(doctor):
+    """
+    (name, specialization, qualification, bio, specialization code) of a
+    doctor.
+    """
+    user = doctor.user
+    return (
+        user.get_full_name() or user.username,
+        f"{doctor.get_specialization_display()} {doctor.specialization}",
+        doctor.qualification or '',
+        doctor.bio or '',
+        doctor.specialization,
+    )
+
+
+def match_expression(text):
+    """
+    FTS5 query requiring every word of `text` as a prefix, or None when
+    there is nothing to search for. Words are quoted, so FTS5 syntax in the
+    input is never interpreted.
+    """
+    words = re.findall(r'\w+', text.lower())[:MAX_QUERY_WORDS]
+    if not words:
+        return None
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def search_tiers():
+    """
+    Queries to run in order: names alone, then all columns.
+    """
+    return [NAME_SEARCH_SQL, SEARCH_SQL]
+
+
+def ranked_ids(execute, expression, limit=MAX_RESULTS):
+    """
+    Doctor ids for a match expression, best first. `execute(sql, params)`
+    runs one of search_tiers() and returns its rows, so this works with any
+    DB-API cursor.
+    """
+    found = []
+    for sql in search_tiers():
+        for (doctor_id,) in execute(sql, [expression, MAX_CANDIDATES, limit]):
+            if doctor_id not in found:
+                found.append(doctor_id)
+        if len(found) >= limit:
+            break
+    return found[:limit]
+
+
+def _insert_documents(cursor, doctor_ids):
+    rows = [
+        (doctor.id, *search_document(doctor))
+        for doctor in bookable_doctors().filter(id__in=doctor_ids).select_related('user')
+    ]
+    if rows:
+        cursor.executemany(INSERT_SQL, rows)
+        cursor.executemany(INSERT_NAME_SQL, [row[:2] for row in rows])
+
+
+def index_doctors(doctor_ids):
+    """
+    Refresh the documents of the given doctors; doctors that are no longer
+    bookable (or no longer exist) are dropped from the index.
+    """
+    if not fts_enabled():
+        return
+    doctor_ids = list(doctor_ids)
+    with connection.cursor() as cursor:
+        for table in (SEARCH_TABLE, NAME_TABLE):
+            cursor.executemany(
+                f"DELETE FROM {table} WHERE rowid = %s",
+                [(doctor_id,) for doctor_id in doctor_ids]
+            )
+        _insert_documents(cursor, doctor_ids)
+
+
+def rebuild_search_index():
+    """
+    Re-index every bookable doctor from scratch. Returns the number indexed.
+    """
+    if not fts_enabled():
+        return 0
+
+    doctor_ids = list(bookable_doctors().order_by('id').values_list('id', flat=True))
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE}")
+        cursor.execute(f"DELETE FROM {NAME_TABLE}")
+        for i in range(0, len(doctor_ids), INDEX_CHUNK_SIZE):
+            _insert_documents(cursor, doctor_ids[i:i + INDEX_CHUNK_SIZE])
+    return len(doctor_ids)
+
+
+def search_result(doctor_id, name, specialization):
+    return {
+        'id': doctor_id,
+        'name': name,
+        'specialization': specialization,
+        'specialization_display': SPECIALIZATION_LABELS.get(specialization, specialization),
+    }
+
+
+def search_doctors(text, limit=MAX_RESULTS):
+    """
+    Bookable doctors matching `text`, best match first, as search_result()
+    dicts.
+    """
+    expression = match_expression(text)
+    if expression is None:
+        return []
+
+    if not fts_enabled():
+        doctors = bookable_doctors().select_related('user')
+        for word in re.findall(r'\w+', text)[:MAX_QUERY_WORDS]:
+            doctors = doctors.filter(
+                Q(user__first_name__icontains=word)
+                | Q(user__last_name__icontains=word)
+                | Q(specialization__icontains=word)
+                | Q(qualification__icontains=word)
+                | Q(bio__icontains=word)
+            )
+        return [
+            search_result(doctor.id, doctor.user.get_full_name() or doctor.user.username, doctor.specialization)
+            for doctor in doctors.order_by('id')[:limit]
+        ]
+
+    with connection.cursor() as cursor:
+        def execute(sql, params):
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+        doctor_ids = ranked_ids(execute, expression, limit)
+        if not doctor_ids:
+            return []
+        cursor.execute(
+            f"SELECT rowid, name, specialization_code FROM {SEARCH_TABLE} "
+            f"WHERE rowid IN ({', '.join(['%s'] * len(doctor_ids))})",
+            doctor_ids
+        )
+        rows = {row[0]: row for row in cursor.fetchall()}
+
+    return [search_result(*rows[doctor_id]) for doctor_id in doctor_ids if doctor_id in rows]
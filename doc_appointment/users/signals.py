@@ -0,0 +1,303 @@
+from datetime import date
+
+from django.db import connections, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_migrate, post_save, pre_save
+from django.dispatch import receiver
+
+from users.availability import rebuild_on_commit, rebuild_slot_inventory, refresh_inventory_day
+from users.cache_versions import bump_on_commit
+from users.dashboard_counters import adjust
+from users import events
+from users.inbox_counters import COUNTED_ROLES, actual_counts, adjust_feedback, adjust_messages
+from users.medical_pdf import prerender
+from users.message_threads import message_added, message_removed
+from users.search import index_doctors
+from users.models import (
+    Appointment, DoctorMessage, DoctorProfile, Feedback, InboxCounter, MedicalHistory,
+    MessageThread, PatientProfile, SlotHold, TimeSlot, User
+)
+
+
+# -------------------------------------------------
+# Slot inventory maintenance
+# -------------------------------------------------
+
+@receiver(post_migrate)
+def build_missing_inventory(sender, using, **kwargs):
+    """
+    Build the inventory of doctors that have none (or a lapsed one) after
+    `migrate`, so an upgraded database offers slots straight away. Skipped
+    while migrations are still unapplied: the rebuild needs today's schema.
+    """
+    if sender.label != 'users':
+        return
+    executor = MigrationExecutor(connections[using])
+    if executor.migration_plan(executor.loader.graph.leaf_nodes()):
+        return
+
+    doctor_ids = list(DoctorProfile.objects.using(using).filter(
+        Q(slot_inventory_until__isnull=True) | Q(slot_inventory_until__lt=date.today())
+    ).values_list('id', flat=True))
+    if doctor_ids:
+        rebuild_slot_inventory(doctor_ids)
+
+
+@receiver(pre_save, sender=TimeSlot)
+def timeslot_saving(sender, instance, **kwargs):
+    # Moving a window to another weekday changes the day it leaves too
+    instance._previous_day = TimeSlot.objects.filter(pk=instance.pk).values_list(
+        'day_of_week', flat=True
+    ).first() if instance.pk else None
+
+
+@receiver(post_save, sender=TimeSlot)
+@receiver(post_delete, sender=TimeSlot)
+def timeslot_changed(sender, instance, **kwargs):
+    weekdays = {instance.day_of_week}
+    if getattr(instance, '_previous_day', None):
+        weekdays.add(instance._previous_day)
+    # Deferred so a cascade delete of the doctor has finished before we rebuild
+    rebuild_on_commit(instance.doctor_id, weekdays)
+
+
+@receiver(pre_save, sender=DoctorProfile)
+def doctor_profile_saving(sender, instance, **kwargs):
+    if instance.pk is None:
+        return
+
+    previous = DoctorProfile.objects.filter(pk=instance.pk).values_list(
+        'slot_minutes', 'buffer_minutes', 'specialization', 'is_available', 'is_approved'
+    ).first()
+    if not previous:
+        return
+
+    # Read back by doctor_counted_on_save
+    instance._previous_flags = previous[3:]
+
+    if previous[:2] != (instance.slot_minutes, instance.buffer_minutes):
+        rebuild_on_commit(instance.pk)
+
+    # Moving specialization must also refresh the list the doctor left
+    if previous[2] != instance.specialization:
+        bump_on_commit('specialization', previous[2])
+
+
+@receiver(pre_save, sender=Appointment)
+def appointment_saving(sender, instance, **kwargs):
+    # A reschedule frees the slot it leaves
+    instance._previous_day = Appointment.objects.filter(pk=instance.pk).values_list(
+        'doctor_id', 'appointment_date'
+    ).first() if instance.pk else None
+
+
+@receiver(post_save, sender=Appointment)
+@receiver(post_delete, sender=Appointment)
+def appointment_changed(sender, instance, **kwargs):
+    day = (instance.doctor_id, instance.appointment_date)
+    previous = getattr(instance, '_previous_day', None)
+    if previous and previous != day:
+        refresh_inventory_day(*previous)
+    refresh_inventory_day(*day)
+
+
+# -------------------------------------------------
+# Response cache versions (ETags of the booking AJAX endpoints)
+# -------------------------------------------------
+
+@receiver(post_save, sender=Appointment)
+@receiver(post_delete, sender=Appointment)
+@receiver(post_save, sender=TimeSlot)
+@receiver(post_delete, sender=TimeSlot)
+@receiver(post_save, sender=SlotHold)
+@receiver(post_delete, sender=SlotHold)
+def doctor_availability_changed(sender, instance, **kwargs):
+    bump_on_commit('doctor', instance.doctor_id)
+
+
+@receiver(post_save, sender=DoctorProfile)
+@receiver(post_delete, sender=DoctorProfile)
+def doctor_profile_changed(sender, instance, **kwargs):
+    bump_on_commit('doctor', instance.pk)
+    bump_on_commit('specialization', instance.specialization)
+
+
+@receiver(post_save, sender=User)
+def doctor_user_changed(sender, instance, created, update_fields=None, **kwargs):
+    # Doctor names are part of the specialization lists; logins only touch last_login
+    if created or instance.role != 'doctor' or update_fields == frozenset({'last_login'}):
+        return
+
+    specialization = DoctorProfile.objects.filter(user=instance).values_list(
+        'specialization', flat=True
+    ).first()
+    if specialization:
+        bump_on_commit('specialization', specialization)
+
+
+# -------------------------------------------------
+# Admin dashboard counters
+# -------------------------------------------------
+
+def _doctor_flag_counts(is_available, is_approved):
+    return int(bool(is_available)), int(not is_approved)
+
+
+@receiver(post_save, sender=DoctorProfile)
+def doctor_counted_on_save(sender, instance, created, update_fields=None, **kwargs):
+    if created:
+        adjust('doctors', 1)
+        before = (0, 0)
+    else:
+        previous = getattr(instance, '_previous_flags', None)
+        if previous is None:
+            return
+        if update_fields is not None and not {'is_available', 'is_approved'} & update_fields:
+            return
+        before = _doctor_flag_counts(*previous)
+
+    available, pending = _doctor_flag_counts(instance.is_available, instance.is_approved)
+    adjust('available_doctors', available - before[0])
+    adjust('pending_doctors', pending - before[1])
+
+
+@receiver(post_delete, sender=DoctorProfile)
+def doctor_counted_on_delete(sender, instance, **kwargs):
+    available, pending = _doctor_flag_counts(instance.is_available, instance.is_approved)
+    adjust('doctors', -1)
+    adjust('available_doctors', -available)
+    adjust('pending_doctors', -pending)
+
+
+@receiver(post_save, sender=PatientProfile)
+@receiver(post_save, sender=Appointment)
+def row_counted_on_create(sender, instance, created, **kwargs):
+    if created:
+        adjust('patients' if sender is PatientProfile else 'appointments', 1)
+
+
+@receiver(post_delete, sender=PatientProfile)
+@receiver(post_delete, sender=Appointment)
+def row_counted_on_delete(sender, instance, **kwargs):
+    adjust('patients' if sender is PatientProfile else 'appointments', -1)
+
+
+# -------------------------------------------------
+# Inbox unread counters
+# -------------------------------------------------
+
+@receiver(post_save, sender=User)
+def inbox_counter_on_user_created(sender, instance, created, **kwargs):
+    if created and instance.role in COUNTED_ROLES:
+        messages, feedback = actual_counts(instance)
+        InboxCounter.objects.get_or_create(
+            user=instance,
+            defaults={'unread_messages': messages, 'unread_feedback': feedback}
+        )
+
+
+@receiver(pre_save, sender=DoctorMessage)
+@receiver(pre_save, sender=Feedback)
+def message_read_state(sender, instance, **kwargs):
+    # Saves that flip is_read outside mark_message_read/mark_feedback_read
+    instance._was_unread = bool(
+        instance.pk
+        and sender.objects.filter(pk=instance.pk, is_read=False).exists()
+    )
+
+
+@receiver(post_save, sender=DoctorMessage)
+def message_counted_on_save(sender, instance, created, **kwargs):
+    was_unread = False if created else instance._was_unread
+    adjust_messages(instance, int(not instance.is_read) - int(was_unread))
+
+
+@receiver(post_delete, sender=DoctorMessage)
+def message_counted_on_delete(sender, instance, **kwargs):
+    if not instance.is_read:
+        adjust_messages(instance, -1)
+
+
+@receiver(post_save, sender=Feedback)
+def feedback_counted_on_save(sender, instance, created, **kwargs):
+    was_unread = False if created else instance._was_unread
+    adjust_feedback(int(not instance.is_read) - int(was_unread))
+
+
+@receiver(post_delete, sender=Feedback)
+def feedback_counted_on_delete(sender, instance, **kwargs):
+    if not instance.is_read:
+        adjust_feedback(-1)
+
+
+# -------------------------------------------------
+# Message threads
+# -------------------------------------------------
+
+@receiver(post_save, sender=DoctorMessage)
+def thread_message_added(sender, instance, created, **kwargs):
+    if created and instance.thread_id is not None:
+        message_added(instance)
+
+
+@receiver(post_delete, sender=DoctorMessage)
+def thread_message_removed(sender, instance, **kwargs):
+    if instance.thread_id is not None:
+        message_removed(instance)
+
+
+# -------------------------------------------------
+# Live events (users/events.py)
+# -------------------------------------------------
+
+@receiver(post_save, sender=Appointment)
+def appointment_published(sender, instance, **kwargs):
+    events.appointment_changed(instance)
+
+
+@receiver(post_save, sender=DoctorMessage)
+def message_published(sender, instance, created, **kwargs):
+    if instance.thread_id is not None:
+        events.thread_changed(instance.thread_id, instance.doctor_id, instance.id if created else None)
+
+
+@receiver(post_delete, sender=DoctorMessage)
+def message_delete_published(sender, instance, **kwargs):
+    if instance.thread_id is not None:
+        events.thread_changed(instance.thread_id, instance.doctor_id)
+
+
+@receiver(post_delete, sender=MessageThread)
+def thread_delete_published(sender, instance, **kwargs):
+    events.thread_changed(instance.pk, instance.doctor_id)
+
+
+# -------------------------------------------------
+# Medical history PDFs (users/medical_pdf.py)
+# -------------------------------------------------
+
+@receiver(post_save, sender=MedicalHistory)
+def medical_history_saved(sender, instance, **kwargs):
+    # Render the new version before the patient asks for it
+    history_id = instance.pk
+    transaction.on_commit(lambda: prerender(history_id))
+
+
+# -------------------------------------------------
+# Doctor search index
+# -------------------------------------------------
+
+@receiver(post_save, sender=DoctorProfile)
+@receiver(post_delete, sender=DoctorProfile)
+def doctor_search_document_changed(sender, instance, **kwargs):
+    # Re-reads the row, so a deleted or no longer bookable doctor drops out
+    index_doctors([instance.pk])
+
+
+@receiver(post_save, sender=User)
+def doctor_search_name_changed(sender, instance, created, update_fields=None, **kwargs):
+    if created or instance.role != 'doctor' or update_fields == frozenset({'last_login'}):
+        return
+
+    index_doctors(DoctorProfile.objects.filter(user=instance).values_list('id', flat=True))
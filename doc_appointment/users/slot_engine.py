@@ -0,0 +1,67 @@
+"""
+Slot generation on integer minute offsets (0 = 00:00, 1439 = 23:59).
+
+Windows are expanded with plain `range` objects and merged as sets of ints;
+`datetime.time` objects and "HH:MM" strings are only produced at the edges
+(database writes and JSON output), from tables built once per process.
+"""
+from datetime import time
+
+
+MINUTES_PER_DAY = 24 * 60
+
+DEFAULT_SLOT_MINUTES = 30
+DEFAULT_BUFFER_MINUTES = 0
+
+_TIMES = [time(m // 60, m % 60) for m in range(MINUTES_PER_DAY)]
+_LABELS = [f"{m // 60:02d}:{m % 60:02d}" for m in range(MINUTES_PER_DAY)]
+
+
+def to_minutes(t):
+    return t.hour * 60 + t.minute
+
+
+def to_time(minutes):
+    return _TIMES[minutes]
+
+
+def label(minutes):
+    return _LABELS[minutes]
+
+
+def expand(windows, slot_minutes=DEFAULT_SLOT_MINUTES, buffer_minutes=DEFAULT_BUFFER_MINUTES):
+    """
+    Sorted, de-duplicated slot start offsets for (start, end) windows given
+    in minutes. A slot fits when start + slot_minutes <= end; consecutive
+    slots are slot_minutes + buffer_minutes apart.
+    """
+    step = slot_minutes + buffer_minutes
+    if len(windows) == 1:
+        start, end = windows[0]
+        return list(range(start, end - slot_minutes + 1, step))
+
+    starts = set()
+    for start, end in windows:
+        starts.update(range(start, end - slot_minutes + 1, step))
+    return sorted(starts)
+
+
+def expand_times(windows, slot_minutes=DEFAULT_SLOT_MINUTES, buffer_minutes=DEFAULT_BUFFER_MINUTES):
+    """
+    Same as expand() for (start_time, end_time) windows of datetime.time.
+    """
+    return expand(
+        [(to_minutes(start), to_minutes(end)) for start, end in windows],
+        slot_minutes,
+        buffer_minutes
+    )
+
+
+def overlaps(start, minutes, busy):
+    """
+    Whether the slot [start, start + minutes) overlaps any of the busy
+    (start, end) intervals. Appointments and holds block every slot they
+    overlap, not only the one starting at the same minute.
+    """
+    end = start + minutes
+    return any(busy_start < end and busy_end > start for busy_start, busy_end in busy)
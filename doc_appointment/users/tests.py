@@ -1,3 +1,1084 @@
-from django.test import TestCase
+import asyncio
+import base64
+import csv
+import gzip
+import json
+import re
+import tempfile
+from datetime import date, time, timedelta
+from importlib import import_module
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.apps import apps as django_apps
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.http import QueryDict
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from users import appointment_export, events, search, slot_engine
+from users.availability import (
+    WEEKDAY_CODES, available_times, earliest_open_slots, find_inventory_drift,
+    inventory_days, past_cutoff, rebuild_slot_inventory, refresh_inventory_day
+)
+from users.dashboard_counters import read_counters, reconcile_counters
+from users.inbox_counters import mark_message_read, reconcile_inbox_counters, unread_counts
+from users.message_threads import reconcile_threads, reply, start_thread
+from users.search import rebuild_search_index, search_doctors
+from users.signals import build_missing_inventory
+from users.pagination import (
+    APPOINTMENT_ORDERING, CREATED_ORDERING, encode_cursor, paginate_keyset
+)
+from users.models import (
+    Appointment, DoctorMessage, DoctorProfile, Feedback, MedicalHistory,
+    MessageThread, PatientProfile, SlotInventory, TimeSlot, User
+)
+
+
+class SlotEngineTests(SimpleTestCase):
+
+    def test_slot_must_fit_before_window_end(self):
+        self.assertEqual(slot_engine.expand([(9 * 60, 10 * 60 + 40)], 30), [540, 570, 600])
+
+    def test_buffer_spaces_consecutive_slots(self):
+        self.assertEqual(slot_engine.expand([(9 * 60, 12 * 60)], 45, 15), [540, 600, 660])
+
+    def test_overlapping_windows_are_deduplicated(self):
+        self.assertEqual(
+            slot_engine.expand([(540, 600), (570, 660)], 30),
+            [540, 570, 600, 630]
+        )
+
+    def test_overlap_is_by_interval_not_start(self):
+        busy = [(570, 600)]
+        self.assertTrue(slot_engine.overlaps(540, 60, busy))
+        self.assertFalse(slot_engine.overlaps(540, 30, busy))
+        self.assertFalse(slot_engine.overlaps(600, 60, busy))
+
+    def test_labels_are_formatted_at_the_edge(self):
+        self.assertEqual(slot_engine.label(0), '00:00')
+        self.assertEqual(slot_engine.label(9 * 60 + 5), '09:05')
+        self.assertEqual(slot_engine.to_minutes(slot_engine.to_time(1439)), 1439)
+
+
+class SlotInventoryTests(TestCase):
+
+    def setUp(self):
+        self.doctor = DoctorProfile.objects.create(
+            user=User.objects.create_user('doc', role='doctor'), is_approved=True
+        )
+        self.patient = PatientProfile.objects.create(
+            user=User.objects.create_user('pat', role='patient'),
+            date_of_birth=date(1990, 1, 1),
+            gender='other'
+        )
+        self.day = date.today() + timedelta(days=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            TimeSlot.objects.create(
+                doctor=self.doctor, day_of_week=WEEKDAY_CODES[self.day.weekday()],
+                start_time=time(9, 0), end_time=time(10, 0)
+            )
+
+    def day_slots(self):
+        return list(
+            SlotInventory.objects.filter(doctor=self.doctor, slot_date=self.day)
+            .order_by('slot_time').values_list('slot_time', 'is_booked')
+        )
+
+    def test_timeslot_save_builds_the_horizon(self):
+        self.doctor.refresh_from_db()
+        self.assertEqual(
+            self.doctor.slot_inventory_until,
+            date.today() + timedelta(days=inventory_days() - 1)
+        )
+        self.assertEqual(self.day_slots(), [(time(9, 0), False), (time(9, 30), False)])
+
+    def test_rebuild_marks_booked_slots(self):
+        Appointment.objects.bulk_create([Appointment(
+            doctor=self.doctor, patient=self.patient,
+            appointment_date=self.day, appointment_time=time(9, 30)
+        )])
+        self.assertEqual(find_inventory_drift(), {self.doctor.id: {'missing': 0, 'extra': 0, 'wrong_booked': 1}})
+
+        written = rebuild_slot_inventory([self.doctor.id])
+
+        self.assertEqual(written, SlotInventory.objects.filter(doctor=self.doctor).count())
+        self.assertEqual(self.day_slots(), [(time(9, 0), False), (time(9, 30), True)])
+        self.assertEqual(find_inventory_drift(), {})
+
+    def test_refresh_follows_appointment_status(self):
+        appointment = Appointment.objects.create(
+            doctor=self.doctor, patient=self.patient,
+            appointment_date=self.day, appointment_time=time(9, 0)
+        )
+        self.assertEqual(self.day_slots()[0], (time(9, 0), True))
+
+        # Bulk updates skip the signal; a refresh re-derives the flag
+        Appointment.objects.filter(id=appointment.id).update(status='cancelled')
+        refresh_inventory_day(self.doctor.id, self.day)
+
+        self.assertEqual(self.day_slots()[0], (time(9, 0), False))
+
+    def test_longer_slots_respect_existing_appointments(self):
+        Appointment.objects.create(
+            doctor=self.doctor, patient=self.patient,
+            appointment_date=self.day, appointment_time=time(9, 30), duration_minutes=30
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            TimeSlot.objects.filter(doctor=self.doctor).update(end_time=time(11, 0))
+            self.doctor.slot_minutes = 60
+            self.doctor.save()
+
+        # 09:00-10:00 overlaps the 09:30 appointment, 10:00-11:00 does not
+        self.assertEqual(self.day_slots(), [(time(9, 0), True), (time(10, 0), False)])
+        self.assertEqual(find_inventory_drift(), {})
+
+    def test_queryset_delete_rebuilds_once(self):
+        TimeSlot.objects.bulk_create(
+            TimeSlot(doctor=self.doctor, day_of_week=code, start_time=time(14, 0), end_time=time(15, 0))
+            for code in ('mon', 'tue', 'wed')
+        )
+
+        with CaptureQueriesContext(connection) as queries:
+            with self.captureOnCommitCallbacks(execute=True):
+                TimeSlot.objects.filter(doctor=self.doctor).delete()
+
+        rebuilds = [q for q in queries if q['sql'].startswith('DELETE FROM "users_slotinventory"')]
+        self.assertEqual(len(rebuilds), 1)
+        self.assertFalse(SlotInventory.objects.filter(doctor=self.doctor).exists())
+
+    def test_reschedule_frees_the_old_slot(self):
+        appointment = Appointment.objects.create(
+            doctor=self.doctor, patient=self.patient,
+            appointment_date=self.day, appointment_time=time(9, 0)
+        )
+
+        appointment.appointment_time = time(9, 30)
+        appointment.save()
+
+        self.assertEqual(self.day_slots(), [(time(9, 0), False), (time(9, 30), True)])
+
+    def test_timeslot_change_rebuilds_only_its_weekdays(self):
+        untouched = set(SlotInventory.objects.filter(doctor=self.doctor).values_list('id', flat=True))
+        other_day = self.day + timedelta(days=1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            TimeSlot.objects.create(
+                doctor=self.doctor, day_of_week=WEEKDAY_CODES[other_day.weekday()],
+                start_time=time(14, 0), end_time=time(15, 0)
+            )
+
+        self.assertTrue(untouched <= set(SlotInventory.objects.values_list('id', flat=True)))
+        self.assertEqual(
+            list(SlotInventory.objects.filter(slot_date=other_day).values_list('slot_time', flat=True)),
+            [time(14, 0), time(14, 30)]
+        )
+        self.assertEqual(find_inventory_drift(), {})
+
+    def test_todays_passed_slots_are_hidden_everywhere(self):
+        today = date.today()
+        with self.captureOnCommitCallbacks(execute=True):
+            TimeSlot.objects.create(
+                doctor=self.doctor, day_of_week=WEEKDAY_CODES[today.weekday()],
+                start_time=time(0, 0), end_time=time(23, 59)
+            )
+
+        offered = available_times(self.doctor, today)
+        earliest = [
+            slot_engine.to_minutes(slot.slot_time)
+            for slot in earliest_open_slots(self.doctor.specialization, today, today, limit=48)
+        ]
+        self.assertEqual(offered, earliest)
+        self.assertTrue(all(minutes > past_cutoff(today) for minutes in offered))
+
+    def test_migrate_builds_missing_inventory(self):
+        SlotInventory.objects.all().delete()
+        DoctorProfile.objects.update(slot_inventory_until=None)
+
+        build_missing_inventory(django_apps.get_app_config('users'), using='default')
+
+        self.assertEqual(self.day_slots(), [(time(9, 0), False), (time(9, 30), False)])
+        self.assertEqual(find_inventory_drift(), {})
+
+
+class QueryPlanTests(TestCase):
+    """
+    Request each hot view, EXPLAIN QUERY PLAN every SELECT it ran and fail
+    if any of them falls back to a full table scan. The plans come from the
+    SQL the views actually execute, so they cannot drift from the tests.
+    """
+    # A handful of rows by design, read whole
+    SMALL_TABLES = {'users_dashboardcounter'}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user('boss', role='admin', is_staff=True, is_superuser=True)
+        cls.doctor_user = User.objects.create_user('doc', role='doctor')
+        cls.doctor = DoctorProfile.objects.create(user=cls.doctor_user, is_approved=True)
+        cls.patient_user = User.objects.create_user('pat', role='patient')
+        cls.patient = PatientProfile.objects.create(
+            user=cls.patient_user, date_of_birth=date(1990, 1, 1), gender='other'
+        )
+        cls.today = date.today()
+        Appointment.objects.create(
+            doctor=cls.doctor, patient=cls.patient,
+            appointment_date=cls.today, appointment_time=time(9, 0)
+        )
+        cls.thread = start_thread(cls.doctor, cls.doctor_user, 'Leave', 'Next week')
+
+    def table_scans(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            details = [row[-1] for row in cursor.fetchall()]
+        return [
+            detail for detail in details
+            if detail.startswith('SCAN ') and ' USING ' not in detail
+            and detail.split()[1] not in self.SMALL_TABLES
+        ]
+
+    def assertNoTableScan(self, user, url_name, params=None, args=()):
+        self.client.force_login(user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse(url_name, args=args), params or {})
+        self.assertEqual(response.status_code, 200, url_name)
+
+        for query in queries:
+            if not query['sql'].startswith('SELECT'):
+                continue
+            scans = self.table_scans(query['sql'])
+            if scans:
+                self.fail(f"{url_name} does a full table scan ({', '.join(scans)}):\n{query['sql']}")
+
+    def test_doctor_views(self):
+        for url_name in ('doctor_dashboard', 'doctor_appointments', 'doctor_past_appointments',
+                         'doctor_availability', 'doctor_messages'):
+            self.assertNoTableScan(self.doctor_user, url_name)
+        self.assertNoTableScan(self.doctor_user, 'doctor_message_thread', args=[self.thread.id])
+
+    def test_patient_views(self):
+        for url_name in ('patient_dashboard', 'view_appointments'):
+            self.assertNoTableScan(self.patient_user, url_name)
+
+        self.assertNoTableScan(self.patient_user, 'get_available_slots', {
+            'doctor_id': self.doctor.id, 'date': self.today.isoformat()
+        })
+        self.assertNoTableScan(self.patient_user, 'get_available_slots_range', {
+            'doctor_id': self.doctor.id,
+            'from': self.today.isoformat(),
+            'to': (self.today + timedelta(days=6)).isoformat(),
+        })
+        self.assertNoTableScan(self.patient_user, 'get_first_available_slots', {'specialization': 'general'})
+
+    def test_admin_views(self):
+        for url_name in ('admin_dashboard', 'admin_doctor_messages', 'patient_messages', 'manage_patients'):
+            self.assertNoTableScan(self.admin, url_name)
+        self.assertNoTableScan(self.admin, 'admin_patient_appointments', args=[self.patient.id])
+
+
+class KeysetPaginationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = DoctorProfile.objects.create(user=User.objects.create_user('doc', role='doctor'))
+        cls.patient = PatientProfile.objects.create(
+            user=User.objects.create_user('pat', role='patient'),
+            date_of_birth=date(1990, 1, 1),
+            gender='other'
+        )
+        # Several appointments per day so the time and id tie-breakers matter
+        Appointment.objects.bulk_create(
+            Appointment(
+                doctor=cls.doctor,
+                patient=cls.patient,
+                appointment_date=date(2025, 1, 1) + timedelta(days=i // 4),
+                appointment_time=time(9 + i % 2, 0),
+                status='completed' if i % 3 else 'cancelled'
+            )
+            for i in range(30)
+        )
+
+    def walk(self, queryset, params=None):
+        seen = []
+        params = QueryDict(mutable=True) if params is None else params
+        while True:
+            page = paginate_keyset(queryset, APPOINTMENT_ORDERING, params, page_size=7)
+            seen.extend(appointment.id for appointment in page)
+            if not page.has_more:
+                return seen
+            params = QueryDict(page.next_query[1:])
+
+    def test_pages_cover_every_row_once_in_order(self):
+        appointments = Appointment.objects.filter(doctor=self.doctor)
+
+        self.assertEqual(
+            self.walk(appointments),
+            list(appointments.order_by(*APPOINTMENT_ORDERING).values_list('id', flat=True))
+        )
+
+    def test_next_query_keeps_filters(self):
+        page = paginate_keyset(
+            Appointment.objects.filter(status='completed'),
+            APPOINTMENT_ORDERING,
+            QueryDict('status=completed'),
+            page_size=5
+        )
+
+        next_params = QueryDict(page.next_query[1:])
+        self.assertEqual(next_params['status'], 'completed')
+        self.assertEqual(next_params['after'], page.next_cursor)
+
+    def test_malformed_cursor_returns_first_page(self):
+        queryset = Appointment.objects.all()
+        first = paginate_keyset(queryset, APPOINTMENT_ORDERING, page_size=5)
+
+        # Well-formed JSON with values of the wrong type
+        wrong_types = [
+            base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+            for raw in ('[[1],"10:00",1]', '[null,"10:00",1]', '["2025-01-01",{"a":1},1]', '[true,false,1]')
+        ]
+        for cursor in ['garbage', encode_cursor(first.items[0], CREATED_ORDERING)] + wrong_types:
+            with self.subTest(cursor=cursor):
+                page = paginate_keyset(queryset, APPOINTMENT_ORDERING, QueryDict(f'after={cursor}'), page_size=5)
+                self.assertEqual(page.items, first.items)
+
+    def test_deep_page_uses_index_without_sorting(self):
+        last = Appointment.objects.order_by(*APPOINTMENT_ORDERING).last()
+        params = QueryDict(f'after={encode_cursor(last, APPOINTMENT_ORDERING)}')
+
+        with CaptureQueriesContext(connection) as queries:
+            paginate_keyset(Appointment.objects.filter(doctor=self.doctor), APPOINTMENT_ORDERING, params)
+
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + queries[0]['sql'])
+            plan = ' '.join(row[-1] for row in cursor.fetchall())
+        self.assertIn('appt_doctor_date_time_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+
+class DashboardCounterTests(TestCase):
+
+    def setUp(self):
+        self.doctor = DoctorProfile.objects.create(
+            user=User.objects.create_user('doc', role='doctor')
+        )
+        self.patient = PatientProfile.objects.create(
+            user=User.objects.create_user('pat', role='patient'),
+            date_of_birth=date(1990, 1, 1),
+            gender='other'
+        )
+
+    def assertCountersConsistent(self):
+        self.assertEqual(reconcile_counters(), {})
+
+    def test_signals_track_creates_updates_and_deletes(self):
+        appointment = Appointment.objects.create(
+            doctor=self.doctor, patient=self.patient,
+            appointment_date=date.today(), appointment_time=time(10, 0)
+        )
+        message = DoctorMessage.objects.create(doctor=self.doctor, subject='Hi', message='...')
+        self.assertCountersConsistent()
+
+        self.doctor.is_available = False
+        self.doctor.is_approved = True
+        self.doctor.save()
+        message.is_read = True
+        message.save()
+        self.assertCountersConsistent()
+
+        appointment.delete()
+        self.doctor.user.delete()
+        self.assertCountersConsistent()
+        self.assertEqual(read_counters()['doctors'], 0)
+
+    def test_reconcile_repairs_bulk_update_drift(self):
+        DoctorProfile.objects.update(is_available=False)
+
+        self.assertEqual(reconcile_counters(), {'available_doctors': (1, 0)})
+        self.assertCountersConsistent()
+
+    def test_dashboard_reads_counters_in_one_query(self):
+        admin = User.objects.create_user('boss', password='pass', role='admin')
+        self.client.force_login(admin)
+        self.doctor.is_available = False
+        self.doctor.save()
+
+        # session, user, counters, doctors on leave, inbox counts
+        with self.assertNumQueries(5):
+            response = self.client.get(reverse('admin_dashboard'))
+
+        self.assertContains(response, 'Dr. ')
+
+
+class InboxCounterTests(TestCase):
+
+    def setUp(self):
+        self.admins = [User.objects.create_user(f'admin{i}', role='admin') for i in range(2)]
+        self.doctor = DoctorProfile.objects.create(
+            user=User.objects.create_user('doc', role='doctor')
+        )
+        self.patient = PatientProfile.objects.create(
+            user=User.objects.create_user('pat', role='patient'),
+            date_of_birth=date(1990, 1, 1),
+            gender='other'
+        )
+
+    def counts(self, user):
+        counts = unread_counts(user)
+        return counts['unread_messages'], counts['unread_feedback']
+
+    def test_messages_count_for_their_recipient(self):
+        DoctorMessage.objects.create(doctor=self.doctor, sender=self.doctor.user, subject='Hi', message='...')
+        reply = DoctorMessage.objects.create(doctor=self.doctor, sender=self.admins[0], subject='Re: Hi', message='...')
+        Feedback.objects.create(patient=self.patient, doctor=self.doctor, message='Thanks')
+
+        self.assertEqual(self.counts(self.admins[1]), (1, 1))
+        self.assertEqual(self.counts(self.doctor.user), (1, 0))
+        self.assertEqual(self.counts(self.patient.user), (0, 0))
+
+        reply.delete()
+        self.assertEqual(self.counts(self.doctor.user), (0, 0))
+        self.assertEqual(reconcile_inbox_counters(), {})
+
+    def test_marking_read_twice_decrements_once(self):
+        message = DoctorMessage.objects.create(doctor=self.doctor, sender=self.doctor.user, subject='Hi', message='...')
+        stale = DoctorMessage.objects.get(pk=message.pk)
+
+        self.assertTrue(mark_message_read(message))
+        self.assertFalse(mark_message_read(stale))
+
+        self.assertEqual(self.counts(self.admins[0]), (0, 0))
+        self.assertEqual(reconcile_inbox_counters(), {})
+
+    def test_panel_reads_counts_with_one_lookup(self):
+        Feedback.objects.create(patient=self.patient, doctor=self.doctor, message='Thanks')
+        self.client.force_login(self.admins[0])
+
+        # session, user, doctors, inbox counts
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('manage_doctors'))
+
+        self.assertContains(response, '<span class="badge bg-danger">1</span>')
+
+    def test_reconcile_repairs_bulk_update_drift(self):
+        DoctorMessage.objects.create(doctor=self.doctor, sender=self.admins[0], subject='Hi', message='...')
+        DoctorMessage.objects.update(is_read=True)
+
+        self.assertEqual(reconcile_inbox_counters(), {'doc': ((1, 0), (0, 0))})
+        self.assertEqual(self.counts(self.doctor.user), (0, 0))
+
+
+class MessageThreadTests(TestCase):
+
+    def setUp(self):
+        self.admin = User.objects.create_user('boss', role='admin')
+        self.doctor = DoctorProfile.objects.create(
+            user=User.objects.create_user('doc', role='doctor')
+        )
+
+    def thread_of(self, message):
+        return MessageThread.objects.get(pk=message.thread_id)
+
+    def test_replies_keep_thread_summary(self):
+        first = start_thread(self.doctor, self.doctor.user, 'Leave', 'Off on Friday')
+        reply(first, self.admin, 'Re: Leave', 'Approved')
+        last = reply(first, self.doctor.user, 'Re: Re: Leave', 'Thanks')
+
+        thread = self.thread_of(first)
+        self.assertEqual(thread.subject, 'Leave')
+        self.assertEqual(thread.last_message_id, last.id)
+        self.assertEqual(thread.message_count, 3)
+        self.assertEqual((thread.admin_unread, thread.doctor_unread), (2, 1))
+
+        last.delete()
+        thread.refresh_from_db()
+        self.assertEqual((thread.message_count, thread.admin_unread), (2, 1))
+        self.assertEqual(reconcile_threads(), 0)
+
+    def test_opening_a_thread_reads_only_its_messages(self):
+        message = start_thread(self.doctor, self.doctor.user, 'Leave', 'Off on Friday')
+        reply(message, self.admin, 'Re: Leave', 'Approved')
+        self.client.force_login(self.admin)
+        url = reverse('admin_message_thread', args=[message.thread_id])
+
+        response = self.client.get(url)
+        self.assertContains(response, 'Off on Friday')
+        self.assertEqual(self.thread_of(message).admin_unread, 0)
+        self.assertEqual(unread_counts(self.admin)['unread_messages'], 0)
+        self.assertEqual(unread_counts(self.doctor.user)['unread_messages'], 1)
+
+        # session, user, thread, messages, inbox counts
+        with self.assertNumQueries(5):
+            self.client.get(url)
+
+    def test_doctor_cannot_open_another_doctors_thread(self):
+        other = DoctorProfile.objects.create(user=User.objects.create_user('other', role='doctor'))
+        message = start_thread(other, self.admin, 'Hello', '...')
+        self.client.force_login(self.doctor.user)
+
+        response = self.client.get(reverse('doctor_message_thread', args=[message.thread_id]))
+
+        self.assertEqual(response.status_code, 404)
+
+    def test_migration_groups_reply_chains(self):
+        group_reply_chains = import_module('users.migrations.0028_message_thread').group_reply_chains
+        legacy = [
+            DoctorMessage.objects.create(doctor=self.doctor, sender=self.doctor.user, subject='Leave', message='1'),
+            DoctorMessage.objects.create(doctor=self.doctor, sender=self.admin, subject='Re: Leave', message='2'),
+            # Doctors' replies used to be saved without a doctor
+            DoctorMessage.objects.create(doctor=None, sender=self.doctor.user, subject='RE: re: Leave', message='3'),
+            DoctorMessage.objects.create(doctor=self.doctor, sender=self.admin, subject='Leave', message='4'),
+        ]
+
+        group_reply_chains(django_apps, None)
+
+        threads = [DoctorMessage.objects.get(pk=msg.pk).thread for msg in legacy]
+        self.assertEqual(threads[0], threads[1])
+        self.assertEqual(threads[0], threads[2])
+        self.assertNotEqual(threads[0], threads[3])
+        self.assertEqual(threads[0].message_count, 3)
+        self.assertEqual(DoctorMessage.objects.filter(doctor__isnull=True).count(), 0)
+        self.assertEqual(reconcile_threads(), 0)
+
+    def test_migration_refuses_messages_it_cannot_thread(self):
+        group_reply_chains = import_module('users.migrations.0028_message_thread').group_reply_chains
+        original = DoctorMessage.objects.create(
+            doctor=self.doctor, sender=self.doctor.user, subject='Leave', message='1'
+        )
+        # Sender deleted: only the subject ties it to a doctor
+        matched = DoctorMessage.objects.create(doctor=None, sender=None, subject='Re: Leave', message='2')
+        orphan = DoctorMessage.objects.create(doctor=None, sender=self.admin, subject='Notice', message='3')
+
+        with self.assertRaisesMessage(RuntimeError, '1 doctor message(s) have no doctor and no doctor sender'):
+            group_reply_chains(django_apps, None)
+
+        orphan.delete()
+        group_reply_chains(django_apps, None)
+        self.assertEqual(
+            DoctorMessage.objects.get(pk=matched.pk).thread_id,
+            DoctorMessage.objects.get(pk=original.pk).thread_id
+        )
+
+
+class LiveEventTests(TestCase):
+
+    def setUp(self):
+        self.admin = User.objects.create_user('boss', role='admin')
+        self.doctor = DoctorProfile.objects.create(
+            user=User.objects.create_user('doc', role='doctor')
+        )
+        self.patient = PatientProfile.objects.create(
+            user=User.objects.create_user('pat', role='patient', first_name='Pia'),
+            date_of_birth=date(1990, 1, 1),
+            gender='other'
+        )
+
+    def book(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Appointment.objects.create(
+                doctor=self.doctor, patient=self.patient,
+                appointment_date=date.today(), appointment_time=time(10, 0)
+            )
+
+    def test_payloads_are_not_built_without_listeners(self):
+        built = []
+
+        with self.captureOnCommitCallbacks(execute=True):
+            events.publish_on_commit([events.ADMIN_CHANNEL], 'thread', lambda: built.append(1))
+
+        self.assertEqual(built, [])
+
+    def listen(self):
+        """
+        Pretend every channel has a page open; returns the published events.
+        """
+        published = []
+        events.broker.has_subscribers = lambda channel: True
+        events.broker.publish = lambda channel, event_type, data: published.append((channel, event_type, data))
+        self.addCleanup(vars(events.broker).pop, 'has_subscribers')
+        self.addCleanup(vars(events.broker).pop, 'publish')
+        return published
+
+    def test_each_side_sees_only_its_own_unread_counts(self):
+        first = start_thread(self.doctor, self.doctor.user, 'Leave', 'Off on Friday')
+        reply(first, self.doctor.user, 'Re: Leave', 'Also Monday')
+        published = self.listen()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            reply(first, self.admin, 'Re: Leave', 'Approved')
+
+        payloads = {channel: data for channel, _, data in published}
+        doctor_side = payloads[events.doctor_channel(self.doctor.id)]
+        admin_side = payloads[events.ADMIN_CHANNEL]
+        self.assertEqual((doctor_side['inbox'], doctor_side['doctor_unread']), (1, 1))
+        self.assertEqual((admin_side['inbox'], admin_side['admin_unread']), (2, 2))
+        self.assertNotIn('admin_unread', doctor_side)
+        self.assertNotIn('doctor_unread', admin_side)
+
+    def test_deletes_are_published(self):
+        first = start_thread(self.doctor, self.doctor.user, 'Leave', 'Off on Friday')
+        second = reply(first, self.doctor.user, 'Re: Leave', 'Also Monday')
+        published = self.listen()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertEqual(
+            {(channel, data['message_count'], data['inbox']) for channel, _, data in published},
+            {(events.doctor_channel(self.doctor.id), 1, 0), (events.ADMIN_CHANNEL, 1, 1)}
+        )
+
+        published.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            MessageThread.objects.filter(pk=first.thread_id).delete()
+        self.assertTrue(published)
+        for channel, event_type, data in published:
+            self.assertEqual((event_type, data['thread_id'], data['deleted']), ('thread', first.thread_id, True))
+        self.assertEqual({data['inbox'] for channel, _, data in published if channel == events.ADMIN_CHANNEL}, {0})
+
+    def test_wsgi_requests_are_told_not_to_reconnect(self):
+        self.client.force_login(self.doctor.user)
+
+        self.assertEqual(self.client.get(reverse('doctor_events')).status_code, 204)
+
+    async def test_stream_delivers_committed_appointments(self):
+        await self.async_client.aforce_login(await User.objects.aget(username='doc'))
+        response = await self.async_client.get(reverse('doctor_events'))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+
+        stream = aiter(response.streaming_content)
+        # The first chunk subscribes the stream
+        self.assertEqual(await anext(stream), f"retry: {events.RETRY_MS}\n\n".encode())
+        await sync_to_async(self.book)()
+
+        event = (await asyncio.wait_for(anext(stream), 1)).decode()
+        self.assertIn('event: appointment\n', event)
+        payload = json.loads(event.split('data: ', 1)[1])
+        self.assertEqual((payload['time'], payload['patient']), ('10:00', 'Pia'))
+        await stream.aclose()
+
+    async def test_stream_is_per_doctor(self):
+        other = await sync_to_async(DoctorProfile.objects.create)(
+            user=await sync_to_async(User.objects.create_user)('other', role='doctor')
+        )
+        await self.async_client.aforce_login(await User.objects.aget(username='other'))
+        response = await self.async_client.get(reverse('doctor_events'))
+        stream = aiter(response.streaming_content)
+        await anext(stream)
+
+        await sync_to_async(self.book)()
+
+        self.assertFalse(events.broker.has_subscribers(events.doctor_channel(self.doctor.id)))
+        with self.assertRaises(asyncio.TimeoutError):
+            await asyncio.wait_for(anext(stream), 0.2)
+        await stream.aclose()
+        self.assertFalse(events.broker.has_subscribers(events.doctor_channel(other.id)))
+
+
+class AppointmentExportTests(TestCase):
+
+    def setUp(self):
+        self.admin = User.objects.create_user('boss', role='admin')
+        self.doctor = DoctorProfile.objects.create(
+            user=User.objects.create_user('doc', role='doctor', first_name='Ada', last_name='Lee')
+        )
+        self.patients = [
+            PatientProfile.objects.create(
+                user=User.objects.create_user(f'pat{i}', role='patient', first_name=f'Pat{i}'),
+                date_of_birth=date(1990, 1, 1),
+                gender='other'
+            )
+            for i in range(2)
+        ]
+        self.day = date(2030, 1, 7)
+        for i, status in enumerate(['pending', 'completed', 'cancelled']):
+            Appointment.objects.create(
+                doctor=self.doctor, patient=self.patients[i % 2],
+                appointment_date=self.day + timedelta(days=i), appointment_time=time(9, 0),
+                status=status, reason='Check, "quoted"'
+            )
+        self.client.force_login(self.admin)
+
+    def export(self, **params):
+        return self.client.get(reverse('admin_export_appointments'), params)
+
+    def test_csv_streams_filtered_rows(self):
+        response = self.export(patient=self.patients[0].id, status=['pending', 'cancelled'])
+
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        rows = list(csv.DictReader(b''.join(response.streaming_content).decode().splitlines()))
+        self.assertEqual([row['date'] for row in rows], ['2030-01-07', '2030-01-09'])
+        self.assertEqual(rows[0]['doctor_last_name'], 'Lee')
+        self.assertEqual(rows[0]['reason'], 'Check, "quoted"')
+
+    def test_csv_cells_cannot_start_a_formula(self):
+        Appointment.objects.filter(appointment_date=self.day).update(reason='=HYPERLINK("x")')
+        self.patients[0].user.last_name = '@SUM(A1)'
+        self.patients[0].user.save()
+
+        response = self.export(patient=self.patients[0].id)
+        rows = list(csv.DictReader(b''.join(response.streaming_content).decode().splitlines()))
+        self.assertEqual(rows[0]['reason'], '\'=HYPERLINK("x")')
+        self.assertEqual(rows[0]['patient_last_name'], "'@SUM(A1)")
+        self.assertEqual(rows[1]['reason'], 'Check, "quoted"')
+
+        self.assertEqual(appointment_export.csv_cell('\tcmd'), "'\tcmd")
+        self.assertEqual(appointment_export.csv_cell(-5), -5)
+
+    def test_gzipped_ndjson_with_date_range(self):
+        response = self.export(format='ndjson', gzip='1', **{'from': '2030-01-08', 'to': '2030-01-31'})
+
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertIn('.ndjson.gz"', response['Content-Disposition'])
+        lines = gzip.decompress(b''.join(response.streaming_content)).decode().splitlines()
+        records = [json.loads(line) for line in lines]
+        self.assertEqual([record['status'] for record in records], ['completed', 'cancelled'])
+        self.assertEqual(records[0]['time'], '09:00:00')
+
+    def test_output_is_flushed_in_pieces(self):
+        original = appointment_export.FLUSH_SIZE
+        appointment_export.FLUSH_SIZE = 1
+        try:
+            chunks = list(self.export().streaming_content)
+        finally:
+            appointment_export.FLUSH_SIZE = original
+        # One piece per row, the header goes out with the first
+        self.assertEqual(len(chunks), 3)
+
+    def test_rejects_bad_parameters_and_non_admins(self):
+        self.assertEqual(self.export(format='xml').status_code, 400)
+        self.assertEqual(self.export(status='lost').status_code, 400)
+        self.assertEqual(self.export(**{'from': '2030-02-01', 'to': '2030-01-01'}).status_code, 400)
+
+        self.client.force_login(self.doctor.user)
+        self.assertEqual(self.export().status_code, 403)
+
+
+class DoctorSearchTests(TestCase):
+
+    def make_doctor(self, username, first_name, last_name, **fields):
+        user = User.objects.create_user(
+            username, role='doctor', first_name=first_name, last_name=last_name
+        )
+        return DoctorProfile.objects.create(user=user, is_approved=True, **fields)
+
+    def setUp(self):
+        self.cardio = self.make_doctor(
+            'card', 'Carla', 'Mendes', specialization='cardiologist', qualification='MD'
+        )
+        self.dentist = self.make_doctor(
+            'dent', 'Ravi', 'Shah', specialization='dentist', bio='Cares for anxious patients'
+        )
+
+    def ids(self, text):
+        return [doctor['id'] for doctor in search_doctors(text)]
+
+    def test_words_match_as_prefixes(self):
+        self.assertEqual(self.ids('card'), [self.cardio.id])
+        self.assertEqual(self.ids('rav sh'), [self.dentist.id])
+        self.assertEqual(self.ids('dent ravi'), [self.dentist.id])
+        self.assertEqual(self.ids('carla dentist'), [])
+
+    def test_name_matches_rank_first(self):
+        # "car" is the start of Carla and cardiologist, and in Ravi's bio
+        self.assertEqual(self.ids('car'), [self.cardio.id, self.dentist.id])
+
+    def test_index_follows_profile_and_user_changes(self):
+        self.dentist.user.first_name = 'Ravindra'
+        self.dentist.user.save()
+        self.assertEqual(self.ids('ravindra'), [self.dentist.id])
+
+        self.cardio.is_available = False
+        self.cardio.save()
+        self.assertEqual(self.ids('carla'), [])
+
+        self.dentist.user.delete()
+        self.assertEqual(self.ids('ravindra'), [])
+
+    def test_query_syntax_is_not_interpreted(self):
+        for text in ('"', 'card OR NOT', 'name:card', '*', 'NEAR(', '   '):
+            with self.subTest(text=text):
+                search_doctors(text)
+        self.assertEqual(self.ids('name:card'), [])
+
+    def test_name_match_is_found_among_many_bio_matches(self):
+        # More bio matches than one tier ranks, all indexed before the name
+        original = search.MAX_CANDIDATES
+        search.MAX_CANDIDATES = 5
+        try:
+            users = User.objects.bulk_create(
+                User(username=f'filler{i}', role='doctor', first_name='Filler')
+                for i in range(30)
+            )
+            DoctorProfile.objects.bulk_create(
+                DoctorProfile(user=user, is_approved=True, bio='Zeal and care') for user in users
+            )
+            zed = self.make_doctor('zed', 'Zed', 'Wong')
+            rebuild_search_index()
+
+            self.assertEqual(self.ids('ze')[0], zed.id)
+            self.assertEqual(len(self.ids('ze')), 6)
+        finally:
+            search.MAX_CANDIDATES = original
+
+    def test_rebuild_matches_signal_maintained_index(self):
+        before = self.ids('c')
+        self.assertEqual(rebuild_search_index(), 2)
+        self.assertEqual(self.ids('c'), before)
+
+
+# -------------------------------------------------
+# Query budgets
+# -------------------------------------------------
+
+# URL prefix and default role of every app urlconf under test
+BUDGETED_URLCONFS = {
+    'public_pages.urls': ('/', None),
+    'users.urls': ('/accounts/', 'admin'),
+    'doctors.urls': ('/doctors/', 'doctor'),
+    'patients.urls': ('/patients/', 'patient'),
+}
+
+# Upper bound on queries per URL name at the seeded volume, session, user and
+# (in the admin and doctor panels) inbox counter lookups included. Every
+# named URL of the urlconfs above needs an entry.
+QUERY_BUDGETS = {
+    # public_pages
+    'home': 0,
+    'about': 0,
+    'contact': 0,
+    'services': 0,
+    'doctors': 1,
+    # users (admin)
+    'login': 2,
+    'admin_dashboard': 5,
+    'admin_edit_doctor': 4,
+    'pending_doctors': 4,
+    'admin_doctor_messages': 5,
+    'admin_message_thread': 6,
+    'admin_events': 2,
+    'manage_patients': 4,
+    'admin_manage_patients': 4,
+    'admin_patient_appointments': 5,
+    'admin_export_appointments': 2,
+    'manage_doctors': 4,
+    'toggle_doctor_availability': 7,
+    'mark_message_read': 8,
+    'patient_messages': 4,
+    'mark_patient_message_read': 5,
+    'reply_doctor_message': 6,
+    'compose_doctor_message': 4,
+    'logout': 4,
+    # doctors
+    'doctor_dashboard': 6,
+    'doctor_appointments': 5,
+    'doctor_past_appointments': 4,
+    'view_medical_history': 8,
+    'add_medical_history': 7,
+    'appointment_history': 8,
+    'doctor_profile': 5,
+    'doctor_availability': 6,
+    'delete_time_slot': 4,
+    'bulk_delete_time_slots': 2,
+    'doctor_messages': 6,
+    'doctor_message_thread': 6,
+    'doctor_events': 3,
+    'doctor_reply_admin': 5,
+    'contact_admin': 4,
+    'doctor_register': 3,
+    'mark_appointment_completed': 8,
+    'edit_doctor_profile': 4,
+    # patients
+    'register': 2,
+    'patient_dashboard': 6,
+    'book_appointments': 10,
+    'view_appointments': 4,
+    'cancel_appointment': 6,
+    'get_available_slots': 8,
+    'hold_appointment_slot': 2,
+    'get_available_slots_range': 6,
+    'get_first_available_slots': 4,
+    'get_booking_bootstrap': 7,
+    'get_doctors_by_specialization': 3,
+    'search_doctors': 5,
+    'patient_profile': 4,
+    'edit_patient_profile': 5,
+    'patient_medical_history': 4,
+    'patient_medical_history_pdf': 7,
+    'submit_feedback': 4,
+    'patient_logout': 4,
+}
+
+
+class QueryBudgetMixin:
+    """
+    Seed a realistic volume of doctors, patients, appointments and messages
+    and assert that a view stays within its query budget, so a per-row
+    relation access (N+1) in a view or template fails loudly.
+    """
+    DOCTORS = 12
+    PATIENTS = 40
+    APPOINTMENTS_PER_PATIENT = 6
+    MESSAGES = 30
+
+    @classmethod
+    def seed_volume(cls):
+        today = date.today()
+        specializations = [value for value, _ in DoctorProfile.SPECIALIZATION_CHOICES]
+
+        cls.admin = User.objects.create_user('budget-admin', role='admin')
+        cls.doctors = [
+            DoctorProfile.objects.create(
+                user=User.objects.create_user(
+                    f'budget-doctor{i}', role='doctor', first_name=f'Doc{i}', last_name='Budget'
+                ),
+                specialization=specializations[i % len(specializations)],
+                is_approved=i % 5 != 4,
+                is_available=i % 4 != 3
+            )
+            for i in range(cls.DOCTORS)
+        ]
+        cls.patients = [
+            PatientProfile.objects.create(
+                user=User.objects.create_user(
+                    f'budget-patient{i}', role='patient', first_name=f'Pat{i}', last_name='Budget'
+                ),
+                date_of_birth=date(1990, 1, 1),
+                gender='other'
+            )
+            for i in range(cls.PATIENTS)
+        ]
+
+        TimeSlot.objects.bulk_create(
+            TimeSlot(doctor=doctor, day_of_week=day, start_time=time(9, 0), end_time=time(17, 0))
+            for doctor in cls.doctors
+            for day in ('mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun')
+        )
+
+        # Spread over past, today and future, mostly with the first doctor
+        appointments = []
+        for p, patient in enumerate(cls.patients):
+            for a in range(cls.APPOINTMENTS_PER_PATIENT):
+                appointments.append(Appointment(
+                    doctor=cls.doctors[0] if a % 2 == 0 else cls.doctors[a % cls.DOCTORS],
+                    patient=patient,
+                    appointment_date=today + timedelta(days=a * 3 - 6),
+                    appointment_time=time(8 + p * 10 // 60, p * 10 % 60),
+                    status=('pending', 'confirmed', 'completed', 'cancelled')[(p + a) % 4]
+                ))
+        Appointment.objects.bulk_create(appointments)
+
+        # One conversation per doctor, counters rebuilt once at the end
+        threads = MessageThread.objects.bulk_create(
+            MessageThread(doctor=doctor, subject=f'Thread {doctor.id}') for doctor in cls.doctors
+        )
+        DoctorMessage.objects.bulk_create(
+            DoctorMessage(
+                thread=threads[i % cls.DOCTORS],
+                doctor=cls.doctors[i % cls.DOCTORS],
+                sender=cls.doctors[i % cls.DOCTORS].user if i % 2 else cls.admin,
+                subject=f'Subject {i}',
+                message='Body',
+                is_read=i % 3 == 0
+            )
+            for i in range(cls.MESSAGES)
+        )
+        reconcile_threads()
+        Feedback.objects.bulk_create(
+            Feedback(
+                patient=cls.patients[i % cls.PATIENTS],
+                doctor=cls.doctors[i % cls.DOCTORS],
+                message='Thanks',
+                is_read=i % 3 == 0
+            )
+            for i in range(cls.MESSAGES)
+        )
+        for patient in cls.patients[:10]:
+            MedicalHistory.objects.create(patient=patient, last_updated_by=cls.doctors[0])
+
+        reconcile_counters()
+        reconcile_inbox_counters()
+
+    def user_for(self, role):
+        return {
+            'admin': self.admin,
+            'doctor': self.doctors[0].user,
+            'patient': self.patients[0].user,
+        }.get(role)
+
+    def assertQueryBudget(self, path, budget, role=None, params=None):
+        self.client.logout()
+        user = self.user_for(role)
+        if user is not None:
+            self.client.force_login(user)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(path, params or {})
+
+        self.assertNotEqual(response.status_code, 404, f"{path} was not found")
+        if len(queries) > budget:
+            self.fail(
+                f"{path} ran {len(queries)} queries, budget is {budget}:\n"
+                + "\n".join(query['sql'] for query in queries)
+            )
+
+
+class QueryBudgetTests(QueryBudgetMixin, TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # The PDF download stores its render
+        pdf_dir = cls.enterClassContext(tempfile.TemporaryDirectory())
+        cls.enterClassContext(override_settings(MEDICAL_PDF_CACHE_DIR=pdf_dir))
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seed_volume()
+
+    def setUp(self):
+        cache.clear()
+
+    def url_kwargs(self):
+        doctor_appointment = Appointment.objects.filter(doctor=self.doctors[0]).first()
+        return {
+            'patient_id': doctor_appointment.patient_id,
+            'appointment_id': doctor_appointment.id,
+            'doctor_id': self.doctors[1].id,
+            'slot_id': TimeSlot.objects.filter(doctor=self.doctors[0]).first().id,
+            'message_id': DoctorMessage.objects.filter(doctor=self.doctors[0]).first().id,
+            'thread_id': MessageThread.objects.get(doctor=self.doctors[0]).id,
+        }
+
+    def url_params(self):
+        doctor = self.doctors[0]
+        tomorrow = date.today() + timedelta(days=1)
+        return {
+            'get_available_slots': {'doctor_id': doctor.id, 'date': tomorrow.isoformat()},
+            'get_available_slots_range': {
+                'doctor_id': doctor.id,
+                'from': tomorrow.isoformat(),
+                'to': (tomorrow + timedelta(days=30)).isoformat(),
+            },
+            'get_first_available_slots': {'specialization': doctor.specialization},
+            'get_booking_bootstrap': {'specialization': doctor.specialization},
+            'get_doctors_by_specialization': {'specialization': doctor.specialization},
+            'search_doctors': {'q': 'doc bud'},
+        }
+
+    def budgeted_urls(self):
+        for urlconf, (prefix, role) in BUDGETED_URLCONFS.items():
+            for pattern in import_module(urlconf).urlpatterns:
+                yield pattern.name, prefix + str(pattern.pattern), role
+
+    def test_every_view_stays_within_budget(self):
+        kwargs = self.url_kwargs()
+        params = self.url_params()
+        for name, route, role in self.budgeted_urls():
+            path = re.sub(r'<int:(\w+)>', lambda match: str(kwargs[match.group(1)]), route)
+            with self.subTest(name=name, path=path):
+                self.assertIn(name, QUERY_BUDGETS, f"{name} has no query budget")
+                # Views that write on GET must not leak into the next view
+                with transaction.atomic():
+                    self.assertQueryBudget(path, QUERY_BUDGETS[name], role, params.get(name))
+                    transaction.set_rollback(True)
@@ -12,10 +12,13 @@ urlpatterns = [
         
     path('pending-doctors/', views.pending_doctors, name='pending_doctors'),
     path('messages/', views.admin_doctor_messages, name='admin_doctor_messages'),
+    path('messages/<int:thread_id>/', views.admin_message_thread, name='admin_message_thread'),
+    path('events/', views.admin_events, name='admin_events'),
 
     path('manage_patients/',views.manage_patients,name="manage_patients"),
     path('patients/', views.manage_patients, name='admin_manage_patients'),
     path('patients/<int:patient_id>/appointments/',views.patient_appointments,name='admin_patient_appointments'),
+    path('appointments/export/', views.export_appointments, name='admin_export_appointments'),
 
     
     path('doctors/', views.manage_doctors, name='manage_doctors'),
@@ -1,11 +1,16 @@
 from django.shortcuts import render,redirect, get_object_or_404
-from django.http import HttpResponse
+from django.http import HttpResponse, HttpResponseBadRequest, HttpResponseForbidden, StreamingHttpResponse
 from django.contrib.auth.decorators import login_required,user_passes_test
 from django.shortcuts import render, redirect
 from django.contrib.auth import authenticate, login, logout
 from django.contrib import messages 
+from django.core.exceptions import ValidationError
+from django.utils import timezone
 from .decorator import admin_required
-from users.models import DoctorProfile, DoctorMessage, PatientProfile,Appointment, Feedback
+from users.models import DoctorProfile, DoctorMessage, PatientProfile,Appointment, Feedback, MessageThread
+from users import appointment_export, events, inbox_counters, message_threads
+from users.dashboard_counters import read_counters
+from users.pagination import APPOINTMENT_ORDERING, CREATED_ORDERING, THREAD_ORDERING, paginate_keyset
 
 
 
@@ -53,7 +58,7 @@ def user_login(request):
 @login_required
 @user_passes_test(admin_required)
 def pending_doctors(request):
-    pending = DoctorProfile.objects.filter(is_approved=False)
+    pending = DoctorProfile.objects.filter(is_approved=False).select_related('user')
 
     if request.method == 'POST':
         action = request.POST.get('action')
@@ -77,24 +82,21 @@ def pending_doctors(request):
 @login_required
 @user_passes_test(admin_required)
 def admin_dashboard(request):
-    total_doctors = DoctorProfile.objects.count()
-    available_doctors = DoctorProfile.objects.filter(is_available=True).count()
-    total_patients = PatientProfile.objects.count()
-    total_appointments = Appointment.objects.count()
-    unread_messages = DoctorMessage.objects.filter(is_read=False).count()
-    doctors_list = DoctorProfile.objects.all()
+    # Signal-maintained totals, one query (see users/dashboard_counters.py)
+    counters = read_counters()
 
-    # Pending doctors
-    pending_doctors_count = DoctorProfile.objects.filter(is_approved=False).count()
+    # Doctors on leave
+    unavailable_doctors = DoctorProfile.objects.filter(
+        is_available=False
+    ).select_related('user')
 
     context = {
-        'total_doctors': total_doctors,
-        'available_doctors': available_doctors,
-        'total_patients': total_patients,
-        'total_appointments': total_appointments,
-        'unread_messages': unread_messages,
-        'doctors_list': doctors_list,
-        'pending_doctors_count': pending_doctors_count,
+        'total_doctors': counters['doctors'],
+        'available_doctors': counters['available_doctors'],
+        'total_patients': counters['patients'],
+        'total_appointments': counters['appointments'],
+        'unavailable_doctors': unavailable_doctors,
+        'pending_doctors_count': counters['pending_doctors'],
     }
     return render(request, 'accounts/admin_dashboard.html', context)
 
@@ -117,7 +119,7 @@ def admin_edit_doctor(request, doctor_id):
         doctor.save()
 
         messages.success(request, "Doctor details updated successfully")
-        return redirect('admin_manage_doctors')
+        return redirect('manage_doctors')
 
     return render(request, 'accounts/edit_doctor.html', {
         'doctor': doctor,
@@ -127,7 +129,11 @@ def admin_edit_doctor(request, doctor_id):
 
 @login_required
 def manage_patients(request):
-    patients = PatientProfile.objects.select_related('user')
+    patients = paginate_keyset(
+        PatientProfile.objects.select_related('user'),
+        CREATED_ORDERING,
+        request.GET
+    )
     return render(
         request,
         'accounts/manage_patients.html',
@@ -141,11 +147,12 @@ def patient_appointments(request, patient_id):
         id=patient_id
     )
 
-    appointments = (
+    appointments = paginate_keyset(
         Appointment.objects
         .filter(patient=patient)
-        .select_related('doctor', 'doctor__user')
-        .order_by('-appointment_date', '-appointment_time')
+        .select_related('doctor', 'doctor__user'),
+        APPOINTMENT_ORDERING,
+        request.GET
     )
 
     return render(
@@ -159,6 +166,37 @@ def patient_appointments(request, patient_id):
 
 
 
+@login_required
+def export_appointments(request):
+    """
+    Stream appointments as CSV or NDJSON (?format=csv|ndjson, ?gzip=1),
+    filtered by ?doctor, ?patient, ?from, ?to and ?status
+    (see users/appointment_export.py).
+    """
+    if request.user.role != 'admin':
+        return HttpResponseForbidden()
+
+    fmt = request.GET.get('format', 'csv')
+    if fmt not in appointment_export.FORMATS:
+        return HttpResponseBadRequest("format must be csv or ndjson.")
+    try:
+        appointments = appointment_export.filtered_appointments(request.GET)
+    except ValidationError as e:
+        return HttpResponseBadRequest(' '.join(e.messages))
+
+    gzip = request.GET.get('gzip') == '1'
+    filename = f"appointments-{timezone.localdate():%Y%m%d}.{fmt}"
+    if gzip:
+        filename += '.gz'
+    response = StreamingHttpResponse(
+        appointment_export.export_chunks(appointments, fmt, gzip),
+        content_type='application/gzip' if gzip else appointment_export.FORMATS[fmt]
+    )
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+
 @login_required
 def user_logout(request):
     logout(request)
@@ -171,38 +209,62 @@ def admin_doctor_messages(request):
         messages.error(request, "You do not have permission to view this page.")
         return redirect('index')
 
-    # Inbox: messages sent by doctors to admin
-    inbox_messages = DoctorMessage.objects.filter(
-        sender__isnull=False  # Must have a sender (doctor)
-    ).order_by('-created_at')
-
-    # Sent: messages sent by admin to doctors
-    sent_messages = DoctorMessage.objects.filter(
-        sender=request.user
-    ).order_by('-created_at')
+    # Conversations with doctors, most recent activity first
+    threads = paginate_keyset(
+        MessageThread.objects.select_related('doctor__user', 'last_message__sender'),
+        THREAD_ORDERING,
+        request.GET
+    )
 
     context = {
-        'inbox_messages': inbox_messages,
-        'sent_messages': sent_messages,
+        'threads': threads,
     }
     return render(request, 'accounts/doctor_messages.html', context)
 
 
+@login_required
+def admin_message_thread(request, thread_id):
+    if request.user.role != 'admin':
+        messages.error(request, "You do not have permission to view this page.")
+        return redirect('index')
+
+    thread = get_object_or_404(MessageThread.objects.select_related('doctor__user'), id=thread_id)
+    inbox_counters.mark_thread_read(thread, request.user)
+
+    context = {
+        'thread': thread,
+        'thread_messages': message_threads.thread_messages(thread),
+        'form': DoctorReplyForm(initial={'subject': f"Re: {thread.subject}"}),
+    }
+    return render(request, 'accounts/message_thread.html', context)
+
+
+@login_required
+async def admin_events(request):
+    """
+    Server-Sent Events stream of new and changed doctor conversations
+    (see users/events.py).
+    """
+    user = await request.auser()
+    if user.role != 'admin':
+        return HttpResponseForbidden()
+    return events.event_stream_response(request, events.ADMIN_CHANNEL)
+
+
 @login_required
 def mark_message_read(request, message_id):
     if request.user.role != 'admin':
         messages.error(request, "You do not have permission.")
         return redirect('index')
 
-    msg = get_object_or_404(DoctorMessage, id=message_id)
-    msg.is_read = True
-    msg.save()
+    msg = get_object_or_404(DoctorMessage.objects.select_related('sender'), id=message_id)
+    inbox_counters.mark_message_read(msg)
 
     return redirect('admin_doctor_messages')
 
 
 def manage_doctors(request):
-    doctors = DoctorProfile.objects.all()
+    doctors = DoctorProfile.objects.select_related('user')
     return render(request, 'accounts/manage_doctors.html', {'doctors': doctors})
 
 
@@ -220,7 +282,11 @@ def patient_messages(request):
     """
     Admin view to display messages sent by patients.
     """
-    messages_list = Feedback.objects.select_related('patient__user', 'doctor__user').order_by('-created_at')
+    messages_list = paginate_keyset(
+        Feedback.objects.select_related('patient__user', 'doctor__user'),
+        CREATED_ORDERING,
+        request.GET
+    )
     context = {
         'messages_list': messages_list
     }
@@ -232,9 +298,8 @@ def mark_patient_message_read(request, message_id):
     """
     Mark a patient message as read
     """
-    msg = get_object_or_404(Feedback, id=message_id)
-    msg.is_read = True
-    msg.save()
+    msg = get_object_or_404(Feedback.objects.select_related('patient__user'), id=message_id)
+    inbox_counters.mark_feedback_read(msg)
     messages.success(request, f"Message from {msg.patient.user.get_full_name} marked as read.")
     return redirect('patient_messages')
 
@@ -251,21 +316,22 @@ def reply_doctor_message(request, message_id):
         return redirect('index')
 
     # Get the original doctor message
-    doctor_msg = get_object_or_404(DoctorMessage, id=message_id)
+    doctor_msg = get_object_or_404(
+        DoctorMessage.objects.select_related('doctor__user', 'thread'), id=message_id
+    )
 
     if request.method == 'POST':
         form = DoctorReplyForm(request.POST)
         if form.is_valid():
-            # Create a new message back to doctor
-            DoctorMessage.objects.create(
-                doctor=doctor_msg.doctor,          # recipient doctor
-                sender=request.user,                # admin is sending
-                subject=form.cleaned_data['subject'],
-                message=form.cleaned_data['message'],
-                is_read=False                       # doctor hasn't read the reply yet
+            # Reply back to the doctor in the same thread
+            reply = message_threads.reply(
+                doctor_msg,
+                request.user,                       # admin is sending
+                form.cleaned_data['subject'],
+                form.cleaned_data['message']
             )
             messages.success(request, "Reply sent successfully!")
-            return redirect('admin_doctor_messages')
+            return redirect('admin_message_thread', thread_id=reply.thread_id)
     else:
         # Prefill subject with "Re: original subject"
         form = DoctorReplyForm(initial={'subject': f"Re: {doctor_msg.subject}"})
@@ -289,8 +355,8 @@ def compose_doctor_message(request):
         form = DoctorMessageForm(request.POST)
         if form.is_valid():
             msg = form.save(commit=False)
-            msg.sender = request.user  # admin is sending
-            msg.save()
+            # Admin is sending; each new message starts its own thread
+            message_threads.start_thread(msg.doctor, request.user, msg.subject, msg.message)
             messages.success(request, "Message sent successfully!")
             return redirect('admin_doctor_messages')
     else: